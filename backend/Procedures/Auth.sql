@@ -165,4 +165,19 @@ BEGIN
     FROM dbo.Users
     WHERE Email = @Email;
 END
-GO
\ No newline at end of file
+GO
+-- Replace a user's password hash (rehash on login after Argon2 params change)
+CREATE OR ALTER PROCEDURE dbo.usp_User_UpdatePasswordHash
+    @UserId       INT,
+    @PasswordHash NVARCHAR(255)
+AS
+BEGIN
+    SET NOCOUNT ON;
+
+    UPDATE dbo.Users
+       SET PasswordHash = @PasswordHash
+     WHERE UserId = @UserId;
+
+    SELECT @@ROWCOUNT AS Updated;
+END
+GO
@@ -0,0 +1,75 @@
+/* ============================================================
+   CATALOG: change tracking for the API-side product catalog
+   ------------------------------------------------------------
+   The API keeps a compact snapshot of barcode / SKU / serial ->
+   ProductId and refreshes it incrementally using rowversions.
+   ============================================================ */
+
+
+---------------------------------------------------------------
+-- (A) Rowversion columns + missing lookup index (idempotent)
+---------------------------------------------------------------
+IF COL_LENGTH('dbo.Products','RowVer') IS NULL
+    ALTER TABLE dbo.Products ADD RowVer ROWVERSION;
+
+IF COL_LENGTH('dbo.ProductSerials','RowVer') IS NULL
+    ALTER TABLE dbo.ProductSerials ADD RowVer ROWVERSION;
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_Products_RowVer' AND object_id = OBJECT_ID('dbo.Products'))
+    CREATE INDEX IX_Products_RowVer ON dbo.Products(RowVer);
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_ProductSerials_RowVer' AND object_id = OBJECT_ID('dbo.ProductSerials'))
+    CREATE INDEX IX_ProductSerials_RowVer ON dbo.ProductSerials(RowVer);
+
+-- Barcode lookups were a scan; still used by the legacy (unresolved) scan paths
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_Products_Barcode' AND object_id = OBJECT_ID('dbo.Products'))
+    CREATE INDEX IX_Products_Barcode ON dbo.Products(Barcode) WHERE Barcode IS NOT NULL;
+GO
+
+
+/* ============================================================
+   (B) Changes since a watermark
+   - @SinceVersion NULL  -> full snapshot
+   - Returns 3 sets: [Watermark], [products], [serials]
+   - Pass the returned Watermark back as @SinceVersion next time
+   ============================================================ */
+CREATE OR ALTER PROCEDURE dbo.usp_Catalog_Changes
+    @SinceVersion BINARY(8) = NULL
+AS
+BEGIN
+    SET NOCOUNT ON;
+
+    -- Upper bound excludes rows from still-open transactions, so nothing is skipped
+    DECLARE @Upper BINARY(8) = MIN_ACTIVE_ROWVERSION();
+    DECLARE @Lower BINARY(8) = ISNULL(@SinceVersion, 0x0000000000000000);
+
+    SELECT @Upper AS Watermark;
+
+    SELECT ProductId, Sku, Name, Barcode
+    FROM dbo.Products
+    WHERE RowVer >= @Lower
+      AND RowVer <  @Upper;
+
+    -- IsAvailable = 0 rows tell the API to forget a consumed serial
+    SELECT SerialNumber, ProductId, IsAvailable
+    FROM dbo.ProductSerials
+    WHERE RowVer >= @Lower
+      AND RowVer <  @Upper;
+END;
+GO
+
+
+/* ============================================================
+   (C) Diagnostics
+   ============================================================ */
+SELECT 
+    p.name AS ProcedureName,
+    SCHEMA_NAME(p.schema_id) AS SchemaName,
+    p.create_date AS CreatedOn,
+    p.modify_date AS LastModified,
+    p.type_desc AS ObjectType
+FROM sys.procedures AS p
+WHERE p.name LIKE 'usp_Catalog_%'
+ORDER BY p.name;
+GO
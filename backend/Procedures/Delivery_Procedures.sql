@@ -16,6 +16,22 @@ IF COL_LENGTH('dbo.DeliveryPackages','Destination') IS NULL
 
 IF COL_LENGTH('dbo.DeliveryPackages','DeliveredAt') IS NULL
     ALTER TABLE dbo.DeliveryPackages ADD DeliveredAt DATETIME2(0) NULL;
+
+-- Reversed package number so "ends with" searches can seek an index too
+IF COL_LENGTH('dbo.DeliveryPackages','PackageNumberRev') IS NULL
+    ALTER TABLE dbo.DeliveryPackages ADD PackageNumberRev AS REVERSE(PackageNumber) PERSISTED;
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_DeliveryPackages_PackageRev'
+               AND object_id = OBJECT_ID('dbo.DeliveryPackages'))
+    CREATE INDEX IX_DeliveryPackages_PackageRev ON dbo.DeliveryPackages(PackageNumberRev);
+
+-- Keyset paging within a status chip: seek (Status, Id < @AfterId), newest first
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_DeliveryPackages_Status_Id'
+               AND object_id = OBJECT_ID('dbo.DeliveryPackages'))
+    CREATE INDEX IX_DeliveryPackages_Status_Id
+        ON dbo.DeliveryPackages(Status, DeliveryPackageId DESC)
+        INCLUDE (PackageNumber, DeliveryId, Destination);
 GO
 
 
@@ -23,36 +39,12 @@ GO
    (B) Listing & lookups
    ============================================================ */
 
--- List packages with optional filtering, plus quick counts
-CREATE OR ALTER PROCEDURE dbo.usp_Delivery_ListPackages
-    @Search NVARCHAR(50) = NULL,          -- filter by PackageNumber (contains)
-    @Status NVARCHAR(20) = NULL,          -- 'To Load' | 'Loaded' | 'Delivered'
-    @Top    INT = 100                     -- cap result set size
+-- Dashboard counters on their own (API cache reconciliation)
+CREATE OR ALTER PROCEDURE dbo.usp_Delivery_Counts
 AS
 BEGIN
     SET NOCOUNT ON;
 
-    ;WITH base AS
-    (
-        SELECT 
-            dp.DeliveryPackageId,
-            dp.PackageNumber,
-            dp.Status,
-            dp.DeliveryId,
-            dp.Destination,
-            d.Driver,
-            d.CreatedAt
-        FROM dbo.DeliveryPackages AS dp
-        LEFT JOIN dbo.Delivery AS d
-               ON d.DeliveryId = dp.DeliveryId
-        WHERE (@Status IS NULL OR dp.Status = @Status)
-          AND (@Search IS NULL OR dp.PackageNumber LIKE '%' + @Search + '%')
-    )
-    SELECT TOP (@Top) *
-    FROM base
-    ORDER BY DeliveryPackageId DESC;
-
-    -- Quick totals/rollup for dashboard counters
     SELECT
         COUNT(*)                                               AS Total,
         SUM(CASE WHEN Status = 'To Load'  THEN 1 ELSE 0 END)  AS ToLoad,
@@ -63,6 +55,94 @@ END;
 GO
 
 
+-- List packages with optional filtering, plus quick counts
+-- Keyset paging: pass the last DeliveryPackageId seen as @AfterId.
+-- @Match: 'prefix' and 'suffix' seek an index; 'contains' is the old scan.
+CREATE OR ALTER PROCEDURE dbo.usp_Delivery_ListPackages
+    @Search  NVARCHAR(50) = NULL,          -- filter by PackageNumber
+    @Status  NVARCHAR(20) = NULL,          -- 'To Load' | 'Loaded' | 'Delivered'
+    @Top     INT = 100,                    -- page size
+    @AfterId INT = NULL,                   -- keyset cursor (exclusive)
+    @Match   NVARCHAR(10) = N'contains',   -- 'prefix' | 'suffix' | 'contains'
+    @WithCounts BIT = 1                    -- 0: API serves counters from its cache
+AS
+BEGIN
+    SET NOCOUNT ON;
+
+    -- Treat the search text literally inside LIKE
+    DECLARE @Pat NVARCHAR(200) =
+        REPLACE(REPLACE(REPLACE(REPLACE(
+            CASE WHEN @Match = N'suffix' THEN REVERSE(@Search) ELSE @Search END,
+        N'\', N'\\'), N'%', N'\%'), N'_', N'\_'), N'[', N'\[');
+
+    DECLARE @Page TABLE
+    (
+        DeliveryPackageId INT PRIMARY KEY,
+        PackageNumber     NVARCHAR(50),
+        Status            NVARCHAR(20),
+        DeliveryId        INT,
+        Destination       NVARCHAR(150)
+    );
+
+    -- One statement per search shape so each gets its own index-friendly plan
+    IF @Search IS NULL AND @Status IS NULL
+        INSERT INTO @Page
+        SELECT TOP (@Top) DeliveryPackageId, PackageNumber, Status, DeliveryId, Destination
+        FROM dbo.DeliveryPackages
+        WHERE (@AfterId IS NULL OR DeliveryPackageId < @AfterId)
+        ORDER BY DeliveryPackageId DESC;
+    ELSE IF @Search IS NULL
+        INSERT INTO @Page
+        SELECT TOP (@Top) DeliveryPackageId, PackageNumber, Status, DeliveryId, Destination
+        FROM dbo.DeliveryPackages
+        WHERE Status = @Status
+          AND (@AfterId IS NULL OR DeliveryPackageId < @AfterId)
+        ORDER BY DeliveryPackageId DESC;
+    ELSE IF @Match = N'prefix'
+        INSERT INTO @Page
+        SELECT TOP (@Top) DeliveryPackageId, PackageNumber, Status, DeliveryId, Destination
+        FROM dbo.DeliveryPackages
+        WHERE PackageNumber LIKE @Pat + N'%' ESCAPE N'\'
+          AND (@Status IS NULL OR Status = @Status)
+          AND (@AfterId IS NULL OR DeliveryPackageId < @AfterId)
+        ORDER BY DeliveryPackageId DESC;
+    ELSE IF @Match = N'suffix'
+        INSERT INTO @Page
+        SELECT TOP (@Top) DeliveryPackageId, PackageNumber, Status, DeliveryId, Destination
+        FROM dbo.DeliveryPackages
+        WHERE PackageNumberRev LIKE @Pat + N'%' ESCAPE N'\'
+          AND (@Status IS NULL OR Status = @Status)
+          AND (@AfterId IS NULL OR DeliveryPackageId < @AfterId)
+        ORDER BY DeliveryPackageId DESC;
+    ELSE
+        INSERT INTO @Page
+        SELECT TOP (@Top) DeliveryPackageId, PackageNumber, Status, DeliveryId, Destination
+        FROM dbo.DeliveryPackages
+        WHERE PackageNumber LIKE N'%' + @Pat + N'%' ESCAPE N'\'
+          AND (@Status IS NULL OR Status = @Status)
+          AND (@AfterId IS NULL OR DeliveryPackageId < @AfterId)
+        ORDER BY DeliveryPackageId DESC;
+
+    SELECT
+        pg.DeliveryPackageId,
+        pg.PackageNumber,
+        pg.Status,
+        pg.DeliveryId,
+        pg.Destination,
+        d.Driver,
+        d.CreatedAt
+    FROM @Page AS pg
+    LEFT JOIN dbo.Delivery AS d
+           ON d.DeliveryId = pg.DeliveryId
+    ORDER BY pg.DeliveryPackageId DESC;
+
+    -- Quick totals/rollup for dashboard counters (older clients)
+    IF @WithCounts = 1
+        EXEC dbo.usp_Delivery_Counts;
+END;
+GO
+
+
 -- Get details for one package by its number
 CREATE OR ALTER PROCEDURE dbo.usp_Delivery_GetPackageDetails
     @PackageNumber NVARCHAR(50)
@@ -97,12 +177,27 @@ AS
 BEGIN
     SET NOCOUNT ON;
 
+    DECLARE @Prev TABLE (Status NVARCHAR(20));
+
     UPDATE dbo.DeliveryPackages
        SET Status = N'Loaded'
+    OUTPUT deleted.Status INTO @Prev
      WHERE PackageNumber = @PackageNumber;
 
-    -- Return updated row
-    EXEC dbo.usp_Delivery_GetPackageDetails @PackageNumber = @PackageNumber;
+    -- Return updated row (+ previous status so the API can adjust its counters)
+    SELECT TOP (1)
+           dp.DeliveryPackageId,
+           dp.PackageNumber,
+           dp.Status,
+           dp.Destination,
+           dp.DeliveryId,
+           d.Driver,
+           d.CreatedAt,
+           (SELECT TOP (1) Status FROM @Prev) AS PrevStatus
+    FROM dbo.DeliveryPackages AS dp
+    LEFT JOIN dbo.Delivery AS d
+           ON d.DeliveryId = dp.DeliveryId
+    WHERE dp.PackageNumber = @PackageNumber;
 END;
 GO
 
@@ -114,12 +209,27 @@ AS
 BEGIN
     SET NOCOUNT ON;
 
+    DECLARE @Prev TABLE (Status NVARCHAR(20));
+
     UPDATE dbo.DeliveryPackages
        SET Status = N'To Load'
+    OUTPUT deleted.Status INTO @Prev
      WHERE PackageNumber = @PackageNumber;
 
-    -- Return updated row
-    EXEC dbo.usp_Delivery_GetPackageDetails @PackageNumber = @PackageNumber;
+    -- Return updated row (+ previous status so the API can adjust its counters)
+    SELECT TOP (1)
+           dp.DeliveryPackageId,
+           dp.PackageNumber,
+           dp.Status,
+           dp.Destination,
+           dp.DeliveryId,
+           d.Driver,
+           d.CreatedAt,
+           (SELECT TOP (1) Status FROM @Prev) AS PrevStatus
+    FROM dbo.DeliveryPackages AS dp
+    LEFT JOIN dbo.Delivery AS d
+           ON d.DeliveryId = dp.DeliveryId
+    WHERE dp.PackageNumber = @PackageNumber;
 END;
 GO
 
@@ -152,13 +262,91 @@ BEGIN
     IF @@ROWCOUNT = 0
         THROW 56001, 'Cannot mark delivered (not found or not Loaded).', 1;
 
-    SELECT TOP (1) *
+    SELECT TOP (1)
+           DeliveryPackageId, DeliveryId, PackageNumber, Status, Destination, DeliveredAt
     FROM dbo.DeliveryPackages
     WHERE PackageNumber = @PackageNumber;
 END;
 GO
 
 
+-- Bulk transition (loading a whole truck in one call).
+-- Set-based in one transaction; one outcome row per input line:
+--   Updated | AlreadyInState | NotFound | InvalidTransition | Duplicate
+IF TYPE_ID(N'dbo.PackageNumberList') IS NULL
+    CREATE TYPE dbo.PackageNumberList AS TABLE
+    (
+        Seq           INT          NOT NULL PRIMARY KEY,
+        PackageNumber NVARCHAR(50) NOT NULL
+    );
+GO
+
+CREATE OR ALTER PROCEDURE dbo.usp_Delivery_BulkTransition
+    @Target   NVARCHAR(20),                        -- 'Loaded' | 'To Load' | 'Delivered'
+    @Packages dbo.PackageNumberList READONLY
+AS
+BEGIN
+    SET NOCOUNT ON;
+    SET XACT_ABORT ON;
+
+    IF @Target NOT IN (N'Loaded', N'To Load', N'Delivered')
+        THROW 56010, 'Target must be Loaded, To Load or Delivered.', 1;
+
+    CREATE TABLE #P
+    (
+        Seq               INT          NOT NULL PRIMARY KEY,
+        PackageNumber     NVARCHAR(50) NOT NULL,
+        DeliveryPackageId INT          NULL,
+        PrevStatus        NVARCHAR(20) NULL,
+        Outcome           NVARCHAR(20) NULL
+    );
+
+    BEGIN TRAN;
+
+    -- Lock the rows we are about to move so outcomes match what gets written
+    INSERT INTO #P (Seq, PackageNumber, DeliveryPackageId, PrevStatus)
+    SELECT l.Seq, l.PackageNumber, dp.DeliveryPackageId, dp.Status
+    FROM @Packages AS l
+    LEFT JOIN dbo.DeliveryPackages AS dp WITH (UPDLOCK, HOLDLOCK)
+           ON dp.PackageNumber = l.PackageNumber;
+
+    ;WITH firsts AS
+    (
+        SELECT Seq, ROW_NUMBER() OVER (PARTITION BY PackageNumber ORDER BY Seq) AS rn
+        FROM #P
+    )
+    UPDATE p
+       SET Outcome = CASE
+               WHEN f.rn > 1                                              THEN N'Duplicate'
+               WHEN p.DeliveryPackageId IS NULL                           THEN N'NotFound'
+               WHEN p.PrevStatus = @Target                                THEN N'AlreadyInState'
+               WHEN @Target = N'Delivered' AND p.PrevStatus <> N'Loaded'  THEN N'InvalidTransition'
+               ELSE N'Updated'
+           END
+    FROM #P AS p
+    JOIN firsts AS f ON f.Seq = p.Seq;
+
+    UPDATE dp
+       SET Status      = @Target,
+           DeliveredAt = CASE WHEN @Target = N'Delivered' THEN SYSUTCDATETIME() ELSE dp.DeliveredAt END
+    FROM dbo.DeliveryPackages AS dp
+    JOIN #P AS p ON p.DeliveryPackageId = dp.DeliveryPackageId
+    WHERE p.Outcome = N'Updated';
+
+    COMMIT;
+
+    SELECT
+        p.Seq,
+        p.PackageNumber,
+        p.Outcome,
+        p.PrevStatus,
+        CASE WHEN p.Outcome = N'Updated' THEN @Target ELSE p.PrevStatus END AS Status
+    FROM #P AS p
+    ORDER BY p.Seq;
+END;
+GO
+
+
 /* ============================================================
    (D) Diagnostics: list all delivery procs
    ============================================================ */
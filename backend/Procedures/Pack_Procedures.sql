@@ -129,6 +129,41 @@ END;
 GO
 
 
+/* ============================================
+   PACKING: Add item by resolved ProductId
+   - Used when the API already resolved the scan
+   ============================================ */
+CREATE OR ALTER PROCEDURE dbo.usp_Pack_AddItemByProduct
+    @PackingId INT,
+    @ProductId INT,
+    @Qty       INT = 1
+AS
+BEGIN
+    SET NOCOUNT ON;
+
+    IF @Qty IS NULL OR @Qty <= 0
+        THROW 52010, 'Qty must be > 0.', 1;
+
+    IF NOT EXISTS (SELECT 1 FROM dbo.Packing WHERE PackingId = @PackingId AND Status = 'Open')
+        THROW 52011, 'Packing not found or not Open.', 1;
+
+    IF NOT EXISTS (SELECT 1 FROM dbo.Products WHERE ProductId = @ProductId)
+        THROW 52012, 'No product found for barcode/serial.', 1;
+
+    INSERT INTO dbo.PackingItems (PackingId, ProductId, Quantity)
+    VALUES (@PackingId, @ProductId, @Qty);
+
+    DECLARE @PackingItemId INT = SCOPE_IDENTITY();
+
+    SELECT pi.PackingItemId, pi.PackingId, pi.ProductId, pi.Quantity,
+           p.Sku, p.Name
+    FROM dbo.PackingItems AS pi
+    JOIN dbo.Products     AS p ON p.ProductId = pi.ProductId
+    WHERE pi.PackingItemId = @PackingItemId;
+END;
+GO
+
+
 /* ============================================
    PACKING: List items in a package
    ============================================ */
@@ -377,6 +412,42 @@ END;
 GO
 
 
+/* ============================================
+   PACKING: Full state for the API's in-memory
+   validation (header, staged lines, packed lines)
+   ============================================ */
+CREATE OR ALTER PROCEDURE dbo.usp_Pack_GetState
+    @PackingId INT
+AS
+BEGIN
+    SET NOCOUNT ON;
+
+    DECLARE @StagingId INT;
+
+    SELECT TOP (1) @StagingId = StagingId
+    FROM dbo.PickToPack
+    WHERE PackedIntoId = @PackingId;
+
+    -- 1) Header (empty if the package does not exist)
+    SELECT p.PackingId, p.PackageNumber, p.Status, p.CreatedAt, @StagingId AS StagingId
+    FROM dbo.Packing AS p
+    WHERE p.PackingId = @PackingId;
+
+    -- 2) Staged requirements (empty when no staging is linked)
+    SELECT ProductId, Sku, Name, Required
+    FROM dbo.vPackStagingLines
+    WHERE StagingId = @StagingId;
+
+    -- 3) Packed lines
+    SELECT pi.PackingItemId, pi.ProductId, p.Sku, p.Name, pi.Quantity
+    FROM dbo.PackingItems AS pi
+    JOIN dbo.Products     AS p ON p.ProductId = pi.ProductId
+    WHERE pi.PackingId = @PackingId
+    ORDER BY pi.PackingItemId;
+END;
+GO
+
+
 /* ============================================
    SEAL (integrated): Mark sealed and ensure
    DeliveryPackages entry exists (To Load)
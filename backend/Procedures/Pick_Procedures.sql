@@ -217,6 +217,289 @@ BEGIN
 END;
 GO
 
+-- Same as usp_Pick_AddScan, for a code the API already resolved (see usp_Catalog_Changes).
+-- @SerialNumber is set when the scanned code was a serial.
+CREATE OR ALTER PROCEDURE dbo.usp_Pick_AddScanByProduct
+    @SessionId    INT,
+    @ProductId    INT,
+    @SerialNumber NVARCHAR(100) = NULL,
+    @Qty          INT = 1
+AS
+BEGIN
+    SET NOCOUNT ON;
+    SET XACT_ABORT ON;
+
+    IF @Qty IS NULL OR @Qty <= 0
+        THROW 51010, 'Qty must be > 0.', 1;
+
+    IF NOT EXISTS
+    (
+        SELECT 1 FROM dbo.PickSessions
+        WHERE SessionId = @SessionId AND Status = 'Active'
+    )
+        THROW 51011, 'Session not Active or not found.', 1;
+
+    BEGIN TRY
+        BEGIN TRAN;
+
+        -- Serial must still be available (it may have been picked since the snapshot)
+        IF @SerialNumber IS NOT NULL
+           AND NOT EXISTS
+           (
+               SELECT 1 FROM dbo.ProductSerials WITH (UPDLOCK, ROWLOCK)
+               WHERE SerialNumber = @SerialNumber
+                 AND ProductId    = @ProductId
+                 AND IsAvailable  = 1
+           )
+        BEGIN
+            ROLLBACK TRAN;
+            THROW 51012, 'No product found for barcode/serial.', 1;
+        END;
+
+        -- Lock product row for on-hand check/update
+        DECLARE @OnHand INT;
+
+        SELECT @OnHand = QuantityInStock
+        FROM dbo.Products WITH (UPDLOCK, ROWLOCK)
+        WHERE ProductId = @ProductId;
+
+        IF @OnHand IS NULL
+        BEGIN
+            ROLLBACK TRAN;
+            THROW 51014, 'Product not found during update.', 1;
+        END;
+
+        IF @OnHand < @Qty
+        BEGIN
+            ROLLBACK TRAN;
+            THROW 51013, 'Insufficient stock.', 1;
+        END;
+
+        UPDATE dbo.Products
+           SET QuantityInStock = QuantityInStock - @Qty
+         WHERE ProductId = @ProductId;
+
+        INSERT INTO dbo.PickScans (SessionId, ProductId, SerialNumber, Qty)
+        VALUES (@SessionId, @ProductId, @SerialNumber, @Qty);
+
+        DECLARE @ScanId BIGINT = SCOPE_IDENTITY();
+
+        IF @SerialNumber IS NOT NULL
+        BEGIN
+            UPDATE dbo.ProductSerials
+               SET IsAvailable = 0,
+                   LastUpdated = SYSUTCDATETIME()
+             WHERE SerialNumber = @SerialNumber;
+        END;
+
+        COMMIT TRAN;
+    END TRY
+    BEGIN CATCH
+        IF XACT_STATE() <> 0 ROLLBACK TRAN;
+        THROW;
+    END CATCH;
+
+    SELECT ps.ScanId,
+           ps.SessionId,
+           ps.ProductId,
+           p.Sku,
+           p.Name,
+           ps.SerialNumber,
+           ps.Qty,
+           ps.ScannedAt,
+           p.QuantityInStock AS NewOnHand
+    FROM dbo.PickScans AS ps
+    INNER JOIN dbo.Products  AS p ON p.ProductId = ps.ProductId
+    WHERE ps.ScanId = @ScanId;
+END;
+GO
+
+
+-- Batch of scans for one session (bulk-pick mode), applied in one round trip.
+-- Lines are applied in Seq order with the same rules as usp_Pick_AddScan;
+-- a bad line is rolled back to its own savepoint, so it doesn't undo the rest.
+-- (pyodbc runs with autocommit off, so the whole EXEC sits inside the driver's
+-- implicit transaction: a plain ROLLBACK would also undo the earlier lines.)
+IF TYPE_ID(N'dbo.PickScanLines') IS NULL
+    CREATE TYPE dbo.PickScanLines AS TABLE
+    (
+        Seq             INT           NOT NULL PRIMARY KEY,
+        BarcodeOrSerial NVARCHAR(100) NOT NULL,
+        ProductId       INT           NULL,   -- pre-resolved by the API (optional)
+        SerialNumber    NVARCHAR(100) NULL,   -- set when the code was resolved as a serial
+        Qty             INT           NOT NULL
+    );
+GO
+
+CREATE OR ALTER PROCEDURE dbo.usp_Pick_AddScans
+    @SessionId INT,
+    @Lines     dbo.PickScanLines READONLY
+AS
+BEGIN
+    SET NOCOUNT ON;
+    SET XACT_ABORT OFF;   -- a failing line must not doom the whole batch
+
+    IF NOT EXISTS
+    (
+        SELECT 1 FROM dbo.PickSessions
+        WHERE SessionId = @SessionId AND Status = 'Active'
+    )
+        THROW 51011, 'Session not Active or not found.', 1;
+
+    DECLARE @Results TABLE
+    (
+        Seq          INT PRIMARY KEY,
+        ScanId       BIGINT        NULL,
+        ProductId    INT           NULL,
+        NewOnHand    INT           NULL,
+        ErrorNumber  INT           NULL,
+        ErrorMessage NVARCHAR(400) NULL
+    );
+
+    DECLARE @Seq INT = (SELECT MIN(Seq) FROM @Lines),
+            @Code NVARCHAR(100), @ProductId INT, @Serial NVARCHAR(100), @Qty INT, @OnHand INT,
+            @OuterTran INT = @@TRANCOUNT,   -- 1 under the driver's implicit transaction
+            @InLine BIT;
+
+    WHILE @Seq IS NOT NULL
+    BEGIN
+        SELECT @Code = BarcodeOrSerial, @ProductId = ProductId, @Serial = SerialNumber, @Qty = Qty
+        FROM @Lines
+        WHERE Seq = @Seq;
+
+        SET @InLine = 0;
+
+        BEGIN TRY
+            IF @Qty IS NULL OR @Qty <= 0
+                THROW 51010, 'Qty must be > 0.', 1;
+
+            -- The API's resolution is a hint: drop it when its serial was picked
+            -- or its product removed since the API's catalog snapshot
+            IF @ProductId IS NOT NULL
+               AND (NOT EXISTS (SELECT 1 FROM dbo.Products WHERE ProductId = @ProductId)
+                    OR (@Serial IS NOT NULL
+                        AND NOT EXISTS (SELECT 1 FROM dbo.ProductSerials
+                                        WHERE SerialNumber = @Serial
+                                          AND ProductId    = @ProductId
+                                          AND IsAvailable  = 1)))
+                SELECT @ProductId = NULL, @Serial = NULL;
+
+            -- Resolve in the DB when the API couldn't (same order as usp_Pick_AddScan)
+            IF @ProductId IS NULL
+            BEGIN
+                SELECT TOP (1) @ProductId = ProductId, @Serial = SerialNumber
+                FROM dbo.ProductSerials
+                WHERE SerialNumber = @Code
+                  AND IsAvailable  = 1;
+
+                IF @ProductId IS NULL
+                    SELECT TOP (1) @ProductId = ProductId
+                    FROM dbo.Products
+                    WHERE Barcode = @Code;
+
+                IF @ProductId IS NULL
+                    THROW 51012, 'No product found for barcode/serial.', 1;
+            END;
+
+            BEGIN TRAN;
+            SAVE TRANSACTION ScanLine;   -- a failing line rolls back to here only
+            SET @InLine = 1;
+
+            IF @Serial IS NOT NULL
+               AND NOT EXISTS
+               (
+                   SELECT 1 FROM dbo.ProductSerials WITH (UPDLOCK, ROWLOCK)
+                   WHERE SerialNumber = @Serial
+                     AND ProductId    = @ProductId
+                     AND IsAvailable  = 1
+               )
+                THROW 51012, 'No product found for barcode/serial.', 1;
+
+            SET @OnHand = NULL;
+
+            SELECT @OnHand = QuantityInStock
+            FROM dbo.Products WITH (UPDLOCK, ROWLOCK)
+            WHERE ProductId = @ProductId;
+
+            IF @OnHand IS NULL
+                THROW 51014, 'Product not found during update.', 1;
+
+            IF @OnHand < @Qty
+                THROW 51013, 'Insufficient stock.', 1;
+
+            UPDATE dbo.Products
+               SET QuantityInStock = QuantityInStock - @Qty
+             WHERE ProductId = @ProductId;
+
+            INSERT INTO dbo.PickScans (SessionId, ProductId, SerialNumber, Qty)
+            VALUES (@SessionId, @ProductId, @Serial, @Qty);
+
+            INSERT INTO @Results (Seq, ScanId, ProductId, NewOnHand)
+            VALUES (@Seq, SCOPE_IDENTITY(), @ProductId, @OnHand - @Qty);
+
+            IF @Serial IS NOT NULL
+                UPDATE dbo.ProductSerials
+                   SET IsAvailable = 0,
+                       LastUpdated = SYSUTCDATETIME()
+                 WHERE SerialNumber = @Serial;
+
+            COMMIT TRAN;
+            SET @InLine = 0;
+        END TRY
+        BEGIN CATCH
+            IF XACT_STATE() = 1 AND @InLine = 1
+            BEGIN
+                ROLLBACK TRAN ScanLine;   -- undo this line's work only
+                COMMIT TRAN;              -- close this line's (now empty) BEGIN TRAN
+            END
+            ELSE IF XACT_STATE() = -1
+                ROLLBACK TRAN;            -- doomed: only a full rollback is allowed
+
+            IF @@TRANCOUNT < @OuterTran
+            BEGIN
+                -- The caller's transaction was lost (doomed, or deadlock victim) and
+                -- took the earlier lines with it: don't report those as applied
+                UPDATE @Results
+                   SET ScanId = NULL, NewOnHand = NULL,
+                       ErrorNumber = ERROR_NUMBER(),
+                       ErrorMessage = CONCAT(N'Rolled back with line ', @Seq, N': ', ERROR_MESSAGE())
+                 WHERE ErrorNumber IS NULL;
+                WHILE @@TRANCOUNT < @OuterTran
+                    BEGIN TRAN;           -- keep the caller's transaction count balanced
+            END;
+
+            -- table variables survive the rollback; drop a half-recorded success
+            DELETE FROM @Results WHERE Seq = @Seq;
+            INSERT INTO @Results (Seq, ProductId, ErrorNumber, ErrorMessage)
+            VALUES (@Seq, @ProductId, ERROR_NUMBER(), ERROR_MESSAGE());
+        END CATCH;
+
+        SELECT @Seq = MIN(Seq) FROM @Lines WHERE Seq > @Seq;
+    END;
+
+    -- One row per input line, in input order
+    SELECT
+        r.Seq,
+        CAST(CASE WHEN r.ErrorNumber IS NULL THEN 1 ELSE 0 END AS BIT) AS Ok,
+        l.BarcodeOrSerial,
+        l.Qty,
+        r.ScanId,
+        r.ProductId,
+        p.Sku,
+        p.Name,
+        ps.SerialNumber,
+        ps.ScannedAt,
+        r.NewOnHand,
+        r.ErrorNumber,
+        r.ErrorMessage
+    FROM @Results AS r
+    INNER JOIN @Lines         AS l  ON l.Seq       = r.Seq
+    LEFT  JOIN dbo.PickScans  AS ps ON ps.ScanId    = r.ScanId
+    LEFT  JOIN dbo.Products   AS p  ON p.ProductId  = r.ProductId
+    ORDER BY r.Seq;
+END;
+GO
+
 
 -- Recent scans for a session
 CREATE OR ALTER PROCEDURE dbo.usp_Pick_GetRecentScans
@@ -230,6 +513,8 @@ BEGIN
            ps.ScanId,
            ps.ScannedAt,
            ps.SerialNumber,
+           -- what was scanned: scans resolve by serial first, then barcode
+           COALESCE(ps.SerialNumber, p.Barcode, N'') AS BarcodeOrSerial,
            ps.Qty,
            ps.ProductId,
            p.Sku,
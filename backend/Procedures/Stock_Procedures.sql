@@ -18,6 +18,17 @@ BEGIN
 END;
 GO
 
+-- Client count id: a count replayed after a crash (API write-behind log, or a
+-- device re-sending a sync) is applied once per stock take
+IF COL_LENGTH('dbo.StockTakeScans','CountId') IS NULL
+    ALTER TABLE dbo.StockTakeScans ADD CountId NVARCHAR(64) NULL;
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'UX_StockTakeScans_CountId' AND object_id = OBJECT_ID('dbo.StockTakeScans'))
+    CREATE UNIQUE INDEX UX_StockTakeScans_CountId
+        ON dbo.StockTakeScans(StockTakeId, CountId) WHERE CountId IS NOT NULL;
+GO
+
 
 -- Start a stock-take session and return its details
 CREATE OR ALTER PROCEDURE dbo.usp_Stock_StartSession
@@ -76,6 +87,41 @@ END;
 GO
 
 
+-- Item search resolved by the API's product search index: only the matching
+-- ProductIds come in (in rank order), so there is no LIKE '%...%' scan.
+IF TYPE_ID(N'dbo.ProductIdList') IS NULL
+    CREATE TYPE dbo.ProductIdList AS TABLE
+    (
+        Seq       INT NOT NULL PRIMARY KEY,
+        ProductId INT NOT NULL
+    );
+GO
+
+CREATE OR ALTER PROCEDURE dbo.usp_Stock_ListItemsByIds
+    @StockTakeId INT,
+    @ProductIds  dbo.ProductIdList READONLY
+AS
+BEGIN
+    SET NOCOUNT ON;
+
+    SELECT 
+        sti.StockTakeItemId,
+        sti.StockTakeId,
+        p.ProductId,
+        p.Sku,
+        p.Name,
+        sti.ExpectedQty,
+        sti.CountedQty
+    FROM @ProductIds AS ids
+    INNER JOIN dbo.StockTakeItems AS sti
+            ON sti.ProductId   = ids.ProductId
+           AND sti.StockTakeId = @StockTakeId
+    INNER JOIN dbo.Products AS p ON p.ProductId = sti.ProductId
+    ORDER BY ids.Seq;
+END;
+GO
+
+
 -- Add to counted quantity by barcode or SKU, log scan for undo
 CREATE OR ALTER PROCEDURE dbo.usp_Stock_AddCount
     @StockTakeId    INT,
@@ -158,6 +204,241 @@ END;
 GO
 
 
+-- Same as usp_Stock_AddCount, for a code the API already resolved to a ProductId
+CREATE OR ALTER PROCEDURE dbo.usp_Stock_AddCountByProduct
+    @StockTakeId INT,
+    @ProductId   INT,
+    @Qty         INT = 1
+AS
+BEGIN
+    SET NOCOUNT ON;
+
+    IF @Qty IS NULL OR @Qty <= 0
+        THROW 52010, 'Qty must be > 0.', 1;
+
+    IF NOT EXISTS
+    (
+        SELECT 1
+        FROM dbo.StockTake
+        WHERE StockTakeId = @StockTakeId
+          AND Status      = 'In Progress'
+    )
+        THROW 52011, 'Stock take not In Progress or not found.', 1;
+
+    IF NOT EXISTS (SELECT 1 FROM dbo.Products WHERE ProductId = @ProductId)
+        THROW 52012, 'No product found for barcode/SKU.', 1;
+
+    -- Ensure row exists in StockTakeItems (seed expected from current stock)
+    IF NOT EXISTS
+    (
+        SELECT 1
+        FROM dbo.StockTakeItems
+        WHERE StockTakeId = @StockTakeId
+          AND ProductId   = @ProductId
+    )
+    BEGIN
+        INSERT INTO dbo.StockTakeItems (StockTakeId, ProductId, ExpectedQty, CountedQty)
+        VALUES
+        (
+            @StockTakeId,
+            @ProductId,
+            (SELECT QuantityInStock FROM dbo.Products WHERE ProductId = @ProductId),
+            0
+        );
+    END
+
+    UPDATE dbo.StockTakeItems
+       SET CountedQty = CountedQty + @Qty
+     WHERE StockTakeId = @StockTakeId
+       AND ProductId   = @ProductId;
+
+    INSERT INTO dbo.StockTakeScans (StockTakeId, ProductId, Qty)
+    VALUES (@StockTakeId, @ProductId, @Qty);
+
+    SELECT 
+        sti.StockTakeItemId,
+        sti.StockTakeId,
+        p.ProductId,
+        p.Sku,
+        p.Name,
+        sti.ExpectedQty,
+        sti.CountedQty
+    FROM dbo.StockTakeItems AS sti
+    INNER JOIN dbo.Products     AS p ON p.ProductId = sti.ProductId
+    WHERE sti.StockTakeId = @StockTakeId
+      AND sti.ProductId   = @ProductId;
+END;
+GO
+
+
+-- Bulk upload of buffered counts (offline devices syncing a whole aisle).
+-- Set-based: resolves every code at once, merges into StockTakeItems and
+-- logs one StockTakeScans row per line (in Seq order, so undo-last still works).
+-- Lines with a CountId that is already logged for the stock take are skipped
+-- (reported as Duplicate), so replaying a batch never counts it twice.
+
+-- Table types can't be altered: recreate an older one without CountId
+IF TYPE_ID(N'dbo.StockCountLines') IS NOT NULL
+   AND NOT EXISTS
+   (
+       SELECT 1
+       FROM sys.table_types AS tt
+       JOIN sys.columns     AS c ON c.object_id = tt.type_table_object_id
+       WHERE tt.name = 'StockCountLines' AND c.name = 'CountId'
+   )
+BEGIN
+    DROP PROCEDURE IF EXISTS dbo.usp_Stock_AddCounts;
+    DROP TYPE dbo.StockCountLines;
+END;
+GO
+
+IF TYPE_ID(N'dbo.StockCountLines') IS NULL
+    CREATE TYPE dbo.StockCountLines AS TABLE
+    (
+        Seq          INT           NOT NULL PRIMARY KEY,
+        BarcodeOrSku NVARCHAR(100) NOT NULL,
+        ProductId    INT           NULL,   -- pre-resolved by the API (optional)
+        Qty          INT           NOT NULL,
+        ScannedAt    DATETIME2(0)  NULL,   -- device time (UTC); NULL = now
+        CountId      NVARCHAR(64)  NULL    -- client count id for idempotent replays (optional)
+    );
+GO
+
+CREATE OR ALTER PROCEDURE dbo.usp_Stock_AddCounts
+    @StockTakeId INT,
+    @Lines       dbo.StockCountLines READONLY
+AS
+BEGIN
+    SET NOCOUNT ON;
+    SET XACT_ABORT ON;
+
+    IF NOT EXISTS
+    (
+        SELECT 1
+        FROM dbo.StockTake
+        WHERE StockTakeId = @StockTakeId
+          AND Status      = 'In Progress'
+    )
+        THROW 52011, 'Stock take not In Progress or not found.', 1;
+
+    CREATE TABLE #L
+    (
+        Seq          INT           NOT NULL PRIMARY KEY,
+        BarcodeOrSku NVARCHAR(100) NOT NULL,
+        ProductId    INT           NULL,
+        Qty          INT           NOT NULL,
+        ScannedAt    DATETIME2(0)  NOT NULL,
+        CountId      NVARCHAR(64)  NULL,
+        Dup          BIT           NOT NULL DEFAULT (0)
+    );
+
+    INSERT INTO #L (Seq, BarcodeOrSku, ProductId, Qty, ScannedAt, CountId)
+    SELECT Seq, BarcodeOrSku, ProductId, Qty, ISNULL(ScannedAt, SYSUTCDATETIME()), CountId
+    FROM @Lines;
+
+    -- The same CountId twice in one batch: only the first line counts
+    UPDATE l
+       SET Dup = 1
+      FROM #L AS l
+     WHERE l.CountId IS NOT NULL
+       AND EXISTS (SELECT 1 FROM #L AS e WHERE e.CountId = l.CountId AND e.Seq < l.Seq);
+
+    -- Resolve product: prefer barcode, then SKU (same order as usp_Stock_AddCount)
+    UPDATE l
+       SET ProductId = COALESCE(
+               (SELECT TOP (1) p.ProductId FROM dbo.Products AS p WHERE p.Barcode = l.BarcodeOrSku),
+               (SELECT TOP (1) p.ProductId FROM dbo.Products AS p WHERE p.Sku     = l.BarcodeOrSku))
+      FROM #L AS l
+     WHERE l.ProductId IS NULL;
+
+    BEGIN TRAN;
+
+    -- Already applied by an earlier call (locked so a concurrent replay waits)
+    UPDATE l
+       SET Dup = 1
+      FROM #L AS l
+     WHERE l.CountId IS NOT NULL
+       AND EXISTS
+       (
+           SELECT 1
+           FROM dbo.StockTakeScans AS s WITH (UPDLOCK, HOLDLOCK)
+           WHERE s.StockTakeId = @StockTakeId
+             AND s.CountId     = l.CountId
+       );
+
+    -- Seed missing items (expected = current stock)
+    INSERT INTO dbo.StockTakeItems (StockTakeId, ProductId, ExpectedQty, CountedQty)
+    SELECT @StockTakeId, p.ProductId, p.QuantityInStock, 0
+    FROM (SELECT DISTINCT ProductId FROM #L WHERE ProductId IS NOT NULL AND Qty > 0 AND Dup = 0) AS n
+    INNER JOIN dbo.Products AS p ON p.ProductId = n.ProductId
+    WHERE NOT EXISTS
+    (
+        SELECT 1
+        FROM dbo.StockTakeItems AS sti WITH (UPDLOCK, HOLDLOCK)
+        WHERE sti.StockTakeId = @StockTakeId
+          AND sti.ProductId   = n.ProductId
+    );
+
+    -- Add all counts per product in one pass
+    UPDATE sti
+       SET CountedQty = sti.CountedQty + a.Qty
+      FROM dbo.StockTakeItems AS sti
+     INNER JOIN
+     (
+         SELECT ProductId, SUM(Qty) AS Qty
+         FROM #L
+         WHERE ProductId IS NOT NULL AND Qty > 0 AND Dup = 0
+         GROUP BY ProductId
+     ) AS a ON a.ProductId = sti.ProductId
+     WHERE sti.StockTakeId = @StockTakeId;
+
+    -- Scan log for audit/undo
+    INSERT INTO dbo.StockTakeScans (StockTakeId, ProductId, Qty, ScannedAt, CountId)
+    SELECT @StockTakeId, ProductId, Qty, ScannedAt, CountId
+    FROM #L
+    WHERE ProductId IS NOT NULL AND Qty > 0 AND Dup = 0
+    ORDER BY Seq;
+
+    COMMIT TRAN;
+
+    -- Summary
+    SELECT
+        COUNT(*)                                                                    AS Received,
+        SUM(CASE WHEN ProductId IS NOT NULL AND Qty > 0 AND Dup = 0 THEN 1 ELSE 0 END) AS Applied,
+        SUM(CASE WHEN ProductId IS NULL THEN 1 ELSE 0 END)                            AS Unknown,
+        SUM(CASE WHEN ProductId IS NOT NULL AND Qty <= 0 THEN 1 ELSE 0 END)           AS Invalid,
+        SUM(CASE WHEN ProductId IS NOT NULL AND Qty > 0 AND Dup = 1 THEN 1 ELSE 0 END) AS Duplicate,
+        COUNT(DISTINCT CASE WHEN Qty > 0 THEN ProductId END)                          AS Products
+    FROM #L;
+
+    -- Rejected lines (duplicates were applied before: not rejected)
+    SELECT
+        Seq,
+        BarcodeOrSku,
+        Qty,
+        CASE WHEN ProductId IS NULL THEN 'Unknown barcode/SKU' ELSE 'Qty must be > 0' END AS Reason
+    FROM #L
+    WHERE ProductId IS NULL OR Qty <= 0
+    ORDER BY Seq;
+
+    -- Updated items to refresh the UI
+    SELECT 
+        sti.StockTakeItemId,
+        sti.StockTakeId,
+        p.ProductId,
+        p.Sku,
+        p.Name,
+        sti.ExpectedQty,
+        sti.CountedQty
+    FROM dbo.StockTakeItems AS sti
+    INNER JOIN dbo.Products     AS p ON p.ProductId = sti.ProductId
+    WHERE sti.StockTakeId = @StockTakeId
+      AND sti.ProductId IN (SELECT ProductId FROM #L WHERE ProductId IS NOT NULL AND Qty > 0)
+    ORDER BY p.Name;
+END;
+GO
+
+
 -- Undo the most recent scan for a session
 CREATE OR ALTER PROCEDURE dbo.usp_Stock_UndoLast
     @StockTakeId INT
@@ -205,6 +486,33 @@ END;
 GO
 
 
+-- Export every line of a stock-take (or only the mismatches), read-only.
+-- Ordered by StockTakeItemId: IX_STI_StockTake already returns rows in that
+-- order, so there is no sort and the first rows can go out immediately.
+CREATE OR ALTER PROCEDURE dbo.usp_Stock_ExportLines
+    @StockTakeId       INT,
+    @OnlyDiscrepancies BIT = 0
+AS
+BEGIN
+    SET NOCOUNT ON;
+
+    SELECT
+        sti.StockTakeItemId,
+        p.ProductId,
+        p.Sku,
+        p.Name,
+        sti.ExpectedQty,
+        sti.CountedQty,
+        (sti.CountedQty - sti.ExpectedQty) AS Variance
+    FROM dbo.StockTakeItems AS sti
+    INNER JOIN dbo.Products     AS p ON p.ProductId = sti.ProductId
+    WHERE sti.StockTakeId = @StockTakeId
+      AND (@OnlyDiscrepancies = 0 OR sti.CountedQty <> sti.ExpectedQty)
+    ORDER BY sti.StockTakeItemId;
+END;
+GO
+
+
 -- Complete a stock-take and return summary sets
 CREATE OR ALTER PROCEDURE dbo.usp_Stock_Finish
     @StockTakeId INT
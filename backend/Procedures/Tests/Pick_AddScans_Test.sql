@@ -0,0 +1,59 @@
+/* ============================================================
+   TEST: usp_Pick_AddScans with a mixed good/bad batch
+   ------------------------------------------------------------
+   Runs the batch the way the API does (pyodbc, autocommit off:
+   the driver wraps the EXEC in an implicit transaction) and
+   checks that failing lines don't undo the lines before them.
+   Run against a dev database; everything is rolled back.
+   ============================================================ */
+SET NOCOUNT ON;
+SET XACT_ABORT OFF;
+SET IMPLICIT_TRANSACTIONS ON;   -- what the ODBC driver does with autocommit off
+
+DECLARE @UserId INT, @SessionId INT, @P1 INT, @P2 INT;
+
+INSERT INTO dbo.Users (Name) VALUES (N'addscans-test');   -- opens the implicit transaction
+SET @UserId = SCOPE_IDENTITY();
+
+INSERT INTO dbo.Products (Sku, Name, Barcode, QuantityInStock)
+VALUES (N'T-ADDSCANS-1', N'AddScans test 1', N'T-ADDSCANS-BC1', 10);
+SET @P1 = SCOPE_IDENTITY();
+
+INSERT INTO dbo.Products (Sku, Name, Barcode, QuantityInStock)
+VALUES (N'T-ADDSCANS-2', N'AddScans test 2', N'T-ADDSCANS-BC2', 1);
+SET @P2 = SCOPE_IDENTITY();
+
+INSERT INTO dbo.PickSessions (UserId) VALUES (@UserId);
+SET @SessionId = SCOPE_IDENTITY();
+
+DECLARE @Lines dbo.PickScanLines;
+INSERT INTO @Lines (Seq, BarcodeOrSerial, ProductId, SerialNumber, Qty)
+VALUES (0, N'T-ADDSCANS-BC1', NULL, NULL, 2),   -- ok
+       (1, N'T-ADDSCANS-BC2', NULL, NULL, 1),   -- ok
+       (2, N'T-ADDSCANS-BC2', NULL, NULL, 5),   -- 51013 insufficient stock
+       (3, N'T-ADDSCANS-NOPE', NULL, NULL, 1),  -- 51012 unknown code
+       (4, N'T-ADDSCANS-BC1', @P1, NULL, 3);    -- ok, pre-resolved, after the failures
+
+EXEC dbo.usp_Pick_AddScans @SessionId = @SessionId, @Lines = @Lines;
+
+DECLARE @Scans INT = (SELECT COUNT(*) FROM dbo.PickScans WHERE SessionId = @SessionId),
+        @Q1 INT = (SELECT QuantityInStock FROM dbo.Products WHERE ProductId = @P1),
+        @Q2 INT = (SELECT QuantityInStock FROM dbo.Products WHERE ProductId = @P2),
+        @Tran INT = @@TRANCOUNT;
+
+IF @Tran <> 1
+BEGIN
+    IF @@TRANCOUNT > 0 ROLLBACK;
+    THROW 50000, 'FAIL: the caller''s transaction did not survive the batch.', 1;
+END;
+
+ROLLBACK;   -- leave the database as it was
+SET IMPLICIT_TRANSACTIONS OFF;
+
+IF @Scans <> 3
+    THROW 50000, 'FAIL: expected lines 0, 1 and 4 to be recorded.', 1;
+IF @Q1 <> 5 OR @Q2 <> 0
+    THROW 50000, 'FAIL: stock changes of the good lines were undone.', 1;
+
+PRINT 'PASS: usp_Pick_AddScans keeps earlier lines when a later line fails.';
+GO
@@ -0,0 +1,441 @@
+# app/catalog.py
+#
+# Compact product catalog used to resolve scanned codes (barcode / SKU / serial)
+# to a ProductId without a DB round trip.
+#
+# The snapshot lives in one immutable file that every uvicorn worker mmaps
+# read-only, so the OS page cache holds a single shared copy. Layout:
+#
+#   header   | magic, counts, version watermark, timestamps
+#   hashes   | n_keys x u64 (native order), sorted (binary-searched in place)
+#   keys     | n_keys x (product_idx u32, key_off u32, key_len u16, kind u8)
+#   products | n_products x (ProductId i32, sku_off u32, sku_len u16, name_off u32, name_len u16)
+#   blob     | UTF-8 strings
+#
+# Refreshes are incremental: only Products/ProductSerials rows whose rowversion
+# moved past the current watermark are fetched (dbo.usp_Catalog_Changes). The
+# snapshot file itself is only rewritten by a full build (CATALOG_FULL_EVERY,
+# or once the deltas pile up); changed rows are appended to a small delta log
+# next to it (CATALOG_PATH + ".delta", JSON lines) that every worker applies in
+# place to an in-memory overlay. A refresh that finds nothing only touches the
+# delta log, whose mtime is the freshness stamp. A file lock makes sure only
+# one worker talks to the DB per round; the others just catch up on the files.
+#
+# Serials are only indexed while IsAvailable = 1. A hit is a hint, not a
+# verdict: the procs re-check it, and callers fall back to the DB lookup on a
+# miss or when a resolved serial turns out to be gone.
+
+import asyncio, hashlib, json, mmap, os, struct, tempfile, threading, time
+from bisect import bisect_left
+from typing import NamedTuple
+
+try:
+    import fcntl
+except ImportError:  # Windows dev boxes: no cross-process lock, each worker refreshes itself
+    fcntl = None
+
+from app import db
+
+BARCODE, SKU, SERIAL = 1, 2, 3
+
+# Resolution order per flow (mirrors the lookups the stored procs used to do)
+PICK_KINDS = (SERIAL, BARCODE)
+PACK_KINDS = (SERIAL, BARCODE)
+STOCK_KINDS = (BARCODE, SKU)
+
+CATALOG_PATH = os.getenv("CATALOG_PATH", os.path.join(tempfile.gettempdir(), "tws-catalog.bin"))
+CATALOG_REFRESH_SECONDS = float(os.getenv("CATALOG_REFRESH_SECONDS", "30"))
+CATALOG_MAX_STALENESS = float(os.getenv("CATALOG_MAX_STALENESS", "120"))
+CATALOG_FULL_EVERY = float(os.getenv("CATALOG_FULL_EVERY", "3600"))
+CATALOG_DELTA_MAX = int(os.getenv("CATALOG_DELTA_MAX", "50000"))  # rows before a full build is forced
+
+_MAGIC = b"TWSCAT01"
+_HEADER = struct.Struct("<8sIIQddQ")  # magic, n_products, n_keys, version, built_at, full_at, blob_len
+_KEY = struct.Struct("<IIHB")
+_PRODUCT = struct.Struct("<iIHIH")
+
+
+class Match(NamedTuple):
+    product_id: int
+    sku: str
+    name: str
+    serial: str | None = None
+
+
+def normalize(code: str) -> str:
+    # SQL Server's default collation is case-insensitive and ignores trailing spaces
+    return code.rstrip(" ").lower()
+
+
+def _hash(kind: int, key: str) -> int:
+    h = hashlib.blake2b(key.encode("utf-8"), digest_size=8, person=bytes([kind]) * 16)
+    return int.from_bytes(h.digest(), "little")
+
+
+def _align8(n: int) -> int:
+    return (n + 7) & ~7
+
+
+# ---------- snapshot (read side) ----------
+
+class Snapshot:
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            st = os.fstat(f.fileno())
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.ident = (st.st_ino, st.st_mtime_ns)
+        magic, n_products, n_keys, version, built_at, full_at, blob_len = _HEADER.unpack_from(self._mm, 0)
+        if magic != _MAGIC:
+            raise ValueError("Not a catalog snapshot.")
+        self.n_products, self.n_keys = n_products, n_keys
+        self.version, self.built_at, self.full_at = version, built_at, full_at
+
+        off = _align8(_HEADER.size)
+        self._hashes = memoryview(self._mm)[off:off + 8 * n_keys].cast("Q")
+        self._keys_off = off + 8 * n_keys
+        self._products_off = self._keys_off + _KEY.size * n_keys
+        self._blob_off = self._products_off + _PRODUCT.size * n_products
+
+    def _str(self, off: int, length: int) -> str:
+        start = self._blob_off + off
+        return self._mm[start:start + length].decode("utf-8")
+
+    def _product(self, idx: int) -> tuple[int, str, str]:
+        pid, sku_off, sku_len, name_off, name_len = _PRODUCT.unpack_from(
+            self._mm, self._products_off + idx * _PRODUCT.size
+        )
+        return pid, self._str(sku_off, sku_len), self._str(name_off, name_len)
+
+    def find(self, kind: int, key: str) -> int | None:
+        """Product index for a normalized key of the given kind, or None."""
+        h = _hash(kind, key)
+        i = bisect_left(self._hashes, h)
+        while i < self.n_keys and self._hashes[i] == h:
+            idx, key_off, key_len, k = _KEY.unpack_from(self._mm, self._keys_off + i * _KEY.size)
+            if k == kind and self._str(key_off, key_len) == key:
+                return idx
+            i += 1
+        return None
+
+    def lookup(self, code: str, kinds) -> Match | None:
+        key = normalize(code)
+        for kind in kinds:
+            idx = self.find(kind, key)
+            if idx is not None:
+                pid, sku, name = self._product(idx)
+                return Match(pid, sku, name, code if kind == SERIAL else None)
+        return None
+
+    def product_by_id(self, pid: int) -> tuple[int, str, str] | None:
+        lo, hi = 0, self.n_products  # products are stored in ProductId order
+        while lo < hi:
+            mid = (lo + hi) // 2
+            (p,) = struct.unpack_from("<i", self._mm, self._products_off + mid * _PRODUCT.size)
+            if p < pid:
+                lo = mid + 1
+            elif p > pid:
+                hi = mid
+            else:
+                return self._product(mid)
+        return None
+
+    def products(self):
+        """Yield (ProductId, Sku, Name) for every product in the file."""
+        for idx in range(self.n_products):
+            yield self._product(idx)
+
+
+# ---------- snapshot (write side) ----------
+
+def write_snapshot(path: str, products: dict, serials: dict, version: int, full_at: float) -> None:
+    """
+    products: {ProductId: [sku, name, barcode_key_or_None]}
+    serials:  {serial_key: ProductId}
+    """
+    blob = bytearray()
+    strings: dict[str, tuple[int, int]] = {}
+
+    def put(s: str) -> tuple[int, int]:
+        ref = strings.get(s)
+        if ref is None:
+            b = s.encode("utf-8")
+            ref = strings[s] = (len(blob), len(b))
+            blob.extend(b)
+        return ref
+
+    pids = sorted(products)
+    index = {pid: i for i, pid in enumerate(pids)}
+    product_rows = bytearray()
+    keys: dict[tuple[int, str], int] = {}
+    for pid in pids:
+        sku, name, barcode = products[pid]
+        product_rows += _PRODUCT.pack(pid, *put(sku), *put(name))
+        keys.setdefault((SKU, normalize(sku)), index[pid])
+        if barcode:
+            keys.setdefault((BARCODE, barcode), index[pid])  # duplicate barcodes: lowest ProductId wins
+    for serial, pid in serials.items():
+        if pid in index:
+            keys[(SERIAL, serial)] = index[pid]
+
+    entries = sorted((_hash(kind, key), kind, key, idx) for (kind, key), idx in keys.items())
+    hashes = struct.pack(f"={len(entries)}Q", *(e[0] for e in entries))
+    key_rows = b"".join(_KEY.pack(idx, *put(key), kind) for _, kind, key, idx in entries)
+
+    header = _HEADER.pack(_MAGIC, len(pids), len(entries), version, time.time(), full_at, len(blob))
+    header += b"\0" * (_align8(len(header)) - len(header))
+
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(header)
+        f.write(hashes)
+        f.write(key_rows)
+        f.write(product_rows)
+        f.write(blob)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)  # readers keep their old mapping until they remap
+
+
+# ---------- catalog (per process) ----------
+
+class _FileLock:
+    def __init__(self, path: str):
+        self._path = path
+        self._fd = None
+
+    def __enter__(self):
+        self._fd = os.open(self._path, os.O_CREAT | os.O_RDWR, 0o644)
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        os.close(self._fd)
+        return False
+
+
+def _fetch_changes(since: int | None):
+    """
+    Calls dbo.usp_Catalog_Changes. Returns (watermark, product rows, serial rows).
+    Sets: [watermark], [ProductId, Sku, Name, Barcode], [SerialNumber, ProductId, IsAvailable]
+    """
+    since_bin = since.to_bytes(8, "big") if since else None
+    with db.get_conn() as c:
+        cur = c.cursor()
+        try:
+            cur.execute("EXEC dbo.usp_Catalog_Changes ?", [since_bin])
+            sets = []
+            while True:
+                if cur.description:
+                    sets.append(cur.fetchall())
+                if not cur.nextset():
+                    break
+        finally:
+            cur.close()
+    watermark = int.from_bytes(bytes(sets[0][0][0]), "big")
+    return watermark, sets[1], sets[2]
+
+
+_MISSING = object()
+
+
+class Catalog:
+    def __init__(self, path: str):
+        self.path = path
+        self.delta_path = path + ".delta"
+        self._snap: Snapshot | None = None
+        self._lock = threading.Lock()
+        self._reset_overlay()
+
+    def _reset_overlay(self) -> None:
+        # Delta rows applied on top of the snapshot file (per process)
+        self._over_products: dict[int, tuple[str, str, str | None]] = {}  # pid -> (sku, name, barcode_key)
+        self._over_keys: dict[tuple[int, str], int | None] = {}          # (kind, key) -> pid; None = serial gone
+        self._delta_ident = None
+        self._delta_pos = 0
+        self._delta_ok = False
+        self.delta_rows = 0
+        self.version = self._snap.version if self._snap is not None else 0
+        self.checked_at = self._snap.built_at if self._snap is not None else 0.0
+        self.changes: list[tuple[int, str, str]] = []  # (pid, sku, name) in apply order, for the search index
+
+    @property
+    def snapshot(self) -> Snapshot | None:
+        return self._snap
+
+    # ---- lookups ----
+
+    def _match(self, snap: Snapshot, kind: int, key: str) -> tuple[int, str, str] | None:
+        pid = self._over_keys.get((kind, key), _MISSING)
+        if pid is None:
+            return None  # serial consumed / moved since the file was built
+        if pid is not _MISSING:
+            over = self._over_products.get(pid)
+            return (pid, over[0], over[1]) if over is not None else snap.product_by_id(pid)
+        idx = snap.find(kind, key)
+        if idx is None:
+            return None
+        pid, sku, name = snap._product(idx)
+        over = self._over_products.get(pid)
+        if over is not None:
+            # Changed since the file was built: the key must still belong to it
+            if (kind == SKU and normalize(over[0]) != key) or (kind == BARCODE and over[2] != key):
+                return None
+            sku, name = over[0], over[1]
+        return pid, sku, name
+
+    def lookup(self, code: str, kinds) -> Match | None:
+        snap = self._snap
+        if snap is None:
+            return None
+        key = normalize(code)
+        for kind in kinds:
+            hit = self._match(snap, kind, key)
+            if hit is not None:
+                return Match(hit[0], hit[1], hit[2], code if kind == SERIAL else None)
+        return None
+
+    def is_fresh(self) -> bool:
+        """True when the catalog was checked against the DB recently."""
+        return self._snap is not None and time.time() - self.checked_at <= CATALOG_MAX_STALENESS
+
+    # ---- delta log ----
+
+    def _apply(self, rec: dict) -> None:
+        for pid, sku, name, barcode in rec.get("p", ()):
+            old = self._over_products.get(pid)
+            if old is None:
+                base = self._snap.product_by_id(pid)
+                old = (base[1], base[2], None) if base is not None else None
+            if old is not None:
+                for k in ((SKU, normalize(old[0])), (BARCODE, old[2])):
+                    if self._over_keys.get(k) == pid:
+                        del self._over_keys[k]
+            self._over_products[pid] = (sku, name, barcode)
+            self._over_keys[(SKU, normalize(sku))] = pid
+            if barcode:
+                self._over_keys[(BARCODE, barcode)] = pid
+            self.changes.append((pid, sku, name))
+        for serial, pid, available in rec.get("s", ()):
+            self._over_keys[(SERIAL, serial)] = pid if available else None
+        self.delta_rows += len(rec.get("p", ())) + len(rec.get("s", ()))
+        self.version = rec["v"]
+
+    def _catch_up(self) -> None:
+        try:
+            st = os.stat(self.delta_path)
+        except FileNotFoundError:
+            if self._delta_ident is not None:
+                self._reset_overlay()
+            return
+        ident = (st.st_ino, st.st_dev)
+        if ident != self._delta_ident:
+            self._reset_overlay()
+            self._delta_ident = ident
+        self.checked_at = max(self.checked_at, st.st_mtime)
+        if st.st_size <= self._delta_pos:
+            return
+        with open(self.delta_path, "rb") as f:
+            f.seek(self._delta_pos)
+            data = f.read(st.st_size - self._delta_pos)
+        end = data.rfind(b"\n") + 1  # complete lines only
+        for line in data[:end].splitlines():
+            rec = json.loads(line)
+            if "base" in rec:
+                # Written for another snapshot file (crash between the two replaces): ignore it
+                self._delta_ok = rec["base"] == self._snap.version
+            elif self._delta_ok:
+                self._apply(rec)
+        self._delta_pos += end
+
+    def _remap(self) -> Snapshot | None:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        snap = self._snap
+        if snap is None or snap.ident != (st.st_ino, st.st_mtime_ns):
+            snap = Snapshot(self.path)
+            self._snap = snap  # old mapping is released once in-flight lookups drop it
+            self._reset_overlay()
+        self._catch_up()
+        return snap
+
+    def _write_delta(self, rec: dict, new: bool = False) -> None:
+        line = json.dumps(rec, separators=(",", ":")).encode("utf-8") + b"\n"
+        if new:
+            tmp = f"{self.delta_path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.delta_path)
+            return
+        with open(self.delta_path, "ab") as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+
+    # ---- refresh ----
+
+    def refresh(self, fetch=_fetch_changes, force_full: bool = False) -> Snapshot | None:
+        """Bring the shared snapshot up to date (blocking; run on the DB executor)."""
+        with self._lock, _FileLock(self.path + ".lock"):
+            snap = self._remap()
+            now = time.time()
+            if snap is not None and not force_full and now - self.checked_at < CATALOG_REFRESH_SECONDS / 2:
+                return snap  # another worker refreshed moments ago
+
+            full = (force_full or snap is None or not self._delta_ok
+                    or now - snap.full_at > CATALOG_FULL_EVERY or self.delta_rows > CATALOG_DELTA_MAX)
+            if full:
+                watermark, product_rows, serial_rows = fetch(None)
+                products = {
+                    pid: [sku, name, normalize(barcode) if barcode else None]
+                    for pid, sku, name, barcode in product_rows
+                }
+                serials = {normalize(serial): pid for serial, pid, available in serial_rows if available}
+                write_snapshot(self.path, products, serials, watermark, now)
+                self._write_delta({"base": watermark, "at": now}, new=True)
+                return self._remap()
+
+            watermark, product_rows, serial_rows = fetch(self.version)
+            if product_rows or serial_rows:
+                self._write_delta({
+                    "v": watermark,
+                    "p": [[pid, sku, name, normalize(barcode) if barcode else None]
+                          for pid, sku, name, barcode in product_rows],
+                    "s": [[normalize(serial), pid, bool(available)] for serial, pid, available in serial_rows],
+                })
+            else:
+                os.utime(self.delta_path)  # nothing changed: just record that we checked
+            return self._remap()
+
+
+_catalog = Catalog(CATALOG_PATH)
+
+
+def get_catalog() -> Catalog:
+    return _catalog
+
+
+def lookup(code: str, kinds) -> Match | None:
+    return _catalog.lookup(code, kinds)
+
+
+def is_fresh() -> bool:
+    return _catalog.is_fresh()
+
+
+async def refresh_loop() -> None:
+    """Background task (one per worker): keep the shared snapshot current."""
+    while True:
+        try:
+            await db.run_db(_catalog.refresh, timeout=max(CATALOG_REFRESH_SECONDS, 120))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Catalog refresh failed: {e}")
+        await asyncio.sleep(CATALOG_REFRESH_SECONDS)
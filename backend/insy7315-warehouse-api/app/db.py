@@ -1,8 +1,18 @@
 # app/db.py
 
-import os, pyodbc
+import asyncio, contextlib, functools, os, threading, time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
-def get_conn():
+import pyodbc
+
+from app import metrics
+
+# Pooling is done here; keep the driver manager from stacking its own pool on top.
+pyodbc.pooling = False
+
+
+def _conn_str() -> str:
     driver = os.getenv("ODBC_DRIVER", "ODBC Driver 18 for SQL Server")
     server = os.getenv("AZURE_SQL_SERVER")          # tcp:<server>.database.windows.net
     db     = os.getenv("AZURE_SQL_DB")
@@ -12,16 +22,751 @@ def get_conn():
     if not all([server, db, user, pwd]):
         raise RuntimeError("Missing DB env vars.")
 
-    return pyodbc.connect(
+    return (
         f"DRIVER={{{driver}}};SERVER={server};DATABASE={db};UID={user};PWD={pwd};"
         "Encrypt=yes;TrustServerCertificate=no;Connection Timeout=30;"
     )
 
-def exec_sp(sp_name: str, params: list):
+
+def connect():
+    """Open a brand-new (unpooled) connection."""
+    return pyodbc.connect(_conn_str())
+
+
+# ---------- connection pool ----------
+
+class PoolTimeout(RuntimeError):
+    """No pooled connection became free within the acquire timeout."""
+
+
+class DBTimeout(RuntimeError):
+    """A DB call exceeded its time budget and was cancelled."""
+
+
+class _Slot:
+    __slots__ = ("conn", "created_at", "last_used")
+
+    def __init__(self, conn):
+        now = time.monotonic()
+        self.conn = conn
+        self.created_at = now
+        self.last_used = now
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of DB connections.
+
+    - min_size connections are kept warm; never more than max_size are open.
+    - acquire() blocks up to `timeout` seconds, then raises PoolTimeout.
+    - connections older than max_age or idle longer than max_idle are recycled.
+    - connections idle longer than validate_after are pinged before reuse.
+    """
+
+    def __init__(
+        self,
+        connect,
+        min_size: int = 1,
+        max_size: int = 10,
+        timeout: float = 15.0,
+        max_age: float = 1800.0,
+        max_idle: float = 300.0,
+        validate_after: float = 30.0,
+    ):
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max(max_size, 1)
+        self.timeout = timeout
+        self.max_age = max_age
+        self.max_idle = max_idle
+        self.validate_after = validate_after
+
+        self._cond = threading.Condition()
+        self._idle: deque[_Slot] = deque()   # LIFO: hot connections are reused first
+        self._in_use: dict[int, _Slot] = {}
+        self._opening = 0
+        self._closed = False
+
+        self._created = 0
+        self._recycled = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._timeouts = 0
+
+    # --- internals ---
+
+    def _expired(self, slot: _Slot, now: float) -> bool:
+        return (now - slot.created_at) > self.max_age or (now - slot.last_used) > self.max_idle
+
+    @staticmethod
+    def _alive(conn) -> bool:
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1")
+            cur.fetchone()
+            cur.close()
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _discard(conn) -> None:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _open(self) -> _Slot:
+        try:
+            conn = self._connect()
+        except Exception:
+            with self._cond:
+                self._opening -= 1
+                self._cond.notify()
+            raise
+        slot = _Slot(conn)
+        with self._cond:
+            self._opening -= 1
+            self._created += 1
+            self._in_use[id(conn)] = slot
+        return slot
+
+    # --- public API ---
+
+    def acquire(self):
+        started = time.perf_counter()
+        try:
+            conn = self._acquire()
+        except PoolTimeout:
+            metrics.acquired(started, "timeout")
+            raise
+        except Exception:
+            metrics.acquired(started, "error")
+            raise
+        metrics.acquired(started, "ok")
+        return conn
+
+    def _acquire(self):
+        deadline = None
+        waited_from = None
+        while True:
+            stale = []
+            slot = None
+            with self._cond:
+                if self._closed:
+                    raise RuntimeError("Connection pool is closed.")
+                now = time.monotonic()
+                while self._idle:
+                    candidate = self._idle.pop()
+                    if self._expired(candidate, now):
+                        stale.append(candidate)
+                        self._recycled += 1
+                        continue
+                    slot = candidate
+                    self._in_use[id(slot.conn)] = slot
+                    break
+
+                must_open = False
+                if slot is None:
+                    if len(self._in_use) + self._opening < self.max_size:
+                        self._opening += 1
+                        must_open = True
+                    else:
+                        if waited_from is None:
+                            waited_from = now
+                            deadline = now + self.timeout
+                            self._waits += 1
+                        remaining = deadline - now
+                        if remaining <= 0:
+                            self._timeouts += 1
+                            self._wait_time += now - waited_from
+                            raise PoolTimeout(
+                                f"Timed out after {self.timeout:.1f}s waiting for a DB connection."
+                            )
+                        self._cond.wait(remaining)
+
+            for s in stale:
+                self._discard(s.conn)
+
+            if slot is None and not must_open:
+                continue  # woke up from wait(); try again
+
+            if waited_from is not None:
+                with self._cond:
+                    self._wait_time += time.monotonic() - waited_from
+
+            if must_open:
+                return self._open().conn
+
+            # Validate connections that sat idle for a while before handing them out
+            if time.monotonic() - slot.last_used > self.validate_after and not self._alive(slot.conn):
+                with self._cond:
+                    self._in_use.pop(id(slot.conn), None)
+                    self._recycled += 1
+                    self._opening += 1
+                self._discard(slot.conn)
+                return self._open().conn
+
+            return slot.conn
+
+    def release(self, conn, broken: bool = False) -> None:
+        with self._cond:
+            slot = self._in_use.pop(id(conn), None)
+            if slot is None:
+                # Not ours (or already released) — just close it
+                keep = False
+            else:
+                slot.last_used = time.monotonic()
+                keep = not (broken or self._closed or self._expired(slot, slot.last_used))
+                if keep:
+                    self._idle.append(slot)
+                else:
+                    self._recycled += 1
+            self._cond.notify()
+        if not keep:
+            self._discard(conn)
+
+    def warm(self) -> None:
+        """Open connections up to min_size (best effort)."""
+        conns = []
+        try:
+            while True:
+                with self._cond:
+                    if len(self._idle) + len(self._in_use) >= self.min_size:
+                        break
+                conns.append(self.acquire())
+        finally:
+            for c in conns:
+                self.release(c)
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._cond.notify_all()
+        for s in idle:
+            self._discard(s.conn)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "in_use": len(self._in_use),
+                "idle": len(self._idle),
+                "opening": self._opening,
+                "created": self._created,
+                "recycled": self._recycled,
+                "waits": self._waits,
+                "wait_time_ms": round(self._wait_time * 1000, 3),
+                "timeouts": self._timeouts,
+                "closed": self._closed,
+            }
+
+
+_pool: ConnectionPool | None = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    connect,
+                    min_size=int(os.getenv("DB_POOL_MIN", "1")),
+                    max_size=int(os.getenv("DB_POOL_MAX", "10")),
+                    timeout=float(os.getenv("DB_POOL_TIMEOUT", "15")),
+                    max_age=float(os.getenv("DB_POOL_MAX_AGE", "1800")),
+                    max_idle=float(os.getenv("DB_POOL_MAX_IDLE", "300")),
+                    validate_after=float(os.getenv("DB_POOL_VALIDATE_AFTER", "30")),
+                )
+    return _pool
+
+
+def close_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+def pool_stats() -> dict:
+    return get_pool().stats()
+
+
+@metrics.collector
+def _pool_metrics():
+    if _pool is None:
+        return []
+    s = _pool.stats()
+    return [
+        ("db_pool_in_use", "gauge", "Pooled connections handed out.", s["in_use"]),
+        ("db_pool_idle", "gauge", "Pooled connections idle.", s["idle"]),
+        ("db_pool_max", "gauge", "Pool size limit.", s["max_size"]),
+        ("db_pool_waits_total", "counter", "Acquires that had to wait.", s["waits"]),
+        ("db_pool_timeouts_total", "counter", "Acquires that timed out.", s["timeouts"]),
+        ("db_pool_recycled_total", "counter", "Connections closed for age, idleness or errors.", s["recycled"]),
+    ]
+
+
+class _PooledConnection:
+    """
+    `with get_conn() as c:` — borrows a pooled connection.
+    Commits on success, rolls back on error, then hands the connection back.
+    """
+
+    def __init__(self, pool: ConnectionPool):
+        self._pool = pool
+        self._conn = None
+
+    def __enter__(self):
+        self._conn = self._pool.acquire()
+        return self._conn
+
+    def __exit__(self, exc_type, exc, tb):
+        conn, self._conn = self._conn, None
+        broken = False
+        try:
+            if exc_type is None:
+                conn.commit()
+            else:
+                conn.rollback()
+        except Exception:
+            broken = True
+        if isinstance(exc, (pyodbc.OperationalError, pyodbc.InterfaceError)):
+            broken = True  # link-level failure: don't hand this connection out again
+        self._pool.release(conn, broken=broken)
+        return False
+
+
+def get_conn():
+    return _PooledConnection(get_pool())
+
+
+class _Call:
+    """Tracks the cursor of an in-flight call so another thread can cancel it."""
+
+    __slots__ = ("cursor", "cancelled")
+
+    def __init__(self):
+        self.cursor = None
+        self.cancelled = False
+
+    def attach(self, cur) -> None:
+        self.cursor = cur
+        if self.cancelled:
+            raise DBTimeout("DB call cancelled before it started.")
+
+    def cancel(self) -> None:
+        self.cancelled = True
+        cur = self.cursor
+        if cur is not None:
+            try:
+                cur.cancel()  # SQLCancel: aborts the running statement server-side
+            except Exception:
+                pass
+
+
+def _exec(cur, sp_name: str, params: list) -> None:
+    placeholders = ",".join(["?"] * len(params))
+    cur.execute(f"EXEC {sp_name} {placeholders}", params)
+
+
+def exec_sp(sp_name: str, params: list, _call: _Call | None = None):
     with get_conn() as c:
         cur = c.cursor()
-        placeholders = ",".join(["?"] * len(params))
-        cur.execute(f"EXEC {sp_name} {placeholders}", params)
-        cols = [d[0] for d in cur.description] if cur.description else []
-        rows = [dict(zip(cols, r)) for r in cur.fetchall()] if cur.description else []
-        return rows
\ No newline at end of file
+        started, rows, error = metrics.sp_started(), [], None
+        try:
+            if _call is not None:
+                _call.attach(cur)
+            _exec(cur, sp_name, params)
+            cols = [d[0] for d in cur.description] if cur.description else []
+            rows = [dict(zip(cols, r)) for r in cur.fetchall()] if cur.description else []
+            return rows
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            metrics.sp_finished(sp_name, started, len(rows), error)
+            cur.close()  # free the statement before the connection goes back to the pool
+
+
+# ---------- async execution lane ----------
+# pyodbc is blocking, so DB work runs on its own bounded executor rather than the
+# shared Starlette threadpool. Slow SQL then queues here and never starves /healthz
+# or other cheap endpoints.
+
+_executor: ThreadPoolExecutor | None = None
+_executor_lock = threading.Lock()
+
+DB_CALL_TIMEOUT = float(os.getenv("DB_CALL_TIMEOUT", "30"))
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                # One worker per pooled connection: workers never queue on the pool itself
+                workers = int(os.getenv("DB_EXECUTOR_WORKERS", os.getenv("DB_POOL_MAX", "10")))
+                _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="db")
+    return _executor
+
+
+def close_executor() -> None:
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+async def run_db(fn, *args, timeout: float | None = None, _call: _Call | None = None):
+    """
+    Run blocking DB work `fn(*args)` on the DB executor.
+    On timeout (or if the awaiting task is cancelled) the running statement is
+    cancelled via `_call` and DBTimeout / CancelledError is raised.
+    """
+    loop = asyncio.get_running_loop()
+    fut = loop.run_in_executor(get_executor(), functools.partial(fn, *args))
+    try:
+        return await asyncio.wait_for(fut, timeout if timeout is not None else DB_CALL_TIMEOUT)
+    except asyncio.TimeoutError:
+        if _call is not None:
+            _call.cancel()
+        raise DBTimeout(f"DB call exceeded {timeout or DB_CALL_TIMEOUT:.1f}s.")
+    except asyncio.CancelledError:
+        if _call is not None:
+            _call.cancel()
+        raise
+
+
+async def exec_sp_async(sp_name: str, params: list, timeout: float | None = None):
+    call = _Call()
+    return await run_db(exec_sp, sp_name, params, call, timeout=timeout, _call=call)
+
+
+def exec_sp_sets(sp_name: str, params: list, _call: _Call | None = None) -> list:
+    """
+    Every result set of a proc as lists of dict rows (column-less DML counts
+    skipped). For procs whose sets are small and bounded: the rows are read,
+    the work is committed and the connection is back in the pool before the
+    caller starts responding.
+    """
+    with get_conn() as c:
+        cur = c.cursor()
+        started, sets, error = metrics.sp_started(), [], None
+        try:
+            if _call is not None:
+                _call.attach(cur)
+            _exec(cur, sp_name, params)
+            while True:
+                if cur.description:
+                    cols = [d[0] for d in cur.description]
+                    sets.append([dict(zip(cols, r)) for r in cur.fetchall()])
+                if not cur.nextset():
+                    return sets
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            metrics.sp_finished(sp_name, started, sum(len(s) for s in sets), error)
+            cur.close()
+
+
+async def exec_sp_sets_async(sp_name: str, params: list, timeout: float | None = None) -> list:
+    call = _Call()
+    return await run_db(exec_sp_sets, sp_name, params, call, timeout=timeout, _call=call)
+
+
+# ---------- unit of work (one connection per request) ----------
+
+_ISOLATION_LEVELS = ("READ COMMITTED", "REPEATABLE READ", "SNAPSHOT", "SERIALIZABLE")
+
+
+class DBSession:
+    """
+    One pooled connection for a whole request: every exec_sp() on the session
+    runs on it, in call order, so a multi-step endpoint acquires once.
+
+    Outside a transaction each call commits on its own (same as exec_sp_async).
+    `async with session.transaction():` groups calls: committed together when
+    the block exits cleanly, rolled back when it raises. Blocks nest; only the
+    outermost one commits. `isolation=` raises the isolation level for the
+    block (reset before the connection goes back to the pool).
+
+    Use it through the db_session dependency, which hands the connection back
+    (rolling back anything unfinished) when the request ends.
+    """
+
+    def __init__(self, pool: ConnectionPool | None = None):
+        self._pool = pool
+        self._conn = None
+        self._depth = 0
+        self._isolation: str | None = None
+        self._broken = False
+        self._lock = asyncio.Lock()  # one statement at a time on the connection
+        self.calls = 0
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = (self._pool or get_pool()).acquire()
+        return self._conn
+
+    def _run(self, sp_name: str, params: list, call: _Call, all_sets: bool = False):
+        conn = self._connection()
+        cur = conn.cursor()
+        started, sets, error = metrics.sp_started(), [], None
+        try:
+            call.attach(cur)
+            _exec(cur, sp_name, params)
+            while True:
+                if cur.description:
+                    cols = [d[0] for d in cur.description]
+                    sets.append([dict(zip(cols, r)) for r in cur.fetchall()])
+                if not all_sets or not cur.nextset():
+                    break
+        except Exception as e:
+            error = e
+            if self._depth == 0:
+                conn.rollback()
+            raise
+        finally:
+            metrics.sp_finished(sp_name, started, sum(len(s) for s in sets), error)
+            cur.close()
+        if self._depth == 0:
+            conn.commit()
+        if all_sets:
+            return sets
+        return sets[0] if sets else []
+
+    def _statement(self, sql: str) -> None:
+        cur = self._connection().cursor()
+        try:
+            cur.execute(sql)
+        finally:
+            cur.close()
+
+    def _end(self, commit: bool) -> None:
+        conn = self._conn
+        if conn is None:
+            return
+        if commit:
+            conn.commit()
+        else:
+            conn.rollback()
+        if self._isolation is not None:
+            self._isolation = None
+            self._statement("SET TRANSACTION ISOLATION LEVEL READ COMMITTED")
+
+    async def exec_sp(self, sp_name: str, params: list, timeout: float | None = None):
+        return await self._call(sp_name, params, timeout, False)
+
+    async def exec_sp_sets(self, sp_name: str, params: list, timeout: float | None = None) -> list:
+        """Like exec_sp_sets(), on the session's connection."""
+        return await self._call(sp_name, params, timeout, True)
+
+    async def _call(self, sp_name: str, params: list, timeout: float | None, all_sets: bool):
+        if self._broken:
+            raise RuntimeError("DB session is unusable after a failed or cancelled call.")
+        async with self._lock:
+            call = _Call()
+            self.calls += 1
+            try:
+                return await run_db(self._run, sp_name, params, call, all_sets, timeout=timeout, _call=call)
+            except (DBTimeout, asyncio.CancelledError, pyodbc.OperationalError, pyodbc.InterfaceError):
+                self._broken = True  # the statement may still be unwinding on this connection
+                raise
+
+    @contextlib.asynccontextmanager
+    async def transaction(self, isolation: str | None = None):
+        if isolation is not None:
+            if isolation not in _ISOLATION_LEVELS:
+                raise ValueError(f"Unknown isolation level: {isolation}")
+            if self._depth == 0:
+                async with self._lock:
+                    await run_db(self._statement, f"SET TRANSACTION ISOLATION LEVEL {isolation}")
+                self._isolation = isolation
+        self._depth += 1
+        try:
+            yield self
+        except BaseException:
+            self._depth -= 1
+            if self._depth == 0 and not self._broken:
+                async with self._lock:
+                    await run_db(self._end, False)
+            raise
+        self._depth -= 1
+        if self._depth == 0:
+            async with self._lock:
+                await run_db(self._end, True)
+
+    def _close(self, failed: bool) -> None:
+        conn = self._conn
+        if conn is None:
+            return
+        broken = self._broken
+        if not broken:
+            try:
+                if self._depth or self._isolation is not None:
+                    self._depth = 0
+                    self._end(commit=False)  # a transaction was left open: don't keep half of it
+                elif failed:
+                    conn.rollback()
+                else:
+                    conn.commit()
+            except Exception:
+                broken = True
+        self._conn = None
+        (self._pool or get_pool()).release(conn, broken=broken)
+
+    async def close(self, failed: bool = False) -> None:
+        if self._conn is not None:
+            await run_db(self._close, failed)
+
+
+async def db_session():
+    """FastAPI dependency: `session: DBSession = Depends(db_session)`."""
+    session = DBSession()
+    try:
+        yield session
+    except BaseException:
+        await session.close(failed=True)
+        raise
+    await session.close()
+
+
+# ---------- streaming multi-result-set executor ----------
+
+DB_FETCH_BATCH = int(os.getenv("DB_FETCH_BATCH", "500"))
+
+
+class SPStream:
+    """
+    Walks the result sets of a stored procedure lazily, on one pooled connection.
+
+    Rows come back as pyodbc.Row (tuple-like, plus attribute access by column
+    name, e.g. row.Sku) and are pulled `batch_size` at a time with fetchmany,
+    so no per-row dicts are built and memory stays flat however many rows the
+    proc returns. Result sets without columns (DML counts) are skipped.
+
+        async with stream_sp("dbo.usp_Stock_Finish", [id]) as sp:
+            header = await sp.fetchone()
+            await sp.next_set()
+            async for batch in sp.batches(): ...
+    """
+
+    def __init__(self, sp_name: str, params: list, batch_size: int | None = None):
+        self.sp_name = sp_name
+        self.params = params
+        self.batch_size = batch_size or DB_FETCH_BATCH
+        self.columns: tuple[str, ...] | None = None   # None once the sets run out
+        self.fetched = 0                               # rows fetched from the current set
+        self._rows = 0                                 # ... and from all sets, for metrics
+        self._started = None
+        self._cm = None
+        self._cur = None
+        self._call = _Call()
+
+    # --- blocking parts (run on the DB executor) ---
+
+    def _skip_empty(self) -> None:
+        cur = self._cur
+        while not cur.description:
+            if not cur.nextset():
+                self.columns = None
+                return
+        self.columns = tuple(d[0] for d in cur.description)
+        self.fetched = 0
+
+    def _open(self) -> None:
+        self._cm = get_conn()
+        conn = self._cm.__enter__()
+        self._started = metrics.sp_started()
+        try:
+            self._cur = conn.cursor()
+            self._call.attach(self._cur)
+            _exec(self._cur, self.sp_name, self.params)
+            self._skip_empty()
+        except BaseException as e:
+            self._close(type(e), e)
+            raise
+
+    def _fetch(self, n: int) -> list:
+        if self.columns is None:
+            return []
+        rows = self._cur.fetchmany(n)
+        self.fetched += len(rows)
+        self._rows += len(rows)
+        return rows
+
+    def _next_set(self) -> bool:
+        if self.columns is None:
+            return False
+        if not self._cur.nextset():
+            self.columns = None
+            return False
+        self._skip_empty()
+        return self.columns is not None
+
+    def _close(self, exc_type=None, exc=None) -> None:
+        cur, self._cur = self._cur, None
+        cm, self._cm = self._cm, None
+        if self._started is not None:
+            db_error = exc if isinstance(exc, (pyodbc.Error, DBTimeout)) else None  # not the consumer's own errors
+            metrics.sp_finished(self.sp_name, self._started, self._rows, db_error)
+            self._started = None
+        if cur is not None:
+            try:
+                cur.close()
+            except Exception:
+                pass
+        if cm is not None:
+            cm.__exit__(exc_type, exc, None)
+
+    # --- async API ---
+
+    async def open(self) -> "SPStream":
+        await run_db(self._open, _call=self._call)
+        return self
+
+    async def fetch(self, n: int | None = None) -> list:
+        return await run_db(self._fetch, n or self.batch_size, _call=self._call)
+
+    async def fetchone(self):
+        rows = await self.fetch(1)
+        return rows[0] if rows else None
+
+    async def batches(self):
+        """Yield the remaining rows of the current set, one fetchmany batch at a time."""
+        while True:
+            rows = await self.fetch()
+            if not rows:
+                return
+            yield rows
+
+    async def next_set(self) -> bool:
+        return await run_db(self._next_set, _call=self._call)
+
+    async def close(self, exc_type=None, exc=None) -> None:
+        if self._cm is None:
+            return
+        # Submitted directly and shielded: the connection must go back to the
+        # pool even if the awaiting task (e.g. a dropped client) is cancelled.
+        fut = get_executor().submit(self._close, exc_type, exc)
+        await asyncio.shield(asyncio.wrap_future(fut))
+
+    async def __aenter__(self) -> "SPStream":
+        return await self.open()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close(exc_type, exc)
+        return False
+
+
+def stream_sp(sp_name: str, params: list, batch_size: int | None = None) -> SPStream:
+    return SPStream(sp_name, params, batch_size)
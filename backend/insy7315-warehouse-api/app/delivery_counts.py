@@ -0,0 +1,82 @@
+# app/delivery_counts.py
+#
+# Dashboard counters (Total / ToLoad / Loaded / Delivered) kept in the API.
+# Every dispatcher tablet polls /delivery/list; instead of a full-table
+# aggregate per poll, the counts are loaded once, adjusted by the status
+# transitions this worker performs, and reconciled with dbo.usp_Delivery_Counts
+# at most every DELIVERY_COUNTS_TTL seconds (which also picks up transitions
+# made by other workers or by packing seal).
+
+import asyncio, os, time
+from typing import Dict, Optional
+
+from app.db import exec_sp_async
+
+DELIVERY_COUNTS_TTL = float(os.getenv("DELIVERY_COUNTS_TTL", "15"))
+
+_FIELDS = {"To Load": "ToLoad", "Loaded": "Loaded", "Delivered": "Delivered"}
+
+_counts: Optional[Dict[str, int]] = None
+_loaded_at = 0.0
+_writes = 0          # transitions applied since start; a reconcile racing one is redone
+_lock = asyncio.Lock()
+_stats = {"hits": 0, "reconciles": 0, "drift": 0}
+
+
+async def reconcile() -> Dict[str, int]:
+    global _counts, _loaded_at
+    seen = _writes
+    rows = await exec_sp_async("dbo.usp_Delivery_Counts", [])
+    r = rows[0] if rows else {}
+    fresh = {k: int(r.get(k) or 0) for k in ("Total", "ToLoad", "Loaded", "Delivered")}
+    _stats["reconciles"] += 1
+    if _counts is not None and _counts != fresh and _writes == seen:
+        _stats["drift"] += 1  # other workers / seal moved something since the last load
+    _counts = fresh
+    # A transition landed while we were reading: it may or may not be in `fresh`
+    _loaded_at = time.monotonic() if _writes == seen else 0.0
+    return dict(fresh)
+
+
+async def get() -> Dict[str, int]:
+    if _counts is not None and time.monotonic() - _loaded_at <= DELIVERY_COUNTS_TTL:
+        _stats["hits"] += 1
+        return dict(_counts)
+    async with _lock:  # one reconcile per worker, however many pollers are waiting
+        if _counts is not None and time.monotonic() - _loaded_at <= DELIVERY_COUNTS_TTL:
+            _stats["hits"] += 1
+            return dict(_counts)
+        return await reconcile()
+
+
+def apply(prev_status: Optional[str], new_status: Optional[str]) -> None:
+    """Adjust the counters for one package moving prev_status -> new_status."""
+    global _writes
+    _writes += 1
+    if _counts is None or prev_status == new_status:
+        return
+    if prev_status is None:
+        invalidate()  # don't know where it came from; let the DB say
+        return
+    if prev_status in _FIELDS:
+        _counts[_FIELDS[prev_status]] -= 1
+    if new_status in _FIELDS:
+        _counts[_FIELDS[new_status]] += 1
+
+
+def invalidate() -> None:
+    """Force a reconcile on the next read (e.g. packages created elsewhere)."""
+    global _loaded_at, _writes
+    _writes += 1
+    _loaded_at = 0.0
+
+
+def stats() -> Dict[str, object]:
+    return {"counts": _counts, "age_s": round(time.monotonic() - _loaded_at, 1) if _counts else None, **_stats}
+
+
+def reset() -> None:
+    global _counts, _loaded_at, _writes, _lock
+    _counts, _loaded_at, _writes = None, 0.0, 0
+    _lock = asyncio.Lock()
+    _stats.update(hits=0, reconciles=0, drift=0)
@@ -1,13 +1,58 @@
 # app/deps.py
 import os
+from typing import NamedTuple, Optional
+
+import jwt
 from fastapi import HTTPException, Security
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from fastapi.security.api_key import APIKeyHeader
 
+from app.security import verify_token
+
 API_KEY = os.getenv("API_KEY", "dev-key")
 API_KEY_NAME = "X-API-Key"
 
+# "1": every picking/packing/stock call must carry a bearer token.
+# "0" (default): tokens are verified when sent; older app builds without one
+# still work and pass userId explicitly.
+AUTH_REQUIRE_BEARER = os.getenv("AUTH_REQUIRE_BEARER", "0") == "1"
+
 _api_key_header = APIKeyHeader(name=API_KEY_NAME, auto_error=False)
+_bearer = HTTPBearer(auto_error=False)
 
 def require_key(x_api_key: str | None = Security(_api_key_header)):
     if not API_KEY or x_api_key != API_KEY:
-        raise HTTPException(status_code=401, detail="Unauthorized")
\ No newline at end of file
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+class CurrentUser(NamedTuple):
+    user_id: int
+    email: str
+    name: str
+    role: str
+
+def _unauthorized(detail: str):
+    return HTTPException(status_code=401, detail=detail, headers={"WWW-Authenticate": "Bearer"})
+
+async def current_user(
+    creds: HTTPAuthorizationCredentials | None = Security(_bearer),
+) -> Optional[CurrentUser]:
+    # async on purpose: a cache hit is a dict lookup, not worth a threadpool hop
+    if creds is None:
+        if AUTH_REQUIRE_BEARER:
+            raise _unauthorized("Bearer token required")
+        return None
+    try:
+        claims = verify_token(creds.credentials)
+    except jwt.ExpiredSignatureError:
+        raise _unauthorized("Token expired")
+    except jwt.InvalidTokenError:
+        raise _unauthorized("Invalid token")
+    return CurrentUser(int(claims["sub"]), claims.get("email"), claims.get("name"), claims.get("role", "User"))
+
+def resolve_user_id(user: Optional[CurrentUser], user_id: Optional[int]) -> int:
+    """The caller's id: from the token when present, else the legacy query param."""
+    if user is not None:
+        return user.user_id
+    if user_id is None:
+        raise HTTPException(status_code=400, detail="userId is required without a bearer token")
+    return user_id
@@ -0,0 +1,111 @@
+# app/events.py
+#
+# In-process event bus behind the push feeds (/events/stream).
+#
+# Mutation endpoints publish small status-change events ("delivery",
+# "staging"); every connected client holds a bounded queue. The last
+# EVENTS_BUFFER events are kept so a reconnecting client can send its last
+# event id (resume token) and get only what it missed. A token from another
+# process (restart, other worker) or one that fell out of the buffer can't be
+# resumed: the client is told to reset, i.e. reload once and carry on.
+#
+# The bus is per process: run the feed on one worker or with sticky sessions.
+
+import asyncio, os, secrets, time
+from collections import deque
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional
+
+EVENTS_BUFFER = int(os.getenv("EVENTS_BUFFER", "2000"))
+EVENTS_QUEUE = int(os.getenv("EVENTS_QUEUE", "500"))
+
+TOPICS = ("delivery", "staging")
+
+
+class Event(NamedTuple):
+    seq: int
+    topic: str
+    data: Dict[str, Any]
+    at: float
+
+
+class Subscription:
+    def __init__(self, topics: Iterable[str]):
+        self.topics = frozenset(topics)
+        self.queue: "asyncio.Queue[Event]" = asyncio.Queue(maxsize=EVENTS_QUEUE)
+        self.overflowed = False  # client too slow: it gets a reset instead of a gap
+
+
+class EventBus:
+    def __init__(self, size: int = EVENTS_BUFFER):
+        self.boot = secrets.token_hex(4)
+        self._seq = 0
+        self._buf: "deque[Event]" = deque(maxlen=size)
+        self._subs: set[Subscription] = set()
+        self.published = 0
+        self.dropped = 0
+
+    def token(self, seq: int) -> str:
+        return f"{self.boot}-{seq}"
+
+    def publish(self, topic: str, data: Dict[str, Any]) -> Event:
+        self._seq += 1
+        event = Event(self._seq, topic, data, time.time())
+        self._buf.append(event)
+        self.published += 1
+        for sub in self._subs:
+            if topic not in sub.topics or sub.overflowed:
+                continue
+            try:
+                sub.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                sub.overflowed = True
+                self.dropped += 1
+        return event
+
+    def since(self, token: str, topics: Iterable[str]) -> Optional[List[Event]]:
+        """Events after `token`, or None when the token can't be resumed here."""
+        boot, _, seq = token.rpartition("-")
+        if boot != self.boot or not seq.isdigit() or int(seq) > self._seq:
+            return None
+        seq = int(seq)
+        if self._buf and seq < self._buf[0].seq - 1:
+            return None  # the gap already left the buffer
+        topics = frozenset(topics)
+        return [e for e in self._buf if e.seq > seq and e.topic in topics]
+
+    def subscribe(self, topics: Iterable[str]) -> Subscription:
+        sub = Subscription(topics)
+        self._subs.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        self._subs.discard(sub)
+
+    @property
+    def last_token(self) -> str:
+        return self.token(self._seq)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "subscribers": len(self._subs),
+            "published": self.published,
+            "dropped": self.dropped,
+            "buffered": len(self._buf),
+            "last": self.last_token,
+        }
+
+
+_bus = EventBus()
+
+
+def get_bus() -> EventBus:
+    return _bus
+
+
+def publish(topic: str, data: Dict[str, Any]) -> None:
+    _bus.publish(topic, data)
+
+
+def reset() -> None:
+    global _bus
+    _bus = EventBus()
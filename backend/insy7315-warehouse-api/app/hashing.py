@@ -0,0 +1,97 @@
+# app/hashing.py
+#
+# Argon2 is memory-hard by design, so a burst of logins (shift change) would pin
+# every request thread. Hashing runs in a small dedicated process pool instead,
+# and admission is capped: once HASH_WORKERS are busy and HASH_MAX_QUEUE calls
+# are waiting, new calls fail fast with HashBusy (mapped to 503 + Retry-After).
+
+import asyncio, multiprocessing, os, time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Optional, Tuple
+
+from app import security
+
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", "2"))
+HASH_MAX_QUEUE = int(os.getenv("HASH_MAX_QUEUE", "16"))
+
+
+class HashBusy(RuntimeError):
+    """Too many hash/verify calls in flight."""
+
+
+_executor: Optional[ProcessPoolExecutor] = None
+_inflight = 0
+_stats: Dict[str, Any] = {"rejected": 0, "peak_inflight": 0}
+_ops: Dict[str, Dict[str, float]] = {}
+
+
+def get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # spawn: the parent runs DB threads, which don't survive a fork cleanly
+        _executor = ProcessPoolExecutor(
+            max_workers=HASH_WORKERS, mp_context=multiprocessing.get_context("spawn")
+        )
+    return _executor
+
+
+def close_executor() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def _record(op: str, elapsed_ms: float, ok: bool) -> None:
+    m = _ops.setdefault(op, {"calls": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0, "last_ms": 0.0})
+    m["calls"] += 1
+    m["errors"] += 0 if ok else 1
+    m["total_ms"] += elapsed_ms
+    m["max_ms"] = max(m["max_ms"], elapsed_ms)
+    m["last_ms"] = elapsed_ms
+
+
+async def _submit(op: str, fn, *args):
+    global _inflight
+    if _inflight >= HASH_WORKERS + HASH_MAX_QUEUE:
+        _stats["rejected"] += 1
+        raise HashBusy("Too many sign-ins in progress, please retry.")
+
+    _inflight += 1
+    _stats["peak_inflight"] = max(_stats["peak_inflight"], _inflight)
+    start, ok = time.perf_counter(), False
+    try:
+        result = await asyncio.wrap_future(get_executor().submit(fn, *args))
+        ok = True
+        return result
+    except BrokenProcessPool:
+        close_executor()  # a worker died; start a fresh pool on the next call
+        raise
+    finally:
+        _inflight -= 1
+        _record(op, (time.perf_counter() - start) * 1000, ok)
+
+
+async def hash_password(password: str) -> str:
+    return await _submit("hash", security.hash_password, password)
+
+
+async def verify_password(password: str, password_hash: str) -> Tuple[bool, Optional[str]]:
+    """(ok, new_hash) — see security.verify_and_update."""
+    return await _submit("verify", security.verify_and_update, password, password_hash)
+
+
+def stats() -> Dict[str, Any]:
+    ops = {
+        op: {**m, "avg_ms": round(m["total_ms"] / m["calls"], 2) if m["calls"] else 0.0}
+        for op, m in _ops.items()
+    }
+    return {
+        "workers": HASH_WORKERS,
+        "max_queue": HASH_MAX_QUEUE,
+        "inflight": _inflight,
+        "queued": max(0, _inflight - HASH_WORKERS),
+        **_stats,
+        "ops": ops,
+    }
@@ -2,10 +2,14 @@
 from dotenv import load_dotenv
 load_dotenv()  # Load environment variables from .env at startup
 
-import os
-from fastapi import FastAPI
+import asyncio, os
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from app.routers import auth, picking, packing, delivery, stock, dbdiag, pack_staging
+from fastapi.responses import JSONResponse
+from app import catalog, db, hashing, metrics, product_search, stock_buffer
+from app.responses import FastJSONResponse
+from app.routers import auth, picking, packing, delivery, stock, dbdiag, pack_staging, events
+from app.routers import metrics as metrics_router
 
 
 # Initialize FastAPI app
@@ -16,6 +20,7 @@ app = FastAPI(
         "Backend service for storeroom operations: "
         "authentication, picking, packing, delivery, and stock-taking."
     ),
+    default_response_class=FastJSONResponse,  # orjson when installed
 )
 
 # Enable CORS (allow everything during development)
@@ -26,9 +31,34 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request latency / in-flight for /metrics (outermost, so it sees every response)
+app.add_middleware(metrics.MetricsMiddleware)
+
+# Pool exhausted: tell the client to back off instead of surfacing a 500
+@app.exception_handler(db.PoolTimeout)
+async def pool_timeout_handler(request: Request, exc: db.PoolTimeout):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Database busy, please retry."},
+        headers={"Retry-After": "1"},
+    )
+
+
+# DB call ran past its budget and was cancelled
+@app.exception_handler(db.DBTimeout)
+async def db_timeout_handler(request: Request, exc: db.DBTimeout):
+    return JSONResponse(status_code=504, content={"detail": str(exc)})
+
+
+# Hashing pool saturated (login burst): fail fast, the device retries
+@app.exception_handler(hashing.HashBusy)
+async def hash_busy_handler(request: Request, exc: hashing.HashBusy):
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "2"})
+
+
 # Health check endpoint
 @app.get("/healthz")
-def healthz():
+async def healthz():
     return {"ok": True, "env": "batcave"}
 
 
@@ -40,6 +70,8 @@ app.include_router(pack_staging.router)  # new staging bridge between picking &
 app.include_router(delivery.router)
 app.include_router(stock.router)
 app.include_router(dbdiag.router)
+app.include_router(events.router)  # push feeds (SSE)
+app.include_router(metrics_router.router)  # Prometheus scrape
 
 
 # Startup event
@@ -48,5 +80,40 @@ async def startup_event():
     api_key = os.getenv("API_KEY", "")
     masked_key = api_key[:4] + "****" if api_key else "(missing)"
     print("WarehouseOps API started. Environment: batcave")
-    print("Routers loaded: auth, picking, packing, pack_staging, delivery, stock, dbdiag")
-    print(f"Loaded API_KEY: {masked_key}")
\ No newline at end of file
+    print("Routers loaded: auth, picking, packing, pack_staging, delivery, stock, dbdiag, events, metrics")
+    print(f"Loaded API_KEY: {masked_key}")
+
+    # Open the minimum number of pooled DB connections up front (best effort)
+    try:
+        db.get_pool().warm()
+    except Exception as e:
+        print(f"DB pool warm-up skipped: {e}")
+
+    # Keep the shared product catalog fresh (scan endpoints resolve codes from it)
+    if os.getenv("CATALOG_ENABLED", "1") == "1":
+        app.state.catalog_task = asyncio.create_task(catalog.refresh_loop())
+        # Product search index for stock-take type-ahead (follows the catalog)
+        if product_search.SEARCH_INDEX_ENABLED:
+            app.state.search_task = asyncio.create_task(product_search.sync_loop())
+
+    # Optional write-behind for /stock/add (replays the local count log)
+    app.state.stock_task = stock_buffer.start()
+
+
+# Shutdown event
+@app.on_event("shutdown")
+async def shutdown_event():
+    task = getattr(app.state, "catalog_task", None)
+    if task is not None:
+        task.cancel()
+    task = getattr(app.state, "search_task", None)
+    if task is not None:
+        task.cancel()
+    task = getattr(app.state, "stock_task", None)
+    if task is not None:
+        task.cancel()
+    await stock_buffer.stop()
+    hashing.close_executor()
+    db.close_executor()
+    db.close_pool()
+    print("WarehouseOps API stopped. DB pool closed.")
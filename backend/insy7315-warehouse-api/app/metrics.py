@@ -0,0 +1,224 @@
+# app/metrics.py
+#
+# Prometheus metrics in the text exposition format (GET /metrics), without a
+# client library: a handful of counters / gauges / histograms kept in this
+# process and rendered on scrape.
+#
+#   http_request_duration_seconds{method,route,status}   per route template
+#   http_requests_in_flight                              requests being served
+#   db_sp_duration_seconds{sp}, db_sp_rows_total{sp}     every exec_sp / stream_sp / session call
+#   db_sp_errors_total{sp,number}                        by SQL error number (51012, 52012, ...)
+#   db_calls_in_flight, db_pool_acquire_seconds          plus the pool counters
+#
+# Recording is a perf_counter pair, a bisect and a short lock per observation
+# (a few microseconds per DB call, next to a millisecond round trip), so the
+# scan endpoints don't notice it. Counters are per worker process: scrape each
+# worker, or run one. METRICS_ENABLED=0 turns recording (and the middleware) off.
+
+import bisect, os, re, threading, time
+from typing import Callable, Dict, Iterable, List, Tuple
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+ACQUIRE_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 15.0)
+
+
+def _escape(v: str) -> str:
+    return v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _num(v: float) -> str:
+    return str(int(v)) if float(v).is_integer() else repr(float(v))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name, self.help, self.labels = name, help, labels
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        super().__init__(name, help, labels)
+        self._values: Dict[tuple, float] = {} if labels else {(): 0}  # unlabelled: always exported
+
+    def inc(self, labels: tuple = (), n: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + n
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self._header() + [f"{self.name}{_labels(self.labels, k)} {_num(v)}" for k, v in items]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values = {} if self.labels else {(): 0}
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, labels: tuple = (), n: float = 1) -> None:
+        self.inc(labels, -n)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        self._series: Dict[tuple, list] = {}  # labels -> [per-bucket counts (+Inf last), sum]
+
+    def observe(self, labels: tuple, value: float) -> None:
+        i = bisect.bisect_left(self.buckets, value)  # first bucket with le >= value
+        with self._lock:
+            s = self._series.get(labels)
+            if s is None:
+                s = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            s[0][i] += 1
+            s[1] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, list(s[0]), s[1]) for k, s in self._series.items())
+        out = self._header()
+        for k, counts, total in items:
+            running = 0
+            for le, c in zip(self.buckets + (float("inf"),), counts):
+                running += c
+                bound = 'le="+Inf"' if le == float("inf") else f'le="{_num(le)}"'
+                out.append(f"{self.name}_bucket{_labels(self.labels, k, bound)} {running}")
+            out.append(f"{self.name}_sum{_labels(self.labels, k)} {repr(total)}")
+            out.append(f"{self.name}_count{_labels(self.labels, k)} {running}")
+        return out
+
+    def reset(self) -> None:
+        with self._lock:
+            self._series.clear()
+
+
+_registry: List[_Metric] = []
+_collectors: List[Callable[[], Iterable[Tuple[str, str, str, float]]]] = []
+
+
+def collector(fn: Callable[[], Iterable[Tuple[str, str, str, float]]]):
+    """Register fn() -> [(name, type, help, value), ...], read at scrape time (e.g. pool counters)."""
+    _collectors.append(fn)
+    return fn
+
+
+# ---- the metrics ----
+
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds", "Request latency by route template and status.",
+    ("method", "route", "status"),
+)
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "Requests currently being served.")
+SP_LATENCY = Histogram("db_sp_duration_seconds", "Stored procedure execution time, rows included.", ("sp",))
+SP_ROWS = Counter("db_sp_rows_total", "Rows returned by stored procedures.", ("sp",))
+SP_ERRORS = Counter("db_sp_errors_total", "Stored procedure failures by SQL error number.", ("sp", "number"))
+DB_IN_FLIGHT = Gauge("db_calls_in_flight", "Stored procedure calls currently running.")
+POOL_ACQUIRE = Histogram(
+    "db_pool_acquire_seconds", "Time to get a pooled DB connection.", ("outcome",), ACQUIRE_BUCKETS,
+)
+
+
+# ---- recording helpers ----
+
+_ERROR_NUMBER = re.compile(r"\((\d{4,6})\)")
+
+
+def error_number(exc: BaseException) -> str:
+    """SQL error number from a pyodbc message ("... (52012) (SQLExecDirectW)"), else the class name."""
+    numbers = [int(n) for n in _ERROR_NUMBER.findall(str(exc))]
+    thrown = [n for n in numbers if n >= 50000]  # our THROWs first, then engine errors
+    if thrown or numbers:
+        return str((thrown or numbers)[0])
+    return type(exc).__name__
+
+
+def sp_started() -> float:
+    if METRICS_ENABLED:
+        DB_IN_FLIGHT.inc()
+    return time.perf_counter()
+
+
+def sp_finished(sp: str, started: float, rows: int, exc: BaseException | None = None) -> None:
+    if not METRICS_ENABLED:
+        return
+    DB_IN_FLIGHT.dec()
+    SP_LATENCY.observe((sp,), time.perf_counter() - started)
+    if rows:
+        SP_ROWS.inc((sp,), rows)
+    if exc is not None:
+        SP_ERRORS.inc((sp, error_number(exc)))
+
+
+def acquired(started: float, outcome: str) -> None:
+    if METRICS_ENABLED:
+        POOL_ACQUIRE.observe((outcome,), time.perf_counter() - started)
+
+
+class MetricsMiddleware:
+    """Plain ASGI middleware (no BaseHTTPMiddleware task hop): times every HTTP request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            return await self.app(scope, receive, send)
+        status = [500]
+
+        async def _send(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            route = scope.get("route")  # set by FastAPI once a route matched
+            # Templates, not raw paths: /packing/{packingId}/seal stays one series
+            path = getattr(route, "path_format", None) or "unmatched"
+            HTTP_LATENCY.observe((scope["method"], path, str(status[0])), time.perf_counter() - started)
+
+
+def render() -> str:
+    lines: List[str] = []
+    for m in _registry:
+        lines += m.render()
+    for fn in _collectors:
+        try:
+            samples = list(fn())
+        except Exception:
+            continue  # a broken collector must not fail the scrape
+        for name, kind, help, value in samples:
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}", f"{name} {_num(value)}"]
+    return "\n".join(lines) + "\n"
+
+
+def reset() -> None:
+    for m in _registry:
+        m.reset()
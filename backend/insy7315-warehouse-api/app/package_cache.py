@@ -0,0 +1,136 @@
+# app/package_cache.py
+#
+# Read-through cache for /delivery/{packageNumber} (the bottom sheet drivers
+# and loaders keep reopening). Entries are keyed by the normalized package
+# number, expire after PACKAGE_CACHE_TTL seconds and at most
+# PACKAGE_CACHE_MAX are kept (least recently used goes first).
+#
+# Every status transition (mark-loaded / mark-to-load / scan-to-load /
+# mark-delivered / bulk, and packing seal) invalidates exactly the packages it
+# touched. The default backend lives in this process, so another worker's
+# transition is only seen after the TTL. Point PACKAGE_CACHE_URL at a Redis
+# (redis://host:6379/0, needs the `redis` package) to share one cache between
+# workers; invalidation then reaches all of them.
+
+import json, os, time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional
+
+from app.streaming import json_default
+
+PACKAGE_CACHE_TTL = float(os.getenv("PACKAGE_CACHE_TTL", "30"))
+PACKAGE_CACHE_MAX = int(os.getenv("PACKAGE_CACHE_MAX", "5000"))
+PACKAGE_CACHE_URL = os.getenv("PACKAGE_CACHE_URL", "")
+
+
+def key(packageNumber: str) -> str:
+    # Package numbers compare case-insensitively in SQL Server
+    return packageNumber.strip().lower()
+
+
+class LocalBackend:
+    """TTL + LRU dict for one process."""
+
+    def __init__(self, max_size: int = PACKAGE_CACHE_MAX):
+        self.max_size = max_size
+        self._items: "OrderedDict[str, tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self.evictions = 0
+
+    async def get(self, k: str) -> Optional[Dict[str, Any]]:
+        item = self._items.get(k)
+        if item is None:
+            return None
+        expires, value = item
+        if time.monotonic() >= expires:
+            del self._items[k]
+            return None
+        self._items.move_to_end(k)
+        return dict(value)
+
+    async def set(self, k: str, value: Dict[str, Any], ttl: float) -> None:
+        self._items[k] = (time.monotonic() + ttl, dict(value))
+        self._items.move_to_end(k)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+            self.evictions += 1
+
+    async def delete(self, keys: Iterable[str]) -> None:
+        for k in keys:
+            self._items.pop(k, None)
+
+    def size(self) -> int:
+        return len(self._items)
+
+
+class RedisBackend:
+    """Shared across workers; Redis does the TTL and (with maxmemory-policy allkeys-lru) the LRU."""
+
+    PREFIX = "tws:pkg:"
+
+    def __init__(self, url: str):
+        import redis.asyncio  # optional dependency, only needed when PACKAGE_CACHE_URL is set
+        self._r = redis.asyncio.from_url(url)
+        self.evictions = 0  # done by Redis; see its evicted_keys stat
+
+    async def get(self, k: str) -> Optional[Dict[str, Any]]:
+        raw = await self._r.get(self.PREFIX + k)
+        return json.loads(raw) if raw is not None else None
+
+    async def set(self, k: str, value: Dict[str, Any], ttl: float) -> None:
+        raw = json.dumps(value, default=json_default, separators=(",", ":"))
+        await self._r.set(self.PREFIX + k, raw, px=int(ttl * 1000))
+
+    async def delete(self, keys: Iterable[str]) -> None:
+        names = [self.PREFIX + k for k in keys]
+        if names:
+            await self._r.delete(*names)
+
+    def size(self) -> int:
+        return -1  # not tracked here
+
+
+def _backend_from_env():
+    return RedisBackend(PACKAGE_CACHE_URL) if PACKAGE_CACHE_URL else LocalBackend()
+
+
+_backend = _backend_from_env()
+_writes = 0  # invalidations so far; a read racing one isn't cached
+_stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+
+async def get(packageNumber: str) -> Optional[Dict[str, Any]]:
+    value = await _backend.get(key(packageNumber))
+    _stats["hits" if value is not None else "misses"] += 1
+    return value
+
+
+def begin_load() -> int:
+    """Call before reading the DB on a miss; pass the result to put()."""
+    return _writes
+
+
+async def put(packageNumber: str, value: Dict[str, Any], seen: int) -> None:
+    if _writes == seen:  # a transition in between may not be in `value`
+        await _backend.set(key(packageNumber), value, PACKAGE_CACHE_TTL)
+
+
+async def invalidate(*packageNumbers: Optional[str]) -> None:
+    global _writes
+    _writes += 1
+    keys = {key(p) for p in packageNumbers if p}
+    _stats["invalidations"] += len(keys)
+    await _backend.delete(keys)
+
+
+def stats() -> Dict[str, Any]:
+    return {
+        "backend": type(_backend).__name__, "size": _backend.size(),
+        "evictions": _backend.evictions, **_stats,
+    }
+
+
+def reset() -> None:
+    global _backend, _writes
+    _backend = LocalBackend()
+    _writes = 0
+    _stats.update(hits=0, misses=0, invalidations=0)
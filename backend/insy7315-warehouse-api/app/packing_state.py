@@ -0,0 +1,215 @@
+# app/packing_state.py
+#
+# Per-package validation state kept in the API so /validate and /summary don't
+# re-aggregate vPackingQty / vPackStagingLines on every tap.
+#
+# A state is loaded once from dbo.usp_Pack_GetState (on claim, or lazily on
+# first use) and then updated in place by add-item / undo-last / clear, touching
+# only the products that changed. Seal still runs the authoritative DB check.
+#
+# Each uvicorn worker keeps its own copy; PACK_STATE_TTL bounds how long a
+# worker trusts it before reloading (writes that landed on another worker).
+# Write routes pass their request's DBSession so a reload after the write
+# runs on the connection the write already holds.
+
+import os, time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from app.db import DBSession, stream_sp
+
+PACK_STATE_TTL = float(os.getenv("PACK_STATE_TTL", "30"))
+PACK_STATE_MAX = int(os.getenv("PACK_STATE_MAX", "2000"))
+
+
+class PackState:
+    def __init__(self, header: Dict[str, Any], required_rows, item_rows):
+        self.header = header
+        self.packing_id = header["PackingId"]
+        self.staging_id = header.get("StagingId")
+        self.loaded_at = time.monotonic()
+
+        self.products: Dict[int, tuple] = {}     # ProductId -> (Sku, Name)
+        self.required: Dict[int, int] = {}       # ProductId -> staged qty
+        self.packed: Dict[int, int] = {}         # ProductId -> packed qty
+        self.lines: Dict[int, tuple] = {}        # PackingItemId -> (ProductId, Quantity)
+        self.issues: Dict[int, Dict[str, Any]] = {}
+
+        for r in required_rows:
+            self.products[r["ProductId"]] = (r["Sku"], r["Name"])
+            self.required[r["ProductId"]] = self.required.get(r["ProductId"], 0) + r["Required"]
+        for r in item_rows:
+            self._add(r)
+        for pid in set(self.required) | set(self.packed):
+            self._recheck(pid)
+
+    @property
+    def fresh(self) -> bool:
+        return time.monotonic() - self.loaded_at <= PACK_STATE_TTL
+
+    def _add(self, row: Dict[str, Any]) -> int:
+        pid, qty = row["ProductId"], row["Quantity"]
+        self.products.setdefault(pid, (row.get("Sku"), row.get("Name")))
+        self.lines[row["PackingItemId"]] = (pid, qty)
+        self.packed[pid] = self.packed.get(pid, 0) + qty
+        return pid
+
+    def _recheck(self, pid: int) -> None:
+        # Same rules as usp_Pack_ValidateAgainstStaging, for one product
+        required = self.required.get(pid)
+        packed = self.packed.get(pid, 0)
+        if required is None:
+            issue, delta = ("Extra", packed) if packed > 0 else (None, 0)
+        elif packed < required:
+            issue, delta = "Missing", required - packed
+        elif packed > required:
+            issue, delta = "Over", packed - required
+        else:
+            issue, delta = None, 0
+
+        if issue is None:
+            self.issues.pop(pid, None)
+            return
+        sku, name = self.products.get(pid, (None, None))
+        self.issues[pid] = {
+            "Issue": issue, "ProductId": pid, "Sku": sku, "Name": name,
+            "Required": required or 0, "Packed": packed, "Delta": delta,
+        }
+
+    # ---- incremental updates ----
+
+    def add_line(self, row: Dict[str, Any]) -> None:
+        if row["PackingItemId"] in self.lines:
+            return  # a reload already picked this line up
+        self._recheck(self._add(row))
+
+    def remove_line(self, packing_item_id: int) -> bool:
+        line = self.lines.pop(packing_item_id, None)
+        if line is None:
+            return False
+        pid, qty = line
+        left = self.packed.get(pid, 0) - qty
+        if left > 0:
+            self.packed[pid] = left
+        else:
+            self.packed.pop(pid, None)
+        self._recheck(pid)
+        return True
+
+    def clear(self) -> None:
+        touched = list(self.packed)
+        self.lines.clear()
+        self.packed.clear()
+        for pid in touched:
+            self._recheck(pid)
+
+    # ---- views ----
+
+    def validate(self) -> List[Dict[str, Any]]:
+        return sorted(self.issues.values(), key=lambda r: (r["Issue"], r["Sku"] or "", r["Name"] or ""))
+
+    def items(self) -> List[Dict[str, Any]]:
+        """Same shape and order as dbo.usp_Pack_GetItems (newest line first)."""
+        out = []
+        for item_id in sorted(self.lines, reverse=True):
+            pid, qty = self.lines[item_id]
+            sku, name = self.products.get(pid, (None, None))
+            out.append({"PackingItemId": item_id, "ProductId": pid, "Sku": sku, "Name": name, "Quantity": qty})
+        return out
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "PackingId": self.packing_id,
+            "PackageNumber": self.header.get("PackageNumber"),
+            "Status": self.header.get("Status"),
+            "ItemLines": len(self.lines),
+            "TotalQty": sum(self.packed.values()),
+            "CreatedAt": self.header.get("CreatedAt"),
+        }
+
+
+# ---------- per-process store ----------
+
+_states: "OrderedDict[int, PackState]" = OrderedDict()
+# PackingId -> [loads in flight, writes since the first of them started]. The
+# entry stays until the last overlapping load finishes, so each load can tell
+# whether a write landed during its own read.
+_loading: Dict[int, List[int]] = {}
+
+
+async def _rows(sp) -> List[Dict[str, Any]]:
+    out = []
+    if sp.columns is None:
+        return out
+    async for batch in sp.batches():
+        out.extend(dict(zip(sp.columns, r)) for r in batch)
+    return out
+
+
+async def _read_sets(packing_id: int, db: Optional[DBSession]):
+    if db is not None:
+        sets = await db.exec_sp_sets("dbo.usp_Pack_GetState", [packing_id])
+        return (sets + [[], [], []])[:3]
+    async with stream_sp("dbo.usp_Pack_GetState", [packing_id]) as sp:
+        header = await _rows(sp)
+        await sp.next_set()
+        required = await _rows(sp)
+        await sp.next_set()
+        items = await _rows(sp)
+    return header, required, items
+
+
+async def load(packing_id: int, db: Optional[DBSession] = None) -> Optional[PackState]:
+    """Read the package, its staged requirements and its lines (one round trip, on `db` when given)."""
+    entry = _loading.setdefault(packing_id, [0, 0])
+    entry[0] += 1
+    seen = entry[1]
+    try:
+        # Sets: [header], [staged lines], [packed lines]
+        header, required, items = await _read_sets(packing_id, db)
+    finally:
+        writes = entry[1] - seen
+        entry[0] -= 1
+        if entry[0] == 0 and _loading.get(packing_id) is entry:
+            del _loading[packing_id]
+    if not header:
+        drop(packing_id)
+        return None
+
+    state = PackState(header[0], required, items)
+    if writes == 0:  # a write that raced the read would be missing from this state
+        _states[packing_id] = state
+        _states.move_to_end(packing_id)
+        while len(_states) > PACK_STATE_MAX:
+            _states.popitem(last=False)
+    return state
+
+
+async def get(packing_id: int, db: Optional[DBSession] = None) -> Optional[PackState]:
+    state = _states.get(packing_id)
+    if state is not None and state.fresh:
+        _states.move_to_end(packing_id)
+        return state
+    return await load(packing_id, db)
+
+
+def _wrote(packing_id: int) -> None:
+    entry = _loading.get(packing_id)
+    if entry is not None:
+        entry[1] += 1
+
+
+def peek(packing_id: int) -> Optional[PackState]:
+    """Cached state (if any) for write paths; never hits the DB."""
+    _wrote(packing_id)
+    return _states.get(packing_id)
+
+
+def drop(packing_id: int) -> None:
+    _states.pop(packing_id, None)
+    _wrote(packing_id)
+
+
+def reset() -> None:
+    _states.clear()
+    _loading.clear()
@@ -0,0 +1,223 @@
+# app/product_search.py
+#
+# Trigram index over product SKU + Name for the handheld's search box, so
+# /stock/{id}/items?search=... doesn't run LIKE '%...%' over the joined tables.
+#
+# Built from the shared catalog snapshot (app/catalog.py) and kept in step
+# with the catalog's delta rows: every SEARCH_INDEX_REFRESH seconds only the
+# products appended to catalog.changes since the last sync are applied, so a
+# quiet catalog costs nothing. The snapshot is diffed in full only when the
+# catalog switched to a new snapshot file (its periodic full build).
+# A changed product gets a new doc id and the old one is tombstoned; the
+# index is rebuilt once tombstones pass a quarter of all docs.
+#
+# Postings are array('i') of doc ids (4 bytes each). A query walks the
+# posting list of its rarest trigram and checks each doc against the text,
+# so it matches exactly what the LIKE did (case-insensitive substring); it
+# stops as soon as it has more than SEARCH_MAX_IDS hits, so broad queries
+# hand over to the DB cheaply. Queries shorter than 3 characters aren't
+# indexed and stay on the DB path.
+
+import asyncio, os, threading, time
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app import catalog
+
+SEARCH_INDEX_ENABLED = os.getenv("SEARCH_INDEX_ENABLED", "1") == "1"
+SEARCH_INDEX_REFRESH = float(os.getenv("SEARCH_INDEX_REFRESH", "60"))
+SEARCH_MAX_IDS = int(os.getenv("SEARCH_MAX_IDS", "2000"))
+
+MIN_QUERY = 3
+
+
+def _norm(s: str) -> str:
+    return s.lower()
+
+
+def _grams(text: str) -> set:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _rank(q: str, sku: str, name: str) -> Optional[int]:
+    # Lower is better: exact SKU, SKU prefix, name prefix, word prefix, SKU substring, name substring
+    if sku == q:
+        return 0
+    if sku.startswith(q):
+        return 1
+    if name.startswith(q):
+        return 2
+    if (" " + q) in name:
+        return 3
+    if q in sku:
+        return 4
+    if q in name:
+        return 5
+    return None
+
+
+class SearchIndex:
+    def __init__(self):
+        self._docs: List[Optional[Tuple[int, str, str, str]]] = []  # doc -> (ProductId, sku, name, Name)
+        self._by_pid: Dict[int, int] = {}                            # ProductId -> live doc
+        self._postings: Dict[str, array] = {}
+        self._view = (self._docs, self._postings)  # swapped as one, so a query never mixes two builds
+        self._dead = 0
+        self._lock = threading.Lock()  # writers only; queries read a consistent enough view
+        self.snapshot_ident = None
+        self.changes: Optional[list] = None  # the catalog's change list this index follows
+        self.change_pos = 0                  # ... and how much of it is applied
+        self.synced_at = 0.0
+        self._stats = {"queries": 0, "changed": 0, "rebuilds": 0}
+
+    def __len__(self) -> int:
+        return len(self._by_pid)
+
+    # ---- writes ----
+
+    def _add(self, pid: int, sku: str, name: str) -> None:
+        doc = len(self._docs)
+        sku_n, name_n = _norm(sku), _norm(name)
+        self._docs.append((pid, sku_n, name_n, name))
+        self._by_pid[pid] = doc
+        for g in _grams(sku_n) | _grams(name_n):
+            posting = self._postings.get(g)
+            if posting is None:
+                posting = self._postings[g] = array("i")
+            posting.append(doc)
+
+    def _remove(self, pid: int) -> None:
+        doc = self._by_pid.pop(pid, None)
+        if doc is not None:
+            self._docs[doc] = None
+            self._dead += 1
+
+    def _put(self, pid: int, sku: str, name: str) -> bool:
+        doc = self._by_pid.get(pid)
+        if doc is not None and self._docs[doc][3] == name and self._docs[doc][1] == _norm(sku):
+            return False
+        self._remove(pid)
+        self._add(pid, sku, name)
+        return True
+
+    def _written(self, changed: int) -> int:
+        self._stats["changed"] += changed
+        if self._dead > max(1000, len(self._docs) // 4):
+            self._rebuild()
+        return changed
+
+    def update(self, products: Dict[int, Tuple[str, str]]) -> int:
+        """Make the index match {ProductId: (Sku, Name)}; returns how many products changed."""
+        with self._lock:
+            changed = 0
+            for pid in [p for p in self._by_pid if p not in products]:
+                self._remove(pid)
+                changed += 1
+            for pid, (sku, name) in products.items():
+                changed += self._put(pid, sku, name)
+            return self._written(changed)
+
+    def apply(self, rows: Iterable[Tuple[int, str, str]]) -> int:
+        """Add or re-index (ProductId, Sku, Name) rows; returns how many products changed."""
+        with self._lock:
+            return self._written(sum(self._put(pid, sku, name) for pid, sku, name in rows))
+
+    def _rebuild(self) -> None:
+        fresh = SearchIndex()
+        for d in self._docs:
+            if d is not None:
+                fresh._add(d[0], d[1], d[3])
+        self._docs, self._by_pid, self._postings, self._dead = fresh._docs, fresh._by_pid, fresh._postings, 0
+        self._view = fresh._view
+        self._stats["rebuilds"] += 1
+
+    # ---- reads ----
+
+    def search(self, query: str, limit: int = SEARCH_MAX_IDS) -> Optional[List[int]]:
+        """Matching ProductIds, best first; None when the index can't answer
+        (query too short, or more than `limit` matches: let the DB filter those)."""
+        q = _norm(query.strip())
+        if len(q) < MIN_QUERY:
+            return None
+        self._stats["queries"] += 1
+        docs, postings = self._view
+        rarest = None
+        for g in _grams(q):
+            posting = postings.get(g)
+            if posting is None:
+                return []
+            if rarest is None or len(posting) < len(rarest):
+                rarest = posting
+
+        # The substring check in _rank is the real filter: no set intersection,
+        # and a broad query gives up after `limit` hits instead of ranking them all
+        hits = []
+        for d in rarest:
+            doc = docs[d]
+            if doc is None:
+                continue
+            r = _rank(q, doc[1], doc[2])
+            if r is not None:
+                hits.append((r, doc[2], doc[0]))
+                if len(hits) > limit:
+                    return None  # too broad to be worth ranking here
+        hits.sort()
+        return [pid for _, _, pid in hits]
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "products": len(self._by_pid), "docs": len(self._docs), "dead": self._dead,
+            "grams": len(self._postings), "synced_at": self.synced_at, **self._stats,
+        }
+
+
+_index = SearchIndex()
+
+
+def get_index() -> SearchIndex:
+    return _index
+
+
+def sync() -> int:
+    """Apply the catalog's new delta rows to the index (blocking: run in a thread)."""
+    cat = catalog.get_catalog()
+    changes = cat.changes  # replaced (not cleared) whenever the catalog drops its overlay
+    snap = cat.snapshot
+    if snap is None:
+        return 0
+    index = _index
+    changed = 0
+    if index.snapshot_ident != snap.ident or index.changes is not changes:
+        # New snapshot file (or a fresh delta log): diff the whole base once
+        changed = index.update({pid: (sku, name) for pid, sku, name in snap.products()})
+        index.snapshot_ident, index.changes, index.change_pos = snap.ident, changes, 0
+    end = len(changes)  # append-only while this list is current
+    if end > index.change_pos:
+        changed += index.apply(changes[index.change_pos:end])
+        index.change_pos = end
+    index.synced_at = time.time()
+    return changed
+
+
+def search(query: str) -> Optional[List[int]]:
+    """ProductIds for a search box query, or None to use the DB search instead."""
+    if not SEARCH_INDEX_ENABLED or _index.snapshot_ident is None or not catalog.is_fresh():
+        return None
+    return _index.search(query)
+
+
+async def sync_loop() -> None:
+    """Background task (one per worker): follow the catalog snapshot."""
+    while True:
+        try:
+            await asyncio.to_thread(sync)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Search index sync failed: {e}")
+        await asyncio.sleep(SEARCH_INDEX_REFRESH)
+
+
+def reset() -> None:
+    global _index
+    _index = SearchIndex()
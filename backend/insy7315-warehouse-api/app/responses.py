@@ -0,0 +1,59 @@
+# app/responses.py
+#
+# JSON response class used app-wide (FastAPI default_response_class).
+# Renders with orjson when it is installed (several times faster than the
+# stdlib encoder on row lists) and falls back to json otherwise; DB types
+# orjson doesn't know (Decimal, ...) go through the same json_default as the
+# streaming endpoints.
+#
+# raw_json() is for hot read endpoints that already return plain JSON-ready
+# dicts: it skips FastAPI's response_model validation and jsonable_encoder.
+#
+# ClosingStreamingResponse is for bodies that hold a DB stream or an event
+# subscription: Starlette never closes a body iterator that didn't start
+# (client gone before the first chunk), so cleanup can't live only in the
+# generator's finally.
+
+import json
+from typing import Any, Awaitable, Callable, Optional
+
+from fastapi import Response
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from app.streaming import json_default
+
+try:
+    import orjson
+except ImportError:  # optional: plain json still works
+    orjson = None
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(content, default=json_default, option=orjson.OPT_NON_STR_KEYS)
+        return json.dumps(
+            content, default=json_default, ensure_ascii=False, allow_nan=False, separators=(",", ":")
+        ).encode("utf-8")
+
+
+def raw_json(content: Any, response: Optional[Response] = None, status_code: int = 200) -> FastJSONResponse:
+    """Send `content` as-is; headers set on the injected `response` (ETag, ...) are kept."""
+    headers = dict(response.headers) if response is not None else None
+    if headers:
+        headers.pop("content-length", None)
+    return FastJSONResponse(content, status_code=status_code, headers=headers)
+
+
+class ClosingStreamingResponse(StreamingResponse):
+    """StreamingResponse that awaits `on_close()` however it ends: sent, failed, or never started."""
+
+    def __init__(self, content: Any, *, on_close: Callable[[], Awaitable[None]], **kwargs):
+        super().__init__(content, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.on_close()
@@ -2,9 +2,11 @@
 
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel, EmailStr
-from app.db import exec_sp
+
+from app.db import exec_sp_async
 from app.deps import require_key
-from app.security import hash_password, verify_password, create_token
+from app.hashing import hash_password, verify_password
+from app.security import create_token
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
@@ -18,23 +20,32 @@ class LoginRequest(BaseModel):
     password: str
 
 @router.post("/register")
-def register(req: RegisterRequest, _=Depends(require_key)):
-    pw_hash = hash_password(req.password)
-    rows = exec_sp("dbo.usp_User_CreateByEmail", [req.name, req.email, pw_hash])
+async def register(req: RegisterRequest, _=Depends(require_key)):
+    # Argon2 is CPU/memory heavy: runs in the hashing process pool
+    pw_hash = await hash_password(req.password)
+    rows = await exec_sp_async("dbo.usp_User_CreateByEmail", [req.name, req.email, pw_hash])
     if not rows:
         raise HTTPException(status_code=400, detail="Registration failed")
     return {"ok": True, "user": rows[0]}
 
 @router.post("/login")
-def login(req: LoginRequest, _=Depends(require_key)):
-    rows = exec_sp("dbo.usp_User_GetByEmail", [req.email])
+async def login(req: LoginRequest, _=Depends(require_key)):
+    rows = await exec_sp_async("dbo.usp_User_GetByEmail", [req.email])
     if not rows:
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
     user = rows[0]
-    if not verify_password(req.password, user["PasswordHash"]):
+    ok, new_hash = await verify_password(req.password, user["PasswordHash"])
+    if not ok:
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
+    # Argon2 params changed since this hash was made: store the upgraded hash
+    if new_hash:
+        try:
+            await exec_sp_async("dbo.usp_User_UpdatePasswordHash", [user["UserId"], new_hash])
+        except Exception as e:
+            print(f"Password rehash skipped for user {user['UserId']}: {e}")
+
     # Default role if your Users table does not have Role
     role = user.get("Role", "User")
 
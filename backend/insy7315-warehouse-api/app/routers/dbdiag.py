@@ -2,17 +2,56 @@
 
 from fastapi import APIRouter, HTTPException, Depends
 from app.deps import require_key
-from app.db import get_conn
+from app import db, hashing, package_cache, product_search, singleflight, stock_buffer
 
 router = APIRouter(prefix="/diag", tags=["diagnostics"])
 
+def _ping():
+    with db.get_conn() as c:
+        cur = c.cursor()
+        cur.execute("SELECT TOP 1 name FROM sys.databases")
+        row = cur.fetchone()
+        return row[0] if row else None
+
 @router.get("/db-ping")
-def db_ping(_=Depends(require_key)):
+async def db_ping(_=Depends(require_key)):
     try:
-        with get_conn() as c:
-            cur = c.cursor()
-            cur.execute("SELECT TOP 1 name FROM sys.databases")
-            row = cur.fetchone()
-            return {"ok": True, "sample_db": row[0] if row else None}
+        return {"ok": True, "sample_db": await db.run_db(_ping)}
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/pool")
+async def pool(_=Depends(require_key)):
+    # Connection pool counters: in_use / idle / waits / wait_time_ms / timeouts ...
+    return {"ok": True, "pool": db.pool_stats()}
+
+
+@router.get("/hashing")
+async def hashing_stats(_=Depends(require_key)):
+    # Argon2 pool: inflight / queued / rejected and per-op latency (hash, verify)
+    return {"ok": True, "hashing": hashing.stats()}
+
+
+@router.get("/stock-buffer")
+async def stock_buffer_stats(_=Depends(require_key)):
+    # Write-behind stock counts: pending / flushed / batches / rejected / failures
+    buf = stock_buffer.get_buffer()
+    return {"ok": True, "enabled": buf is not None, "stock_buffer": buf.stats() if buf else None}
+
+
+@router.get("/search-index")
+async def search_index_stats(_=Depends(require_key)):
+    # Product search index: products / dead docs / trigrams / queries / rebuilds
+    return {"ok": True, "search_index": product_search.get_index().stats()}
+
+
+@router.get("/package-cache")
+async def package_cache_stats(_=Depends(require_key)):
+    # Delivery package details cache: backend / size / hits / misses / evictions / invalidations
+    return {"ok": True, "package_cache": package_cache.stats()}
+
+
+@router.get("/singleflight")
+async def singleflight_stats(_=Depends(require_key)):
+    # Coalesced reads: calls vs executions (shared = calls that joined one in flight)
+    return {"ok": True, "singleflight": singleflight.stats()}
@@ -1,95 +1,165 @@
 # app/routers/delivery.py
+import base64, binascii, json
+
 from fastapi import APIRouter, Depends, HTTPException, Query, Body
-from typing import Any, Dict, List, Optional
+from fastapi.responses import Response
+from pydantic import BaseModel, Field
+from typing import Any, Dict, List, Literal, Optional
 
+from app import delivery_counts, events, package_cache, singleflight
 from app.deps import require_key
-from app.db import get_conn, exec_sp  # we'll reuse exec_sp and also use get_conn for multi-sets
+from app.db import exec_sp_async, stream_sp
+from app.streaming import row_encoder
 
 router = APIRouter(prefix="/delivery", tags=["delivery"])
 
+class BulkTransition(BaseModel):
+    target: Literal["Loaded", "To Load", "Delivered"]
+    packageNumbers: List[str] = Field(..., min_length=1, max_length=500)
+
 @router.get("/health")
-def health(_=Depends(require_key)):
+async def health(_=Depends(require_key)):
     return {"ok": True, "feature": "delivery"}
 
-# --- small helper for multi-result-set stored procs (pyodbc) ---
-def _exec_sp_multi(sp_name: str, params: list) -> List[List[Dict[str, Any]]]:
-    """
-    Execute a stored procedure that returns multiple result sets.
-    Returns: [ [rows of set 1], [rows of set 2], ... ]
-    """
-    sets: List[List[Dict[str, Any]]] = []
-    with get_conn() as conn:
-        cur = conn.cursor()
-        placeholders = ",".join(["?"] * len(params))
-        cur.execute(f"EXEC {sp_name} {placeholders}", params)
-        while True:
-            if cur.description:
-                cols = [d[0] for d in cur.description]
-                rows = [dict(zip(cols, r)) for r in cur.fetchall()]
-                sets.append(rows)
-            # move to next result set; break when none
-            if not cur.nextset():
-                break
-    return sets
+# Opaque page cursor: the last DeliveryPackageId the client has seen
+def _encode_cursor(last_id: int) -> str:
+    raw = json.dumps({"after": last_id}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
 
-# 1) List packages + chip counts
+def _decode_cursor(cursor: str) -> int:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        return int(json.loads(raw)["after"])
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+# 1) List packages + chip counts (keyset paging: pass back `next` as `cursor`)
 @router.get("/list")
-def list_packages(
+async def list_packages(
     _=Depends(require_key),
     search: Optional[str] = Query(None, description="e.g. 'PKG-10'"),
     status: Optional[str] = Query(None, regex="^(To Load|Loaded)$"),
     top: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = Query(None, description="`next` from the previous page"),
+    match: str = Query(
+        "contains", regex="^(auto|prefix|suffix|contains)$",
+        description="contains (default) matches anywhere; prefix/suffix use an index but only match "
+                    "the start/end of the number. 'auto' is accepted from older clients and means contains.",
+    ),
+    counts_only: bool = Query(False, description="Only the chip counters (cheap to poll)"),
 ):
-    result_sets = _exec_sp_multi("dbo.usp_Delivery_ListPackages", [search, status, top])
-    if not result_sets:
-        return {"items": [], "counts": {"Total": 0, "ToLoad": 0, "Loaded": 0}}
+    # Chip counters come from the API-side cache, not a per-call aggregate
+    counts = await delivery_counts.get()
+    if counts_only:
+        return {"counts": counts}
+
+    after_id = _decode_cursor(cursor) if cursor else None
+    # one extra row tells us whether another page exists; 0 = skip the proc's count set
+    mode = "contains" if match == "auto" else match
+    params = (search.strip() if search else search, status, top + 1, after_id, mode, 0)
+    # Every tablet polls the same first page: identical concurrent calls share one execution
+    page = await singleflight.do("delivery-list", params, lambda: _list_page(list(params), top))
+    return Response(page + b',"counts":' + json.dumps(counts).encode() + b"}", media_type="application/json")
+
+async def _list_page(params: List[Any], top: int) -> bytes:
+    """One page as JSON bytes (pages are bounded by `top`), left open for the counts."""
+    async with stream_sp("dbo.usp_Delivery_ListPackages", params) as sp:
+        if sp.columns is None:
+            return b'{"items":[],"next":null'
+        encode = row_encoder(sp.columns)
+        id_at = sp.columns.index("DeliveryPackageId")
+        parts, sent, last_id, more = [], 0, None, False
+        async for batch in sp.batches():
+            if sent + len(batch) > top:
+                more, batch = True, batch[:top - sent]
+            if batch:
+                parts.extend(encode(r) for r in batch)
+                sent += len(batch)
+                last_id = batch[-1][id_at]
+            if more:
+                break
+    next_cursor = json.dumps(_encode_cursor(last_id) if more else None)
+    return ('{"items":[' + ",".join(parts) + '],"next":' + next_cursor).encode()
 
-    items = result_sets[0]
-    counts = (result_sets[1][0] if len(result_sets) > 1 and result_sets[1] else
-              {"Total": len(items), "ToLoad": None, "Loaded": None})
+# Status transitions report PrevStatus so the chip counters move without a recount;
+# the same change goes out on the "delivery" push feed and drops the cached details
+async def _counted(row: Dict[str, Any], *also: str) -> Dict[str, Any]:
+    await package_cache.invalidate(row.get("PackageNumber"), *also)
+    _changed(row.get("PackageNumber"), row.get("PrevStatus"), row.get("Status"))
+    return row
 
-    return {"items": items, "counts": counts}
+def _changed(packageNumber: Optional[str], prev: Optional[str], status: Optional[str]) -> None:
+    delivery_counts.apply(prev, status)
+    singleflight.forget("delivery-list")
+    if prev != status:
+        events.publish("delivery", {"PackageNumber": packageNumber, "Status": status, "PrevStatus": prev})
 
-# 2) Get single package details (for bottom sheet)
+# 2) Get single package details (for bottom sheet) — read-through cache
 @router.get("/{packageNumber}")
-def get_package_details(packageNumber: str, _=Depends(require_key)):
-    rows = exec_sp("dbo.usp_Delivery_GetPackageDetails", [packageNumber])
+async def get_package_details(packageNumber: str, _=Depends(require_key)):
+    cached = await package_cache.get(packageNumber)
+    if cached is not None:
+        return cached
+    seen = package_cache.begin_load()
+    rows = await exec_sp_async("dbo.usp_Delivery_GetPackageDetails", [packageNumber])
     if not rows:
         raise HTTPException(status_code=404, detail="Package not found")
+    await package_cache.put(packageNumber, rows[0], seen)
     return rows[0]
 
 # 3) Mark as Loaded
 @router.post("/{packageNumber}/mark-loaded")
-def mark_loaded(packageNumber: str, _=Depends(require_key)):
-    rows = exec_sp("dbo.usp_Delivery_MarkLoaded", [packageNumber])
+async def mark_loaded(packageNumber: str, _=Depends(require_key)):
+    rows = await exec_sp_async("dbo.usp_Delivery_MarkLoaded", [packageNumber])
     if not rows:
         raise HTTPException(status_code=400, detail="Could not mark loaded")
-    return rows[0]
+    return await _counted(rows[0], packageNumber)
 
 # 4) Revert to 'To Load'
 @router.post("/{packageNumber}/mark-to-load")
-def mark_to_load(packageNumber: str, _=Depends(require_key)):
-    rows = exec_sp("dbo.usp_Delivery_MarkToLoad", [packageNumber])
+async def mark_to_load(packageNumber: str, _=Depends(require_key)):
+    rows = await exec_sp_async("dbo.usp_Delivery_MarkToLoad", [packageNumber])
     if not rows:
         raise HTTPException(status_code=400, detail="Could not revert to 'To Load'")
-    return rows[0]
+    return await _counted(rows[0], packageNumber)
 
 # 5) Quick scan handler → loads immediately
 @router.post("/scan-to-load")
-def scan_to_load(
+async def scan_to_load(
     _=Depends(require_key),
     scannedNumber: str = Body(..., embed=True)   # expects {"scannedNumber": "PKG-10023"}
 ):
-    rows = exec_sp("dbo.usp_Delivery_ScanToLoad", [scannedNumber])
+    rows = await exec_sp_async("dbo.usp_Delivery_ScanToLoad", [scannedNumber])
     if not rows:
         raise HTTPException(status_code=400, detail="Scan failed")
-    return rows[0]
+    return await _counted(rows[0], scannedNumber)
+
+
+# 5a) Bulk transition: load (or revert / deliver) a whole truck in one call
+@router.post("/bulk-transition")
+async def bulk_transition(body: BulkTransition, _=Depends(require_key)):
+    tvp = [(i, n.strip()) for i, n in enumerate(body.packageNumbers)]
+    try:
+        rows = await exec_sp_async("dbo.usp_Delivery_BulkTransition", [body.target, tvp])
+    except Exception as e:
+        if "56010" in str(e):
+            raise HTTPException(status_code=400, detail="Invalid target state")
+        raise
+    updated = []
+    for r in rows:
+        if r["Outcome"] == "Updated":
+            _changed(r["PackageNumber"], r["PrevStatus"], r["Status"])
+            updated.append(r["PackageNumber"])
+    await package_cache.invalidate(*updated)
+    return {"target": body.target, "updated": len(updated), "items": rows}
 
 
 # app/routers/delivery.py
 @router.post("/{packageNumber}/mark-delivered")
-def mark_delivered(packageNumber: str, _=Depends(require_key)):
-    rows = exec_sp("dbo.usp_Delivery_MarkDelivered", [packageNumber])
+async def mark_delivered(packageNumber: str, _=Depends(require_key)):
+    rows = await exec_sp_async("dbo.usp_Delivery_MarkDelivered", [packageNumber])
     if not rows:
         raise HTTPException(status_code=400, detail="Could not mark delivered")
+    await package_cache.invalidate(packageNumber, rows[0].get("PackageNumber"))
+    _changed(packageNumber, "Loaded", "Delivered")  # the proc only allows Loaded -> Delivered
     return rows[0]
\ No newline at end of file
@@ -0,0 +1,84 @@
+# app/routers/events.py
+#
+# Server-Sent Events feed for dispatcher / packer screens:
+#   GET /events/stream?topics=delivery,staging
+# Load the list once, then apply the deltas. On reconnect send the last
+# event id back (Last-Event-ID header or ?resume=) to continue where you were;
+# an `event: reset` means "reload the list, then keep listening".
+
+import asyncio, json, os
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+
+from app import events
+from app.deps import require_key
+from app.responses import ClosingStreamingResponse
+from app.streaming import json_default
+
+EVENTS_HEARTBEAT = float(os.getenv("EVENTS_HEARTBEAT", "15"))
+
+router = APIRouter(prefix="/events", tags=["events"])
+
+
+def _sse(event: events.Event, bus: events.EventBus) -> str:
+    data = json.dumps(event.data, default=json_default, separators=(",", ":"))
+    return f"id: {bus.token(event.seq)}\nevent: {event.topic}\ndata: {data}\n\n"
+
+
+def _reset(bus: events.EventBus) -> str:
+    return f"id: {bus.last_token}\nevent: reset\ndata: {{}}\n\n"
+
+
+@router.get("/stream")
+async def stream(
+    topics: str = Query(",".join(events.TOPICS), description="Comma list: delivery,staging"),
+    resume: Optional[str] = Query(None, description="Last event id seen (same as Last-Event-ID)"),
+    last_event_id: Optional[str] = Header(None, alias="Last-Event-ID"),
+    _=Depends(require_key),
+):
+    wanted = [t.strip() for t in topics.split(",") if t.strip()]
+    bad = [t for t in wanted if t not in events.TOPICS]
+    if bad or not wanted:
+        raise HTTPException(status_code=400, detail=f"Unknown topics: {', '.join(bad) or '(none)'}")
+    token = last_event_id or resume
+
+    bus = events.get_bus()
+    # Subscribe before replaying so nothing published in between is lost
+    sub = bus.subscribe(wanted)
+    backlog = bus.since(token, wanted) if token else []
+    start = token if token and backlog is not None else bus.last_token
+
+    async def release():
+        bus.unsubscribe(sub)
+
+    async def body():
+        # First frame carries a resume token even when nothing has happened yet
+        last = backlog[-1].seq if backlog else None
+        if backlog is None:
+            yield _reset(bus)
+        else:
+            yield f"id: {start}\nevent: ready\ndata: {{}}\n\n"
+            for e in backlog:
+                yield _sse(e, bus)
+        while True:
+            try:
+                e = await asyncio.wait_for(sub.queue.get(), timeout=EVENTS_HEARTBEAT)
+            except asyncio.TimeoutError:
+                if sub.overflowed:
+                    yield _reset(bus)
+                    return
+                yield ": ping\n\n"  # keeps proxies from closing an idle stream
+                continue
+            if last is not None and e.seq <= last:
+                continue  # already sent in the backlog
+            yield _sse(e, bus)
+            if sub.overflowed and sub.queue.empty():
+                yield _reset(bus)
+                return
+
+    # Unsubscribed however the response ends, including when the body never starts
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return ClosingStreamingResponse(
+        body(), on_close=release, media_type="text/event-stream", headers=headers
+    )
@@ -0,0 +1,19 @@
+# app/routers/metrics.py
+#
+# Prometheus scrape endpoint. Same X-API-Key as /diag (set it in the scrape
+# job's http_headers). Per worker process, see app/metrics.py.
+
+from fastapi import APIRouter, Depends
+from fastapi.responses import PlainTextResponse
+
+from app import metrics
+from app.deps import require_key
+
+router = APIRouter(tags=["diagnostics"])
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def scrape(_=Depends(require_key)):
+    return PlainTextResponse(metrics.render(), media_type=CONTENT_TYPE)
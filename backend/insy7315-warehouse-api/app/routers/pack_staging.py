@@ -1,43 +1,97 @@
 # app/routers/pack_staging.py
-from fastapi import APIRouter, Depends, HTTPException
-from app.db import exec_sp
-from app.deps import require_key
+import time
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from app import events, packing_state, singleflight, staging_queue, versions
+from app.db import exec_sp_async
+from app.deps import CurrentUser, current_user, require_key, resolve_user_id
 
 router = APIRouter(prefix="/staging", tags=["staging"])
 
+# Push the staging change to packer screens (see app/routers/events.py)
+def _publish(row: dict, status: str | None = None) -> None:
+    events.publish("staging", {
+        "StagingId": row.get("StagingId"),
+        "Status": status or row.get("Status"),
+        "SessionId": row.get("SessionId"),
+        "PackingId": row.get("PackingId") or row.get("PackedIntoId"),
+    })
+
 @router.post("/from-pick/{sessionId}")
-def stage_from_pick(sessionId: int, _=Depends(require_key)):
-    rows = exec_sp("dbo.usp_Pick_StageForPack", [sessionId])
+async def stage_from_pick(sessionId: int, _=Depends(require_key)):
+    rows = await exec_sp_async("dbo.usp_Pick_StageForPack", [sessionId])
     if not rows:
         raise HTTPException(status_code=400, detail="Stage failed")
+    versions.bump("staging", rows[0].get("StagingId"))
+    singleflight.forget("staging-lines", rows[0].get("StagingId"))
+    _publish(rows[0])
+    staging_queue.notify()  # wake the longest-waiting packer
     return rows[0]
 
 @router.post("/claim-next")
-def claim_next(packedBy: int, packageNumber: str | None = None, _=Depends(require_key)):
-    rows = exec_sp("dbo.usp_Pack_ClaimNext", [packedBy, packageNumber])
-    if not rows:
-        raise HTTPException(status_code=404, detail="No staged picks available")
+async def claim_next(
+    packedBy: int | None = None,
+    packageNumber: str | None = None,
+    wait: float = Query(0, ge=0, le=staging_queue.STAGING_MAX_WAIT,
+                        description="Seconds to wait for work before answering 404 (long poll)"),
+    user: CurrentUser | None = Depends(current_user),
+    _=Depends(require_key),
+):
+    packedBy = resolve_user_id(user, packedBy)
+    queue = staging_queue.get_queue()
+    deadline = time.monotonic() + wait
+    woken = False
+    while True:
+        since = queue.generation
+        rows = await exec_sp_async("dbo.usp_Pack_ClaimNext", [packedBy, packageNumber])
+        if rows:
+            break
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise HTTPException(status_code=404, detail="No staged picks available")
+        # Park; a packer that was woken but lost the race goes back to the front
+        woken = await queue.wait(min(remaining, staging_queue.STAGING_RECHECK), since, front=woken)
+    # Seed the package's validation state now so the first /validate is served from memory
+    if rows[0].get("PackingId") is not None:
+        try:
+            await packing_state.load(rows[0]["PackingId"])
+        except Exception as e:
+            print(f"Pack state preload skipped: {e}")
+    _publish(rows[0], "Claimed")
     return rows[0]
 
 @router.get("/{stagingId}/lines")
-def get_lines(stagingId: int, _=Depends(require_key)):
-    # ✅ call the correct SP name
-    rows = exec_sp("dbo.usp_Pack_GetStagedLines", [stagingId])
+async def get_lines(request: Request, response: Response, stagingId: int, _=Depends(require_key)):
+    # If-None-Match: staged lines rarely change once staged, so this is mostly 304s
+    unchanged = versions.check(request, response, "staging", stagingId)
+    if unchanged is not None:
+        return unchanged
+    # ✅ call the correct SP name; packers polling the same staging share one call
+    rows = await singleflight.do(
+        "staging-lines", stagingId, lambda: exec_sp_async("dbo.usp_Pack_GetStagedLines", [stagingId])
+    )
     # return a plain array (Android expects a JSON array)
     return rows or []
 
 @router.post("/consume")
-def consume(stagingId: int, _=Depends(require_key)):
-    rows = exec_sp("dbo.usp_Pack_ConsumeStaging", [stagingId])
+async def consume(stagingId: int, _=Depends(require_key)):
+    rows = await exec_sp_async("dbo.usp_Pack_ConsumeStaging", [stagingId])
+    versions.bump("staging", stagingId)
+    singleflight.forget("staging-lines", stagingId)
+    _publish({"StagingId": stagingId}, "Consumed")
     return {"items": rows}
 
 @router.post("/release")
-def release(stagingId: int, _=Depends(require_key)):
-    rows = exec_sp("dbo.usp_Pack_ReleaseStaging", [stagingId])
+async def release(stagingId: int, _=Depends(require_key)):
+    rows = await exec_sp_async("dbo.usp_Pack_ReleaseStaging", [stagingId])
     if not rows:
         raise HTTPException(status_code=400, detail="Release failed")
+    versions.bump("staging", stagingId)
+    singleflight.forget("staging-lines", stagingId)
+    staging_queue.notify()
+    _publish({"StagingId": stagingId, **rows[0]}, rows[0].get("Status") or "Queued")  # back in the queue
     return rows[0]
 
 @router.get("/health")
-def health(_=Depends(require_key)):
+async def health(_=Depends(require_key)):
     return {"ok": True, "feature": "staging"}
\ No newline at end of file
@@ -1,24 +1,59 @@
 # app/routers/packing.py
 from typing import Optional, List, Dict, Any
-from fastapi import APIRouter, Depends, HTTPException, Query
-from app.db import exec_sp
-from app.deps import require_key
-
-router = APIRouter(prefix="/packing", tags=["packing"])
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from app import catalog, delivery_counts, events, package_cache, packing_state, singleflight, versions
+from app.db import DBSession, db_session, exec_sp_async
+from app.deps import current_user, require_key
+
+router = APIRouter(prefix="/packing", tags=["packing"], dependencies=[Depends(current_user)])
+
+# Derived views a scan response can carry, so the packer doesn't need
+# follow-up calls to /items, /summary and /validate after every scan
+INCLUDE_VIEWS = ("items", "summary", "validation")
+_INCLUDE_QUERY = Query(None, description="Comma list of: items,summary,validation")
+
+
+def _parse_include(include: Optional[str]) -> List[str]:
+    wanted = [v.strip().lower() for v in (include or "").split(",") if v.strip()]
+    bad = [v for v in wanted if v not in INCLUDE_VIEWS]
+    if bad:
+        raise HTTPException(status_code=400, detail=f"Unknown include: {', '.join(bad)}")
+    return wanted
+
+
+async def _with_views(packingId: int, row: Dict[str, Any], include: List[str], db: DBSession) -> Dict[str, Any]:
+    """Row plus the requested views, built from the pack state (one read at most, on the write's session)."""
+    if not include:
+        return row
+    out = dict(row)
+    state = await packing_state.get(packingId, db)
+    if state is None:
+        return out
+    if "items" in include:
+        out["items"] = state.items()
+    if "summary" in include:
+        out["summary"] = state.summary()
+    if "validation" in include:
+        if state.staging_id is None:
+            out["validation"] = {"ok": False, "issues": [], "message": "No staging linked to this package."}
+        else:
+            issues = state.validate()
+            out["validation"] = {"ok": not issues, "issues": issues}
+    return out
 
 
 @router.get("/health")
-def health(_=Depends(require_key)):
+async def health(_=Depends(require_key)):
     return {"ok": True, "feature": "packing"}
 
 
 # 1) Start a new package OR set current to an existing one
 @router.post("/start-or-set")
-def start_or_set(
+async def start_or_set(
     packageNumber: Optional[str] = Query(default=None),
     _=Depends(require_key),
 ):
-    rows = exec_sp("dbo.usp_Pack_StartOrSet", [packageNumber])
+    rows = await exec_sp_async("dbo.usp_Pack_StartOrSet", [packageNumber])
     if not rows:
         raise HTTPException(status_code=400, detail="Could not start or set package")
     return rows[0]
@@ -26,14 +61,27 @@ def start_or_set(
 
 # 2) Add item(s) to a package by barcode or serial
 @router.post("/add-item")
-def add_item(
+async def add_item(
     packingId: int = Query(...),
     barcodeOrSerial: str = Query(...),
     qty: int = Query(1),
+    include: Optional[str] = _INCLUDE_QUERY,
     _=Depends(require_key),
+    db: DBSession = Depends(db_session),
 ):
+    views = _parse_include(include)
+    # Catalog hit first; unknown codes and stale hits (product gone) use the DB lookup
+    hit = catalog.lookup(barcodeOrSerial, catalog.PACK_KINDS)
+    rows = None
     try:
-        rows = exec_sp("dbo.usp_Pack_AddItem", [packingId, barcodeOrSerial, qty])
+        if hit is not None:
+            try:
+                rows = await db.exec_sp("dbo.usp_Pack_AddItemByProduct", [packingId, hit.product_id, qty])
+            except Exception as e:
+                if "52012" not in str(e):
+                    raise
+        if rows is None:
+            rows = await db.exec_sp("dbo.usp_Pack_AddItem", [packingId, barcodeOrSerial, qty])
     except Exception as e:
         msg = str(e)
         # Friendly error for unknown scans
@@ -43,152 +91,219 @@ def add_item(
         raise
     if not rows:
         raise HTTPException(status_code=400, detail="Add item failed")
-    return rows[0]
+    versions.bump("packing", packingId)
+    state = packing_state.peek(packingId)
+    if state is not None:
+        state.add_line(rows[0])
+    return await _with_views(packingId, rows[0], views, db)
 
 
 # 3) Get all items currently in a package (path style)
 @router.get("/{packingId}/items")
-def get_items_path(
+async def get_items_path(
+    request: Request,
+    response: Response,
     packingId: int,
     _=Depends(require_key),
 ):
-    rows = exec_sp("dbo.usp_Pack_GetItems", [packingId])
+    # If-None-Match: 304 without running the proc when the package didn't change
+    unchanged = versions.check(request, response, "packing", packingId)
+    if unchanged is not None:
+        return unchanged
+    rows = await exec_sp_async("dbo.usp_Pack_GetItems", [packingId])
     return rows  # plain array
 
 
 # 3a) Alias for mobile client (query style): /packing/items?packingId=12
 @router.get("/items")
-def get_items_query(
+async def get_items_query(
+    request: Request,
+    response: Response,
     packingId: int = Query(..., alias="packingId"),
     _=Depends(require_key),
 ):
-    rows = exec_sp("dbo.usp_Pack_GetItems", [packingId])
+    unchanged = versions.check(request, response, "packing", packingId)
+    if unchanged is not None:
+        return unchanged
+    rows = await exec_sp_async("dbo.usp_Pack_GetItems", [packingId])
     return rows  # plain array
 
 
+# Keep the cached validation state in step with undo/clear
+def _after_undo(packingId: int, row: Dict[str, Any]) -> Dict[str, Any]:
+    versions.bump("packing", packingId)
+    state = packing_state.peek(packingId)
+    if state is not None and row.get("Removed"):
+        if not state.remove_line(row.get("PackingItemId")):
+            packing_state.drop(packingId)  # out of step: reload on next read
+    return row
+
+
+def _after_clear(packingId: int, row: Dict[str, Any]) -> Dict[str, Any]:
+    versions.bump("packing", packingId)
+    state = packing_state.peek(packingId)
+    if state is not None and row.get("Cleared"):
+        state.clear()
+    return row
+
+
 # 4) Undo the most recent added line (path style)
 @router.post("/{packingId}/undo-last")
-def undo_last_path(
+async def undo_last_path(
     packingId: int,
+    include: Optional[str] = _INCLUDE_QUERY,
     _=Depends(require_key),
+    db: DBSession = Depends(db_session),
 ):
-    rows = exec_sp("dbo.usp_Pack_UndoLast", [packingId])
-    return rows[0] if rows else {"Removed": 0}
+    views = _parse_include(include)
+    rows = await db.exec_sp("dbo.usp_Pack_UndoLast", [packingId])
+    return await _with_views(packingId, _after_undo(packingId, rows[0] if rows else {"Removed": 0}), views, db)
 
 
 # 4a) Alias (query style): /packing/undo-last?packingId=12
 @router.post("/undo-last")
-def undo_last_query(
+async def undo_last_query(
     packingId: int = Query(...),
+    include: Optional[str] = _INCLUDE_QUERY,
     _=Depends(require_key),
+    db: DBSession = Depends(db_session),
 ):
-    rows = exec_sp("dbo.usp_Pack_UndoLast", [packingId])
-    return rows[0] if rows else {"Removed": 0}
+    views = _parse_include(include)
+    rows = await db.exec_sp("dbo.usp_Pack_UndoLast", [packingId])
+    return await _with_views(packingId, _after_undo(packingId, rows[0] if rows else {"Removed": 0}), views, db)
 
 
 # 5) Clear all items (path style)
 @router.post("/{packingId}/clear")
-def clear_package_path(
+async def clear_package_path(
     packingId: int,
+    include: Optional[str] = _INCLUDE_QUERY,
     _=Depends(require_key),
+    db: DBSession = Depends(db_session),
 ):
-    rows = exec_sp("dbo.usp_Pack_Clear", [packingId])
-    return rows[0] if rows else {"Cleared": 0}
+    views = _parse_include(include)
+    rows = await db.exec_sp("dbo.usp_Pack_Clear", [packingId])
+    return await _with_views(packingId, _after_clear(packingId, rows[0] if rows else {"Cleared": 0}), views, db)
 
 
 # 5a) Alias (query style): /packing/clear?packingId=12
 @router.post("/clear")
-def clear_package_query(
+async def clear_package_query(
     packingId: int = Query(...),
+    include: Optional[str] = _INCLUDE_QUERY,
     _=Depends(require_key),
+    db: DBSession = Depends(db_session),
 ):
-    rows = exec_sp("dbo.usp_Pack_Clear", [packingId])
-    return rows[0] if rows else {"Cleared": 0}
+    views = _parse_include(include)
+    rows = await db.exec_sp("dbo.usp_Pack_Clear", [packingId])
+    return await _with_views(packingId, _after_clear(packingId, rows[0] if rows else {"Cleared": 0}), views, db)
 
 
 # --- NEW: validate packed vs staged before sealing (re-usable helper) ---
 
-def _validate_against_staging(packingId: int) -> List[Dict[str, Any]]:
+async def _validate_against_staging(packingId: int, db: Optional[DBSession] = None) -> List[Dict[str, Any]]:
     """
-    Calls dbo.usp_Pack_ValidateAgainstStaging.
+    Calls dbo.usp_Pack_ValidateAgainstStaging (on `db`'s connection when given).
     Returns:
       - [] if perfect match (we normalize 'Ok' row to empty for simplicity)
       - list of issue rows with fields:
           Issue ('Missing'|'Over'|'Extra'), ProductId, Sku, Name, Required, Packed, Delta
     """
-    rows = exec_sp("dbo.usp_Pack_ValidateAgainstStaging", [packingId]) or []
+    run = db.exec_sp if db is not None else exec_sp_async
+    rows = await run("dbo.usp_Pack_ValidateAgainstStaging", [packingId]) or []
     if rows and "Ok" in rows[0]:
         # DB returned a single OK row; normalize to empty issues list
         return []
     return rows
 
 
+async def _validate_cached(packingId: int, db: DBSession) -> List[Dict[str, Any]]:
+    """Validation issues from the in-memory pack state (DB check when nothing to go on)."""
+    state = await packing_state.get(packingId, db)
+    if state is None or state.staging_id is None:
+        return await _validate_against_staging(packingId, db)  # raises the usual DB error
+    return state.validate()
+
+
 # --- NEW: expose a GET endpoint to preview validation issues on the client ---
 
 @router.get("/{packingId}/validate")
-def validate_path(
+async def validate_path(
     packingId: int,
     _=Depends(require_key),
+    db: DBSession = Depends(db_session),
 ):
-    issues = _validate_against_staging(packingId)
+    issues = await _validate_cached(packingId, db)
     if issues:
         return {"ok": False, "issues": issues}
     return {"ok": True, "issues": []}
 
 
 @router.get("/validate")
-def validate_query(
+async def validate_query(
     packingId: int = Query(...),
     _=Depends(require_key),
+    db: DBSession = Depends(db_session),
 ):
-    issues = _validate_against_staging(packingId)
+    issues = await _validate_cached(packingId, db)
     if issues:
         return {"ok": False, "issues": issues}
     return {"ok": True, "issues": []}
 
 
+async def _sealed(row: Dict[str, Any]) -> None:
+    await package_cache.invalidate(row.get("PackageNumber"))  # requeued packages change status
+    singleflight.forget("delivery-list")
+    events.publish("delivery", {"PackageNumber": row.get("PackageNumber"), "Status": "To Load", "PrevStatus": None})
+
+
+async def _seal(packingId: int, db: DBSession) -> Dict[str, Any]:
+    # Validate and seal in one SERIALIZABLE transaction on one connection:
+    # nothing can be packed/unstaged between the check and the seal.
+    async with db.transaction(isolation="SERIALIZABLE"):
+        issues = await _validate_against_staging(packingId, db)
+        if issues:
+            # 409 Conflict: not ready to seal
+            raise HTTPException(
+                status_code=409,
+                detail={"message": "Staged requirements not satisfied.", "issues": issues},
+            )
+        rows = await db.exec_sp("dbo.usp_Pack_Seal", [packingId])
+    packing_state.drop(packingId)
+    delivery_counts.invalidate()  # seal adds/requeues a 'To Load' delivery package
+    if not rows:
+        raise HTTPException(status_code=400, detail="Seal failed")
+    await _sealed(rows[0])
+    return rows[0]
+
+
 # 6) Seal the package (path style) — now with validation guard
 @router.post("/{packingId}/seal")
-def seal_path(
+async def seal_path(
     packingId: int,
     _=Depends(require_key),
+    db: DBSession = Depends(db_session),
 ):
-    issues = _validate_against_staging(packingId)
-    if issues:
-        # 409 Conflict: not ready to seal
-        raise HTTPException(
-            status_code=409,
-            detail={"message": "Staged requirements not satisfied.", "issues": issues},
-        )
-    rows = exec_sp("dbo.usp_Pack_Seal", [packingId])
-    if not rows:
-        raise HTTPException(status_code=400, detail="Seal failed")
-    return rows[0]
+    return await _seal(packingId, db)
 
 
 # 6a) Alias (query style): /packing/seal?packingId=12 — also guarded
 @router.post("/seal")
-def seal_query(
+async def seal_query(
     packingId: int = Query(...),
     _=Depends(require_key),
+    db: DBSession = Depends(db_session),
 ):
-    issues = _validate_against_staging(packingId)
-    if issues:
-        raise HTTPException(
-            status_code=409,
-            detail={"message": "Staged requirements not satisfied.", "issues": issues},
-        )
-    rows = exec_sp("dbo.usp_Pack_Seal", [packingId])
-    if not rows:
-        raise HTTPException(status_code=400, detail="Seal failed")
-    return rows[0]
+    return await _seal(packingId, db)
 
 
 # 7) Header summary chip
 @router.get("/{packingId}/summary")
-def summary(
+async def summary(
     packingId: int,
     _=Depends(require_key),
 ):
-    rows = exec_sp("dbo.usp_Pack_Summary", [packingId])
-    return rows[0] if rows else {}
\ No newline at end of file
+    state = await packing_state.get(packingId)
+    if state is not None:
+        return state.summary()
+    return {}
\ No newline at end of file
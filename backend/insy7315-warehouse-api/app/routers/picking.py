@@ -3,13 +3,16 @@
 from datetime import datetime
 from typing import Any, List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Request, Response
 from pydantic import BaseModel
 
-from app.db import exec_sp
-from app.deps import require_key
+from app import catalog, scan_ring, versions
+from app.responses import raw_json
+from app.rowmap import Schema, field
+from app.db import DBSession, db_session, exec_sp_async
+from app.deps import CurrentUser, current_user, require_key, resolve_user_id
 
-router = APIRouter(prefix="/picking", tags=["picking"])
+router = APIRouter(prefix="/picking", tags=["picking"], dependencies=[Depends(current_user)])
 
 # ---------- Pydantic models (match Android DTOs) ----------
 
@@ -32,30 +35,73 @@ class CompletePick(BaseModel):
     ok: bool = True
     summary: Optional[List[dict[str, Any]]] = None
 
+class ScanLine(BaseModel):
+    barcodeOrSerial: str
+    qty: int = 1
 
-# ---------- helpers to normalize DB rows ----------
+class ScanLineResult(BaseModel):
+    Line: int
+    Ok: bool
+    BarcodeOrSerial: str
+    Qty: int
+    ScanId: Optional[int] = None
+    ProductId: Optional[int] = None
+    Sku: Optional[str] = None
+    Name: Optional[str] = None
+    ScannedAt: datetime | str | None = None
+    NewOnHand: Optional[int] = None
+    ErrorNumber: Optional[int] = None
+    Error: Optional[str] = None
+
+class AddScansResult(BaseModel):
+    SessionId: int
+    Applied: int
+    Failed: int
+    items: List[ScanLineResult]
 
-def _val(row: dict, *names: str, default: Any = None) -> Any:
-    """Return first present key from names (case-insensitive)."""
-    if row is None:
-        return default
-    lower = {k.lower(): v for k, v in row.items()}
-    for n in names:
-        v = lower.get(n.lower())
-        if v is not None:
-            return v
-    return default
+
+# ---------- helpers to normalize DB rows ----------
+# Column aliases are resolved once per result-set shape (app/rowmap.py)
 
 def _to_iso(dt: Any) -> Any:
     if isinstance(dt, datetime):
         return dt.isoformat()
     return dt
 
+_SESSION = Schema(
+    SessionId=field("SessionId", "PickSessionId", "Id", convert=int),
+    UserId=field("UserId", "UserID", "UID", convert=int),
+    StartedAt=field("StartedAt", "CreatedAt", "StartTime", convert=_to_iso),
+    Status=field("Status", "State", default="Active", convert=str),
+)
+
+_SCAN = Schema(
+    ScanId=field("ScanId", "Id", convert=int),
+    BarcodeOrSerial=field("BarcodeOrSerial", "Barcode", "Serial", default="", convert=str),
+    Qty=field("Qty", "Quantity", "QuantityPicked", default=1, convert=int),
+    ScannedAt=field("ScannedAt", "CreatedAt", "Timestamp", convert=_to_iso),
+)
+
+_LINE = Schema(
+    Line=field("Seq", convert=int),
+    Ok=field("Ok", default=False, convert=bool),
+    BarcodeOrSerial=field("BarcodeOrSerial", convert=str),
+    Qty=field("Qty", convert=int),
+    ScanId=field("ScanId"),
+    ProductId=field("ProductId"),
+    Sku=field("Sku"),
+    Name=field("Name"),
+    ScannedAt=field("ScannedAt", convert=_to_iso),
+    NewOnHand=field("NewOnHand"),
+    ErrorNumber=field("ErrorNumber"),
+    Error=field("ErrorMessage"),
+)
+
 
 # ---------- routes ----------
 
 @router.get("/health")
-def health():
+async def health():
     return {"ok": True, "feature": "picking"}
 
 @router.post(
@@ -63,68 +109,139 @@ def health():
     response_model=PickingSession,
     dependencies=[Depends(require_key)],
 )
-def start_session(userId: int = Query(..., description="Current user ID")):
-    rows = exec_sp("dbo.usp_Pick_StartSession", [userId])
+async def start_session(
+    userId: Optional[int] = Query(None, description="Current user ID (ignored when a bearer token is sent)"),
+    user: Optional[CurrentUser] = Depends(current_user),
+):
+    userId = resolve_user_id(user, userId)
+    rows = await exec_sp_async("dbo.usp_Pick_StartSession", [userId])
     if not rows:
         raise HTTPException(status_code=400, detail="Failed to start session")
 
-    r = rows[0]
-    return {
-        "SessionId": int(_val(r, "SessionId", "PickSessionId", "Id")),
-        "UserId": int(_val(r, "UserId", "UserID", "UID", default=userId)),
-        "StartedAt": _to_iso(_val(r, "StartedAt", "CreatedAt", "StartTime")),
-        "Status": str(_val(r, "Status", "State", default="Active")),
-    }
+    session = _SESSION.map(rows[0], UserId=userId)
+    scan_ring.started(session["SessionId"])
+    return session
 
 @router.post(
     "/add-scan",
     response_model=ScanItem,
     dependencies=[Depends(require_key)],
 )
-def add_scan(
+async def add_scan(
     sessionId: int = Query(...),
     barcodeOrSerial: str = Query(...),
     qty: int = Query(1),
+    db: DBSession = Depends(db_session),
 ):
-    rows = exec_sp("dbo.usp_Pick_AddScan", [sessionId, barcodeOrSerial, qty])
+    # Resolve the code from the shared catalog. It is only a hint: codes it doesn't
+    # know yet, and hits it got wrong (serial picked since, product gone), go
+    # through the DB lookup instead
+    hit = catalog.lookup(barcodeOrSerial, catalog.PICK_KINDS)
+    rows = None
+    if hit is not None:
+        try:
+            rows = await db.exec_sp(
+                "dbo.usp_Pick_AddScanByProduct", [sessionId, hit.product_id, hit.serial, qty]
+            )
+        except Exception as e:
+            if "51012" not in str(e) and "51014" not in str(e):
+                raise
+    if rows is None:  # the fallback runs on the same connection
+        rows = await db.exec_sp("dbo.usp_Pick_AddScan", [sessionId, barcodeOrSerial, qty])
     if not rows:
         raise HTTPException(status_code=400, detail="Add scan failed")
+    versions.bump("picking", sessionId)
+
+    item = _SCAN.map(rows[0], BarcodeOrSerial=barcodeOrSerial, Qty=qty)
+    scan_ring.add(sessionId, [item])
+    return item
 
-    r = rows[0]
-    return {
-        "ScanId": int(_val(r, "ScanId", "Id")),
-        "BarcodeOrSerial": str(
-            _val(r, "BarcodeOrSerial", "Barcode", "Serial", default=barcodeOrSerial)
-        ),
-        "Qty": int(_val(r, "Qty", "Quantity", "QuantityPicked", default=qty)),
-        "ScannedAt": _to_iso(_val(r, "ScannedAt", "CreatedAt", "Timestamp")),
-    }
+@router.post(
+    "/{sessionId}/add-scans",
+    response_model=AddScansResult,
+    dependencies=[Depends(require_key)],
+)
+async def add_scans(
+    sessionId: int,
+    lines: List[ScanLine] = Body(..., min_length=1, max_length=500),
+):
+    """
+    Bulk-pick: apply an ordered batch of scans in one round trip (dbo.usp_Pick_AddScans).
+    Every line gets its own result; a bad line doesn't fail the rest.
+    """
+    tvp = []  # (Seq, BarcodeOrSerial, ProductId, SerialNumber, Qty)
+    for i, line in enumerate(lines):
+        # Catalog hits are hints the proc re-checks; misses are resolved in the DB
+        hit = catalog.lookup(line.barcodeOrSerial, catalog.PICK_KINDS)
+        tvp.append((i, line.barcodeOrSerial,
+                    hit.product_id if hit else None, hit.serial if hit else None, line.qty))
+
+    try:
+        rows = await exec_sp_async("dbo.usp_Pick_AddScans", [sessionId, tvp])
+    except Exception as e:
+        if "51011" in str(e):
+            raise HTTPException(status_code=400, detail="Session not Active or not found")
+        raise
+    versions.bump("picking", sessionId)
+
+    results: dict[int, dict] = {}
+    for item in _LINE.map_rows(rows or []):
+        i = item["Line"]
+        if i is None or not 0 <= i < len(lines):
+            continue  # can't be tied to a line; that line is reported as failed below
+        if item["BarcodeOrSerial"] is None:
+            item["BarcodeOrSerial"] = lines[i].barcodeOrSerial
+        if item["Qty"] is None:
+            item["Qty"] = lines[i].qty
+        results[i] = item
+
+    # Every input line gets exactly one entry, in order
+    items = [
+        results.get(i) or _LINE.map(
+            {}, Line=i, Ok=False, BarcodeOrSerial=line.barcodeOrSerial, Qty=line.qty, Error="No result"
+        )
+        for i, line in enumerate(lines)
+    ]
+    scan_ring.add(sessionId, [
+        {"ScanId": it["ScanId"], "BarcodeOrSerial": it["BarcodeOrSerial"], "Qty": it["Qty"], "ScannedAt": it["ScannedAt"]}
+        for it in items if it["Ok"] and it["ScanId"] is not None
+    ])
+    applied = sum(1 for it in items if it["Ok"])
+    return {"SessionId": sessionId, "Applied": applied, "Failed": len(items) - applied, "items": items}
 
 @router.get(
     "/{sessionId}/recent",
     response_model=RecentScans,
     dependencies=[Depends(require_key)],
 )
-def recent_scans(sessionId: int, top: int = 25):
-    rows = exec_sp("dbo.usp_Pick_GetRecentScans", [sessionId, top]) or []
-    items: list[ScanItem] = []
-    for r in rows:
-        items.append(
-            ScanItem(
-                ScanId=int(_val(r, "ScanId", "Id")),
-                BarcodeOrSerial=str(_val(r, "BarcodeOrSerial", "Barcode", "Serial", default="")),
-                Qty=int(_val(r, "Qty", "Quantity", "QuantityPicked", default=1)),
-                ScannedAt=_to_iso(_val(r, "ScannedAt", "CreatedAt", "Timestamp")),
-            )
-        )
-    return {"items": items}
+async def recent_scans(request: Request, response: Response, sessionId: int, top: int = 25):
+    # If-None-Match: 304 without running the proc when nothing was scanned since
+    unchanged = versions.check(request, response, "picking", sessionId, top)
+    if unchanged is not None:
+        return unchanged
+    # Served from the session's ring; the proc only seeds it on a cold miss
+    items = scan_ring.get(sessionId, top)
+    if items is not None:
+        return raw_json({"items": items}, response)  # already ScanItem-shaped
+    seen = scan_ring.begin_load(sessionId)
+    try:
+        rows = await exec_sp_async(
+            "dbo.usp_Pick_GetRecentScans", [sessionId, max(top, scan_ring.RECENT_SCANS_MAX)]
+        ) or []
+    except Exception:
+        scan_ring.seed(sessionId, None, seen)
+        raise
+    items = _SCAN.map_rows(rows)
+    scan_ring.seed(sessionId, items, seen)
+    return raw_json({"items": items[:top]}, response)
 
 @router.post(
     "/complete",
     response_model=CompletePick,
     dependencies=[Depends(require_key)],
 )
-def complete(sessionId: int):
-    rows = exec_sp("dbo.usp_Pick_Complete", [sessionId]) or []
+async def complete(sessionId: int):
+    rows = await exec_sp_async("dbo.usp_Pick_Complete", [sessionId]) or []
+    scan_ring.drop(sessionId)
     # We pass through the summary so you can render it or hand off to the next stage later.
     return {"ok": True, "summary": rows}
\ No newline at end of file
@@ -1,87 +1,265 @@
 # app/routers/stock.py
-from fastapi import APIRouter, Depends, HTTPException, Query, Body
-from typing import Any, Dict, List, Optional
+import asyncio, os
+from fastapi import APIRouter, Depends, HTTPException, Query, Body, Request, Response
+from pydantic import BaseModel, Field
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Literal, Optional
 
-from app.deps import require_key
-from app.db import exec_sp, get_conn
+from app.deps import CurrentUser, current_user, require_key, resolve_user_id
+from app import catalog, product_search, stock_buffer, versions
+from app.db import DBSession, db_session, exec_sp_async, exec_sp_sets_async, stream_sp
+from app.responses import ClosingStreamingResponse, raw_json
+from app.streaming import csv_lines, gzipped, ndjson_lines
 
-router = APIRouter(prefix="/stock", tags=["stock"])
+router = APIRouter(prefix="/stock", tags=["stock"], dependencies=[Depends(current_user)])
+
+class CountLine(BaseModel):
+    barcodeOrSku: str
+    qty: int = 1
+    scannedAt: Optional[datetime] = None
+    countId: Optional[str] = Field(None, max_length=64, description="Device count id; re-sent ids are applied once")
+
+def _utc_naive(dt: Optional[datetime]) -> Optional[datetime]:
+    # pyodbc can't bind tz-aware datetimes; the DB stores UTC
+    if dt is None or dt.tzinfo is None:
+        return dt
+    return dt.astimezone(timezone.utc).replace(tzinfo=None)
+
+async def _drain(stockTakeId: int) -> None:
+    # Write-behind mode: get this stock take's buffered counts into the DB first
+    buf = stock_buffer.get_buffer()
+    if buf is None or not buf.has_pending(stockTakeId):
+        return
+    try:
+        await buf.flush(stockTakeId)
+    except Exception:
+        raise HTTPException(status_code=503, detail="Buffered counts not written yet, try again")
 
 @router.get("/health")
-def health(_=Depends(require_key)):
+async def health(_=Depends(require_key)):
     return {"ok": True, "feature": "stock"}
 
-# --- small helper for procs that return multiple result sets ---
-def _exec_sp_multi(sp_name: str, params: list) -> List[List[Dict[str, Any]]]:
-    sets: List[List[Dict[str, Any]]] = []
-    with get_conn() as conn:
-        cur = conn.cursor()
-        placeholders = ",".join(["?"] * len(params))
-        cur.execute(f"EXEC {sp_name} {placeholders}", params)
-        while True:
-            if cur.description:
-                cols = [d[0] for d in cur.description]
-                rows = [dict(zip(cols, r)) for r in cur.fetchall()]
-                sets.append(rows)
-            if not cur.nextset():
-                break
-    return sets
-
 # 1) Start a stock-take session
 @router.post("/start")
-def start_session(
-    userId: int = Query(..., description="User starting the stock take"),
+async def start_session(
+    userId: Optional[int] = Query(None, description="User starting the stock take (ignored when a bearer token is sent)"),
     name: Optional[str] = Query(None, description="Optional session name"),
+    user: Optional[CurrentUser] = Depends(current_user),
     _=Depends(require_key),
 ):
-    rows = exec_sp("dbo.usp_Stock_StartSession", [userId, name])
+    userId = resolve_user_id(user, userId)
+    rows = await exec_sp_async("dbo.usp_Stock_StartSession", [userId, name])
     if not rows:
         raise HTTPException(status_code=400, detail="Failed to start stock session")
     return rows[0]
 
 # 2) List items within a stock-take (with optional search)
 @router.get("/{stockTakeId}/items")
-def list_items(
+async def list_items(
+    request: Request,
+    response: Response,
     stockTakeId: int,
     search: Optional[str] = Query(None, description="Filter by SKU or Name"),
     _=Depends(require_key),
 ):
-    rows = exec_sp("dbo.usp_Stock_ListItems", [stockTakeId, search])
-    return {"items": rows}
+    await _drain(stockTakeId)
+    # If-None-Match: 304 without running the proc when nothing was counted since
+    unchanged = versions.check(request, response, "stock", stockTakeId, search)
+    if unchanged is not None:
+        return unchanged
+    # Type-ahead: the in-process index resolves the ProductIds, the DB only joins those
+    ids = product_search.search(search) if search else None
+    if ids == []:
+        return raw_json({"items": []}, response)
+    if ids is not None:
+        tvp = [(i, pid) for i, pid in enumerate(ids)]  # (Seq, ProductId): rank order
+        rows = await exec_sp_async("dbo.usp_Stock_ListItemsByIds", [stockTakeId, tvp])
+    else:
+        rows = await exec_sp_async("dbo.usp_Stock_ListItems", [stockTakeId, search])
+    return raw_json({"items": rows}, response)  # plain DB values: skip jsonable_encoder
 
 # 3) Add count (scan) to the stock-take
 @router.post("/add")
-def add_count(
+async def add_count(
     _=Depends(require_key),
     stockTakeId: int = Query(...),
     barcodeOrSku: str = Query(...),
     qty: int = Query(1, ge=1),
+    db: DBSession = Depends(db_session),
 ):
-    rows = exec_sp("dbo.usp_Stock_AddCount", [stockTakeId, barcodeOrSku, qty])
+    # Catalog hit first; unknown codes and stale hits (product gone) use the DB lookup
+    hit = catalog.lookup(barcodeOrSku, catalog.STOCK_KINDS)
+    buf = stock_buffer.get_buffer()
+    if buf is not None and buf.is_closed(stockTakeId):
+        raise HTTPException(status_code=400, detail="Stock take not In Progress or not found")
+    if buf is not None and hit is not None and buf.row(stockTakeId, hit.product_id) is not None:
+        # Acknowledged once it's in the local log; the flusher writes it in a batch.
+        # Only for products the DB already returned a row for, so the reply has its fields.
+        await buf.add(stockTakeId, hit.product_id, barcodeOrSku, qty, hit.sku, hit.name)
+        return {**buf.row(stockTakeId, hit.product_id), "Qty": qty, "Buffered": True}
+    await _drain(stockTakeId)  # keep scan order when a code has to go through the DB lookup
+    rows = None
+    if hit is not None:
+        try:
+            rows = await db.exec_sp("dbo.usp_Stock_AddCountByProduct", [stockTakeId, hit.product_id, qty])
+        except Exception as e:
+            if "52012" not in str(e):
+                raise
+    if rows is None:  # the fallback runs on the same connection
+        rows = await db.exec_sp("dbo.usp_Stock_AddCount", [stockTakeId, barcodeOrSku, qty])
     if not rows:
         raise HTTPException(status_code=400, detail="Add count failed")
+    versions.bump("stock", stockTakeId)
+    if buf is not None:
+        buf.remember(rows)  # the next scan of this product can be buffered
     # returns the updated row for this product
     return rows[0]
 
+# 3a) Bulk upload of buffered counts (offline sync of a whole aisle)
+@router.post("/{stockTakeId}/add-counts")
+async def add_counts(
+    stockTakeId: int,
+    lines: List[CountLine] = Body(..., min_length=1, max_length=10000),
+    _=Depends(require_key),
+):
+    await _drain(stockTakeId)
+    # Pre-resolve what the catalog knows; the proc resolves the rest set-based
+    tvp = []  # (Seq, BarcodeOrSku, ProductId, Qty, ScannedAt, CountId)
+    for i, line in enumerate(lines):
+        hit = catalog.lookup(line.barcodeOrSku, catalog.STOCK_KINDS)
+        tvp.append((
+            i, line.barcodeOrSku, hit.product_id if hit else None, line.qty, _utc_naive(line.scannedAt), line.countId,
+        ))
+
+    try:
+        # Bounded by the 10k-line body: read every set so the counts (and the
+        # proc's row locks) are committed before the response goes out
+        result_sets = await exec_sp_sets_async("dbo.usp_Stock_AddCounts", [stockTakeId, tvp])
+    except Exception as e:
+        if "52011" in str(e):
+            raise HTTPException(status_code=400, detail="Stock take not In Progress or not found")
+        raise
+    versions.bump("stock", stockTakeId)
+
+    # Sets: [summary], [rejected lines], [updated items]
+    summary = result_sets[0][0] if len(result_sets) > 0 and result_sets[0] else {}
+    unknown = result_sets[1] if len(result_sets) > 1 else []
+    items = result_sets[2] if len(result_sets) > 2 else []
+    buf = stock_buffer.get_buffer()
+    if buf is not None:
+        buf.remember(items)
+    return raw_json({"StockTakeId": stockTakeId, "summary": summary, "unknown": unknown, "items": items})
+
 # 4) Undo last scan in this stock-take
 @router.post("/{stockTakeId}/undo-last")
-def undo_last(stockTakeId: int, _=Depends(require_key)):
-    rows = exec_sp("dbo.usp_Stock_UndoLast", [stockTakeId])
+async def undo_last(stockTakeId: int, _=Depends(require_key)):
+    buf = stock_buffer.get_buffer()
+    if buf is not None:
+        c = await buf.undo_last(stockTakeId)
+        if c is not None:  # the last scan never reached the DB: take it back in memory
+            row = buf.row(stockTakeId, c.product_id) or {
+                "StockTakeId": stockTakeId, "ProductId": c.product_id, "Sku": c.sku, "Name": c.name,
+                "PendingQty": buf.pending_qty(stockTakeId, c.product_id),
+            }
+            return {**row, "Removed": c.qty, "Buffered": True}
+    rows = await exec_sp_async("dbo.usp_Stock_UndoLast", [stockTakeId])
     if not rows:
         # proc throws when nothing to undo; if caught at DB layer, rows may be empty
         raise HTTPException(status_code=400, detail="Nothing to undo")
+    versions.bump("stock", stockTakeId)
+    if buf is not None:
+        buf.remember(rows)
     return rows[0]
 
+# 4a) Buffered counts the DB refused (stock take finished before they were written)
+@router.get("/{stockTakeId}/rejected-counts")
+async def rejected_counts(stockTakeId: int, _=Depends(require_key)):
+    buf = stock_buffer.get_buffer()
+    counts = buf.rejected(stockTakeId) if buf is not None else []
+    return {
+        "StockTakeId": stockTakeId,
+        "items": [
+            {"ProductId": c.product_id, "Sku": c.sku, "Name": c.name, "BarcodeOrSku": c.code,
+             "Qty": c.qty, "ScannedAt": c.at, "CountId": c.count_id}
+            for c in counts
+        ],
+    }
+
 # 5) Finish / complete the stock-take (returns 3 result sets)
 @router.post("/{stockTakeId}/finish")
-def finish(stockTakeId: int, _=Depends(require_key)):
-    result_sets = _exec_sp_multi("dbo.usp_Stock_Finish", [stockTakeId])
+async def finish(stockTakeId: int, _=Depends(require_key)):
+    await _drain(stockTakeId)
+    # Small, bounded sets (discrepancies are TOP 50): read them all so the
+    # finish is committed and the connection released before responding
+    result_sets = await exec_sp_sets_async("dbo.usp_Stock_Finish", [stockTakeId])
+    versions.bump("stock", stockTakeId)
+    buf = stock_buffer.get_buffer()
+    if buf is not None:
+        buf.close(stockTakeId)  # later scans get a 400 instead of being acknowledged
     # Expecting: [header], [totals], [discrepancies]
     header = result_sets[0][0] if len(result_sets) > 0 and result_sets[0] else {}
     totals = result_sets[1][0] if len(result_sets) > 1 and result_sets[1] else {}
     discrepancies = result_sets[2] if len(result_sets) > 2 else []
-    return {
-        "header": header,
-        "totals": totals,
-        "discrepancies": discrepancies
-    }
\ No newline at end of file
+    return raw_json({"header": header, "totals": totals, "discrepancies": discrepancies})
+
+# 6) Export lines for download / reconciliation (streamed, constant memory)
+_EXPORT_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+# Each running export holds a pooled connection until the client has read it all
+STOCK_EXPORT_MAX = int(os.getenv("STOCK_EXPORT_MAX", "4"))
+_export_slots = asyncio.Semaphore(STOCK_EXPORT_MAX)
+
+@router.get("/{stockTakeId}/export")
+async def export_lines(
+    request: Request,
+    stockTakeId: int,
+    format: Literal["ndjson", "csv"] = Query("ndjson"),
+    only: Literal["items", "discrepancies"] = Query("items", description="All lines or only mismatches"),
+    _=Depends(require_key),
+):
+    """
+    Every line of the stock take (or only the discrepancies; finish caps those
+    at 50) as NDJSON or CSV. Rows are written as they come off the cursor;
+    send Accept-Encoding: gzip to have the stream compressed on the fly.
+    """
+    await _drain(stockTakeId)
+    if _export_slots.locked():
+        raise HTTPException(status_code=503, detail="Too many exports running, try again", headers={"Retry-After": "5"})
+    await _export_slots.acquire()
+    try:
+        # Opened before responding so proc errors still surface as a normal error status
+        sp = await stream_sp("dbo.usp_Stock_ExportLines", [stockTakeId, 1 if only == "discrepancies" else 0]).open()
+    except BaseException:
+        _export_slots.release()
+        raise
+
+    released = False
+
+    async def release():
+        # Connection and slot go back once: after the last row, or when the response ends
+        nonlocal released
+        if released:
+            return
+        released = True
+        try:
+            await sp.close()
+        finally:
+            _export_slots.release()
+
+    async def body():
+        try:
+            async for chunk in (csv_lines(sp) if format == "csv" else ndjson_lines(sp)):
+                yield chunk
+        finally:
+            await release()
+
+    try:
+        headers = {"Content-Disposition": f'attachment; filename="stocktake-{stockTakeId}-{only}.{format}"'}
+        chunks = body()
+        if "gzip" in request.headers.get("accept-encoding", "").lower():
+            headers["Content-Encoding"] = "gzip"
+            headers["Vary"] = "Accept-Encoding"
+            chunks = gzipped(chunks)
+        return ClosingStreamingResponse(chunks, on_close=release, media_type=_EXPORT_TYPES[format], headers=headers)
+    except BaseException:
+        await release()
+        raise
@@ -0,0 +1,68 @@
+# app/rowmap.py
+#
+# Row mappers for procs whose column names drift (ScanId vs Id, Qty vs
+# Quantity, ...). A Schema lists the output fields with their accepted column
+# aliases; the first time it sees a given column list it resolves every alias
+# to the real column once (case-insensitive) and keeps that plan. Mapping a
+# row is then one lookup per field instead of re-scanning the row per field.
+
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+
+class Field(NamedTuple):
+    aliases: Tuple[str, ...]
+    default: Any = None
+    convert: Optional[Callable[[Any], Any]] = None
+
+
+def field(*aliases: str, default: Any = None, convert: Optional[Callable[[Any], Any]] = None) -> Field:
+    return Field(aliases, default, convert)
+
+
+_Plan = List[Tuple[str, Tuple[str, ...], Any, Optional[Callable[[Any], Any]]]]
+
+
+class Schema:
+    """Output field -> Field(aliases, default, convert). Aliases are tried in order;
+    the first non-NULL value wins (convert is applied to it), else the default."""
+
+    def __init__(self, **fields: Field):
+        self.fields = fields
+        self._plans: Dict[Tuple[str, ...], _Plan] = {}
+
+    def _plan(self, columns: Tuple[str, ...]) -> _Plan:
+        plan = self._plans.get(columns)
+        if plan is None:
+            lower: Dict[str, str] = {}
+            for c in columns:
+                lower.setdefault(c.lower(), c)
+            plan = [
+                (name, tuple(lower[a.lower()] for a in f.aliases if a.lower() in lower), f.default, f.convert)
+                for name, f in self.fields.items()
+            ]
+            if len(self._plans) < 64:  # a proc has one shape (or a few); don't grow on junk
+                self._plans[columns] = plan
+        return plan
+
+    def map(self, row: Dict[str, Any], **defaults: Any) -> Dict[str, Any]:
+        """One row; keyword arguments override field defaults for this call."""
+        return _apply(self._plan(tuple(row)), row, defaults)
+
+    def map_rows(self, rows: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return [_apply(self._plan(tuple(row)), row, {}) for row in rows]
+
+
+def _apply(plan: _Plan, row: Dict[str, Any], defaults: Dict[str, Any]) -> Dict[str, Any]:
+    out = {}
+    for name, keys, default, convert in plan:
+        v = None
+        for k in keys:
+            v = row.get(k)
+            if v is not None:
+                break
+        if v is None:
+            v = defaults.get(name, default)
+        elif convert is not None:
+            v = convert(v)
+        out[name] = v
+    return out
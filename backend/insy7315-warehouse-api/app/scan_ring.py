@@ -0,0 +1,132 @@
+# app/scan_ring.py
+#
+# Last RECENT_SCANS_MAX scans per picking session, kept in the API so
+# /picking/{id}/recent (called after every scan) doesn't hit the DB.
+#
+# A ring is seeded from dbo.usp_Pick_GetRecentScans (or empty when the
+# session was started here) and then fed by add-scan / add-scans. Complete
+# drops it; sessions idle for RECENT_SCANS_IDLE seconds are evicted, and at
+# most RECENT_SCANS_SESSIONS rings are kept (least recently used goes first).
+#
+# Rings are per process: scans posted through another worker are not seen
+# here. RECENT_SCANS_TTL bounds how long a worker trusts a ring before it
+# reseeds from the proc (same idea as PACK_STATE_TTL), even while polled.
+
+import os, time
+from collections import OrderedDict, deque
+from typing import Any, Dict, Iterable, List, Optional
+
+RECENT_SCANS_MAX = int(os.getenv("RECENT_SCANS_MAX", "50"))
+RECENT_SCANS_IDLE = float(os.getenv("RECENT_SCANS_IDLE", "900"))
+RECENT_SCANS_TTL = float(os.getenv("RECENT_SCANS_TTL", "30"))
+RECENT_SCANS_SESSIONS = int(os.getenv("RECENT_SCANS_SESSIONS", "1000"))
+
+
+class Ring:
+    def __init__(self, items: Iterable[Dict[str, Any]] = ()):
+        # Oldest first, so append() is the newest scan
+        self.items: "deque[Dict[str, Any]]" = deque(items, maxlen=RECENT_SCANS_MAX)
+        self.loaded_at = self.touched = time.monotonic()
+
+    @property
+    def idle(self) -> bool:
+        return time.monotonic() - self.touched > RECENT_SCANS_IDLE
+
+    @property
+    def stale(self) -> bool:
+        return self.idle or time.monotonic() - self.loaded_at > RECENT_SCANS_TTL
+
+    def newest(self, top: int) -> List[Dict[str, Any]]:
+        """Same order as the proc: newest scan first."""
+        out = []
+        for item in reversed(self.items):
+            if len(out) >= top:
+                break
+            out.append(item)
+        return out
+
+
+_rings: "OrderedDict[int, Ring]" = OrderedDict()
+# SessionId -> [seed reads in flight, scans since the first of them started].
+# Kept until the last overlapping read is seeded, so each one can tell
+# whether a scan landed during its own read.
+_loading: Dict[int, List[int]] = {}
+_stats = {"hits": 0, "misses": 0}
+
+
+def _store(session_id: int, ring: Ring) -> None:
+    _rings[session_id] = ring
+    _rings.move_to_end(session_id)
+    while len(_rings) > RECENT_SCANS_SESSIONS:
+        _rings.popitem(last=False)
+
+
+def get(session_id: int, top: int) -> Optional[List[Dict[str, Any]]]:
+    """Newest `top` scans, or None when the ring can't answer (cold, stale or top too big)."""
+    ring = _rings.get(session_id)
+    if ring is not None and ring.stale:
+        _rings.pop(session_id, None)
+        ring = None
+    if ring is None or top > RECENT_SCANS_MAX:
+        _stats["misses"] += 1
+        return None
+    ring.touched = time.monotonic()
+    _rings.move_to_end(session_id)
+    _stats["hits"] += 1
+    return ring.newest(top)
+
+
+def begin_load(session_id: int) -> int:
+    """Call before reading the proc for a seed; pass the result to seed()."""
+    entry = _loading.setdefault(session_id, [0, 0])
+    entry[0] += 1
+    return entry[1]
+
+
+def seed(session_id: int, newest_first: Optional[List[Dict[str, Any]]], seen: int) -> None:
+    """Keep a proc read (newest first) unless a scan raced it; None = the read failed."""
+    entry = _loading.get(session_id)
+    if entry is None:  # reset() in between
+        return
+    writes = entry[1] - seen
+    entry[0] -= 1
+    if entry[0] == 0:
+        del _loading[session_id]
+    if newest_first is not None and writes == 0:
+        _store(session_id, Ring(reversed(newest_first)))
+
+
+def started(session_id: int) -> None:
+    """A session created here has no scans yet: nothing to read."""
+    _store(session_id, Ring())
+
+
+def _wrote(session_id: int) -> None:
+    entry = _loading.get(session_id)
+    if entry is not None:
+        entry[1] += 1
+
+
+def add(session_id: int, items: Iterable[Dict[str, Any]]) -> None:
+    """New scans (oldest first). Only extends a ring that's already seeded."""
+    _wrote(session_id)
+    ring = _rings.get(session_id)
+    if ring is None:
+        return
+    ring.items.extend(items)
+    ring.touched = time.monotonic()
+
+
+def drop(session_id: int) -> None:
+    _rings.pop(session_id, None)
+    _wrote(session_id)
+
+
+def stats() -> Dict[str, int]:
+    return {"sessions": len(_rings), **_stats}
+
+
+def reset() -> None:
+    _rings.clear()
+    _loading.clear()
+    _stats.update(hits=0, misses=0)
@@ -1,8 +1,9 @@
 # app/security.py
 
-import os
+import hashlib, os, threading, time
+from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Optional, Tuple
 
 from passlib.context import CryptContext
 import jwt
@@ -11,7 +12,20 @@ from dotenv import load_dotenv
 load_dotenv()
 
 # ----- Password hashing (Argon2 via passlib) -----
-_pwd_ctx = CryptContext(schemes=["argon2"], deprecated="auto")
+# Unset params keep passlib's defaults. Changing any of them makes existing
+# hashes "need update", and they are re-hashed on the user's next login.
+def _argon2_settings() -> Dict[str, int]:
+    settings = {}
+    for env, key in (
+        ("ARGON2_TIME_COST", "argon2__time_cost"),
+        ("ARGON2_MEMORY_COST", "argon2__memory_cost"),  # KiB
+        ("ARGON2_PARALLELISM", "argon2__parallelism"),
+    ):
+        if os.getenv(env):
+            settings[key] = int(os.getenv(env))
+    return settings
+
+_pwd_ctx = CryptContext(schemes=["argon2"], deprecated="auto", **_argon2_settings())
 
 def hash_password(password: str) -> str:
     return _pwd_ctx.hash(password)
@@ -22,6 +36,13 @@ def verify_password(password: str, password_hash: str) -> bool:
     except Exception:
         return False
 
+def verify_and_update(password: str, password_hash: str) -> Tuple[bool, Optional[str]]:
+    """(ok, new_hash): new_hash is set when the stored hash uses outdated Argon2 params."""
+    try:
+        return _pwd_ctx.verify_and_update(password, password_hash)
+    except Exception:
+        return False, None
+
 # ----- JWT settings -----
 JWT_SECRET = os.getenv("JWT_SECRET", "dev-secret-change-me")
 JWT_ISS = os.getenv("JWT_ISS", "insy7315-warehouse")
@@ -61,4 +82,46 @@ def decode_token(token: str) -> Dict[str, Any]:
         algorithms=["HS256"],
         audience=JWT_AUD,
         issuer=JWT_ISS,
-    )
\ No newline at end of file
+    )
+
+# ----- Verified-token cache -----
+# Devices send the same token on every call; verifying the HMAC each time is
+# wasted work. Claims of tokens that already passed decode_token are kept in a
+# bounded LRU keyed by the token's digest and dropped once `exp` passes.
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "4096"))
+
+_verified: "OrderedDict[bytes, Dict[str, Any]]" = OrderedDict()
+_verified_lock = threading.Lock()
+_token_stats = {"hits": 0, "misses": 0, "expired": 0, "evicted": 0}
+
+def verify_token(token: str) -> Dict[str, Any]:
+    """decode_token, memoized. Raises jwt.InvalidTokenError like decode_token."""
+    key = hashlib.sha256(token.encode("utf-8")).digest()
+    with _verified_lock:
+        claims = _verified.get(key)
+        if claims is not None:
+            if claims["exp"] > time.time():
+                _verified.move_to_end(key)
+                _token_stats["hits"] += 1
+                return claims
+            del _verified[key]
+            _token_stats["expired"] += 1
+        _token_stats["misses"] += 1
+
+    claims = decode_token(token)
+    if TOKEN_CACHE_SIZE > 0 and "exp" in claims:
+        with _verified_lock:
+            _verified[key] = claims
+            while len(_verified) > TOKEN_CACHE_SIZE:
+                _verified.popitem(last=False)
+                _token_stats["evicted"] += 1
+    return claims
+
+def clear_token_cache() -> None:
+    # e.g. after rotating JWT_SECRET
+    with _verified_lock:
+        _verified.clear()
+
+def token_cache_stats() -> Dict[str, int]:
+    with _verified_lock:
+        return {"size": len(_verified), "max_size": TOKEN_CACHE_SIZE, **_token_stats}
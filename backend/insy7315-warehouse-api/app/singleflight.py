@@ -0,0 +1,93 @@
+# app/singleflight.py
+#
+# Request coalescing for idempotent reads that every device polls at once
+# (wave start: dozens of tablets asking for the same /delivery/list page or
+# /staging/{id}/lines in the same second).
+#
+# Identical concurrent calls (same kind + normalized parameters) share one
+# in-flight DB execution and its result. With SINGLEFLIGHT_TTL > 0 the result
+# is also reused for that long (a micro-TTL, e.g. 0.5 s) to flatten polling
+# storms further. Writes call forget() so nobody joins a read that started
+# before the write.
+#
+# The leader runs as its own task: a client that disconnects doesn't cancel
+# the call for everyone else waiting on it. Per process, like the other caches.
+
+import asyncio, os, time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+SINGLEFLIGHT_ENABLED = os.getenv("SINGLEFLIGHT_ENABLED", "1") == "1"
+SINGLEFLIGHT_TTL = float(os.getenv("SINGLEFLIGHT_TTL", "0"))
+
+_Key = Tuple[str, Hashable]
+
+
+class Group:
+    def __init__(self, ttl: float = SINGLEFLIGHT_TTL):
+        self.ttl = ttl
+        self._inflight: Dict[_Key, "asyncio.Task"] = {}
+        self._recent: Dict[_Key, Tuple[float, Any]] = {}
+        self._stats = {"calls": 0, "executions": 0, "shared": 0, "ttl_hits": 0}
+
+    async def do(self, kind: str, params: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Result of fn(), shared with every identical call in flight (and within the TTL)."""
+        key = (kind, params)
+        self._stats["calls"] += 1
+        if not SINGLEFLIGHT_ENABLED:
+            self._stats["executions"] += 1
+            return await fn()
+
+        hit = self._recent.get(key)
+        if hit is not None:
+            if time.monotonic() < hit[0]:
+                self._stats["ttl_hits"] += 1
+                return hit[1]
+            del self._recent[key]
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            self._stats["executions"] += 1
+            task.add_done_callback(lambda t, key=key: self._done(key, t))
+        else:
+            self._stats["shared"] += 1
+        return await asyncio.shield(task)
+
+    def _done(self, key: _Key, task: "asyncio.Task") -> None:
+        # Retrieve the error even when every caller went away (no "never retrieved" noise)
+        failed = task.cancelled() or task.exception() is not None
+        if self._inflight.get(key) is not task:
+            return  # forgotten mid-flight: its result is already out of date
+        del self._inflight[key]
+        if self.ttl > 0 and not failed:
+            self._recent[key] = (time.monotonic() + self.ttl, task.result())
+
+    def forget(self, kind: str, params: Hashable = None) -> None:
+        """A write happened: later callers start a fresh read (of one key, or the whole kind)."""
+        for store in (self._inflight, self._recent):
+            for key in [k for k in store if k[0] == kind and (params is None or k[1] == params)]:
+                del store[key]
+
+    def stats(self) -> Dict[str, Any]:
+        return {"inflight": len(self._inflight), "recent": len(self._recent), **self._stats}
+
+
+_group = Group()
+
+
+async def do(kind: str, params: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+    return await _group.do(kind, params, fn)
+
+
+def forget(kind: str, params: Hashable = None) -> None:
+    _group.forget(kind, params)
+
+
+def stats() -> Dict[str, Any]:
+    return _group.stats()
+
+
+def reset() -> None:
+    global _group
+    _group = Group()
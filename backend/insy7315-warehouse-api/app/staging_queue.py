@@ -0,0 +1,84 @@
+# app/staging_queue.py
+#
+# Parking lot for idle packing stations (long-poll /staging/claim-next).
+#
+# The work itself stays in dbo.PickToPack; this only decides *when* a waiting
+# packer should try usp_Pack_ClaimNext again. Staging and release call notify(),
+# which wakes the longest-waiting packer first (FIFO). A packer that wakes up
+# and loses the race re-parks at the front, so it keeps its place in line.
+#
+# The generation counter closes the gap between "claim found nothing" and
+# "parked": if work was announced in between, wait() returns at once.
+# Work staged through another worker is not announced here; waiters also
+# re-check the DB every STAGING_RECHECK seconds to pick that up.
+
+import asyncio, os
+from collections import deque
+from typing import Dict
+
+STAGING_RECHECK = float(os.getenv("STAGING_RECHECK", "10"))
+STAGING_MAX_WAIT = float(os.getenv("STAGING_MAX_WAIT", "30"))
+
+
+class WorkQueue:
+    def __init__(self):
+        self._waiters: "deque[asyncio.Future]" = deque()
+        self.generation = 0
+        self.woken = 0
+        self.timeouts = 0
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for f in self._waiters if not f.done())
+
+    async def wait(self, timeout: float, since: int, front: bool = False) -> bool:
+        """Park until notified (True) or timeout (False). Returns at once if work
+        was announced after generation `since`."""
+        if self.generation != since:
+            return True
+        fut = asyncio.get_running_loop().create_future()
+        if front:
+            self._waiters.appendleft(fut)
+        else:
+            self._waiters.append(fut)
+        try:
+            return await asyncio.wait_for(fut, timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            return False
+        finally:
+            try:
+                self._waiters.remove(fut)
+            except ValueError:
+                pass  # already handed out by notify()
+
+    def notify(self, n: int = 1) -> int:
+        """New work: wake up to n waiters, oldest first."""
+        self.generation += 1
+        woken = 0
+        while woken < n and self._waiters:
+            fut = self._waiters.popleft()
+            if not fut.done():  # skip waiters that timed out or disconnected
+                fut.set_result(True)
+                woken += 1
+        self.woken += woken
+        return woken
+
+    def stats(self) -> Dict[str, int]:
+        return {"waiting": self.waiting, "generation": self.generation, "woken": self.woken, "timeouts": self.timeouts}
+
+
+_queue = WorkQueue()
+
+
+def get_queue() -> WorkQueue:
+    return _queue
+
+
+def notify(n: int = 1) -> int:
+    return _queue.notify(n)
+
+
+def reset() -> None:
+    global _queue
+    _queue = WorkQueue()
@@ -0,0 +1,305 @@
+# app/stock_buffer.py
+#
+# Optional write-behind for /stock/add (STOCK_WRITE_BEHIND=1).
+#
+# A count is acknowledged once it is appended (and fsync'd) to a local
+# append-only log, then kept in memory with a running total per
+# (StockTakeId, ProductId). A background task writes the pending counts in
+# batches, one dbo.usp_Stock_AddCounts call per stock take, every
+# STOCK_WB_FLUSH_MS or as soon as STOCK_WB_BATCH counts are waiting. On
+# startup the log is replayed, so acknowledged counts survive a crash.
+#
+# Log records (JSON lines): {"op":"add",...}, {"op":"undo","id":n},
+# {"op":"done","ids":[...]}. The file is truncated whenever nothing is
+# pending. A crash between a batch commit and its "done" record replays that
+# batch once more; every count carries a random count_id that the proc logs
+# with the scan and skips when it sees it again, so a replay is applied once.
+#
+# Only products the DB has already answered for are buffered: the last row
+# usp_Stock_AddCount(s) returned is kept, so a buffered response has the same
+# fields as a direct one (CountedQty = that row plus what's pending here).
+# A stock take the DB rejects (52011: finished or gone) is marked closed: its
+# pending counts are kept for GET /stock/{id}/rejected-counts and new scans
+# for it are refused instead of acknowledged.
+#
+# Readers keep a consistent view: list / finish flush the stock take first,
+# undo-last removes a still-pending scan in memory. One log per process: run
+# the API on one worker (or give each worker its own STOCK_WB_LOG).
+
+import asyncio, json, os, threading, uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from app import versions
+from app.db import exec_sp_sets_async
+
+STOCK_WRITE_BEHIND = os.getenv("STOCK_WRITE_BEHIND", "0") == "1"
+STOCK_WB_LOG = os.getenv("STOCK_WB_LOG", "stock-counts.log")
+STOCK_WB_FLUSH_MS = float(os.getenv("STOCK_WB_FLUSH_MS", "250"))
+STOCK_WB_BATCH = int(os.getenv("STOCK_WB_BATCH", "500"))
+STOCK_WB_ROWS_MAX = int(os.getenv("STOCK_WB_ROWS_MAX", "50000"))   # known (StockTakeId, ProductId) rows
+STOCK_WB_CLOSED_MAX = int(os.getenv("STOCK_WB_CLOSED_MAX", "1000"))  # closed stock takes remembered
+
+
+class Count(NamedTuple):
+    id: int
+    stock_take_id: int
+    product_id: int
+    code: str
+    qty: int
+    at: str          # scan time, ISO UTC
+    sku: Optional[str] = None
+    name: Optional[str] = None
+    count_id: Optional[str] = None   # sent to the DB, which applies each id once
+
+
+class CountLog:
+    """Append-only JSON-lines file; every append is flushed and fsync'd."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._f = open(path, "a", encoding="utf-8")
+
+    def append(self, *records: Dict[str, Any]) -> None:
+        data = "".join(json.dumps(r, separators=(",", ":")) + "\n" for r in records)
+        with self._lock:
+            self._f.write(data)
+            self._f.flush()
+            os.fsync(self._f.fileno())
+
+    def replay(self) -> List[Count]:
+        """Counts that were acknowledged but never confirmed written."""
+        pending: "OrderedDict[int, Count]" = OrderedDict()
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    r = json.loads(line)
+                except ValueError:
+                    break  # torn last line from a crash mid-append: it was never acknowledged
+                if r["op"] == "add":
+                    pending[r["id"]] = Count(**{k: v for k, v in r.items() if k != "op"})
+                elif r["op"] == "undo":
+                    pending.pop(r["id"], None)
+                elif r["op"] == "done":
+                    for i in r["ids"]:
+                        pending.pop(i, None)
+        return list(pending.values())
+
+    def truncate(self) -> None:
+        with self._lock:
+            self._f.seek(0)
+            self._f.truncate()
+            self._f.flush()
+            os.fsync(self._f.fileno())
+
+    def close(self) -> None:
+        with self._lock:
+            self._f.close()
+
+
+class CountBuffer:
+    def __init__(self, log: CountLog):
+        self.log = log
+        self._pending: "OrderedDict[int, Count]" = OrderedDict()   # oldest first
+        self._totals: Dict[Tuple[int, int], int] = {}              # (StockTakeId, ProductId) -> qty
+        self._rows: "OrderedDict[Tuple[int, int], Dict[str, Any]]" = OrderedDict()  # last DB row, LRU
+        self._closed: "OrderedDict[int, List[Count]]" = OrderedDict()  # StockTakeId -> rejected counts
+        self._next = 1
+        self._appending = 0
+        self._lock = asyncio.Lock()   # one flush (or undo) at a time
+        self._wake = asyncio.Event()
+        self._stats = {"accepted": 0, "flushed": 0, "batches": 0, "rejected": 0, "failures": 0}
+
+        for c in log.replay():
+            self._keep(c)
+            self._next = max(self._next, c.id + 1)
+
+    # ---- bookkeeping ----
+
+    def _keep(self, c: Count) -> None:
+        self._pending[c.id] = c
+        key = (c.stock_take_id, c.product_id)
+        self._totals[key] = self._totals.get(key, 0) + c.qty
+
+    def _forget(self, c: Count) -> None:
+        self._pending.pop(c.id, None)
+        key = (c.stock_take_id, c.product_id)
+        left = self._totals.get(key, 0) - c.qty
+        if left > 0:
+            self._totals[key] = left
+        else:
+            self._totals.pop(key, None)
+
+    def pending_qty(self, stock_take_id: int, product_id: int) -> int:
+        return self._totals.get((stock_take_id, product_id), 0)
+
+    def has_pending(self, stock_take_id: int) -> bool:
+        return any(k[0] == stock_take_id for k in self._totals)
+
+    def remember(self, rows: List[Dict[str, Any]]) -> None:
+        """Keep StockTakeItems rows the DB returned (after any counts they include were forgotten)."""
+        for r in rows:
+            key = (r.get("StockTakeId"), r.get("ProductId"))
+            if None in key or "CountedQty" not in r:
+                continue
+            self._rows[key] = dict(r)
+            self._rows.move_to_end(key)
+        while len(self._rows) > STOCK_WB_ROWS_MAX:
+            self._rows.popitem(last=False)
+
+    def row(self, stock_take_id: int, product_id: int) -> Optional[Dict[str, Any]]:
+        """The product's item row as the DB plus this buffer see it, or None if the DB hasn't answered yet."""
+        r = self._rows.get((stock_take_id, product_id))
+        if r is None:
+            return None
+        self._rows.move_to_end((stock_take_id, product_id))
+        pending = self.pending_qty(stock_take_id, product_id)
+        return {**r, "CountedQty": (r["CountedQty"] or 0) + pending, "PendingQty": pending}
+
+    def is_closed(self, stock_take_id: int) -> bool:
+        return stock_take_id in self._closed
+
+    def close(self, stock_take_id: int, rejected: List[Count] = ()) -> None:
+        """No more counts for this stock take: drop its rows, keep what the DB refused."""
+        self._closed.setdefault(stock_take_id, []).extend(rejected)
+        self._closed.move_to_end(stock_take_id)
+        while len(self._closed) > STOCK_WB_CLOSED_MAX:
+            self._closed.popitem(last=False)
+        for key in [k for k in self._rows if k[0] == stock_take_id]:
+            del self._rows[key]
+
+    def rejected(self, stock_take_id: int) -> List[Count]:
+        return list(self._closed.get(stock_take_id, ()))
+
+    # ---- writes ----
+
+    async def add(self, stock_take_id: int, product_id: int, code: str, qty: int,
+                  sku: Optional[str] = None, name: Optional[str] = None) -> Count:
+        c = Count(self._next, stock_take_id, product_id, code, qty,
+                  datetime.now(timezone.utc).replace(tzinfo=None).isoformat(timespec="seconds"), sku, name,
+                  uuid.uuid4().hex)
+        self._next += 1
+        self._appending += 1
+        try:
+            await asyncio.to_thread(self.log.append, {"op": "add", **c._asdict()})
+        finally:
+            self._appending -= 1
+        self._keep(c)
+        self._stats["accepted"] += 1
+        if len(self._pending) >= STOCK_WB_BATCH:
+            self._wake.set()
+        return c
+
+    async def undo_last(self, stock_take_id: int) -> Optional[Count]:
+        """Take back the newest still-pending scan; None when everything is already in the DB."""
+        async with self._lock:  # a batch in flight must land before the DB can be asked
+            for c in reversed(self._pending.values()):
+                if c.stock_take_id == stock_take_id:
+                    await asyncio.to_thread(self.log.append, {"op": "undo", "id": c.id})
+                    self._forget(c)
+                    return c
+        return None
+
+    async def flush(self, stock_take_id: Optional[int] = None) -> None:
+        """Write pending counts (all, or one stock take). Raises if a batch couldn't be written."""
+        async with self._lock:
+            batches: Dict[int, List[Count]] = {}
+            for c in self._pending.values():
+                if stock_take_id is None or c.stock_take_id == stock_take_id:
+                    batches.setdefault(c.stock_take_id, []).append(c)
+            error = None
+            for st_id, counts in batches.items():
+                try:
+                    await self._write(st_id, counts)
+                except Exception as e:
+                    self._stats["failures"] += 1
+                    error = e  # keep going: other stock takes aren't blocked by this one
+            if not self._pending and self._appending == 0:
+                self.log.truncate()
+            if error is not None:
+                raise error
+
+    async def _write(self, stock_take_id: int, counts: List[Count]) -> None:
+        tvp = [
+            (i, c.code, c.product_id, c.qty, datetime.fromisoformat(c.at), c.count_id)
+            for i, c in enumerate(counts)
+        ]
+        items, closed = [], False
+        try:
+            # Sets: [summary], [rejected lines], [updated items]
+            sets = await exec_sp_sets_async("dbo.usp_Stock_AddCounts", [stock_take_id, tvp])
+            items = sets[2] if len(sets) > 2 else []
+        except Exception as e:
+            if "52011" not in str(e):
+                raise  # stays pending; retried on the next flush
+            # Stock take closed or gone: these counts can never be applied
+            print(f"Rejected {len(counts)} buffered counts for stock take {stock_take_id}: {e}")
+            self._stats["rejected"] += len(counts)
+            closed = True
+        else:
+            self._stats["flushed"] += len(counts)
+            self._stats["batches"] += 1
+            versions.bump("stock", stock_take_id)
+        await asyncio.to_thread(self.log.append, {"op": "done", "ids": [c.id for c in counts]})
+        for c in counts:
+            self._forget(c)
+        if closed:
+            self.close(stock_take_id, counts)
+        else:
+            self.remember(items)  # same step as the forget: CountedQty never counts a scan twice
+
+    async def run(self) -> None:
+        """Background flusher."""
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), STOCK_WB_FLUSH_MS / 1000)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            if not self._pending:
+                continue
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Stock count flush failed: {e}")
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "pending": len(self._pending), "products": len(self._totals),
+            "known_rows": len(self._rows), "closed": len(self._closed), **self._stats,
+        }
+
+
+_buffer: Optional[CountBuffer] = None
+
+
+def get_buffer() -> Optional[CountBuffer]:
+    return _buffer
+
+
+def start() -> Optional[asyncio.Task]:
+    """Replay the log and start the flusher (no-op unless STOCK_WRITE_BEHIND=1)."""
+    global _buffer
+    if not STOCK_WRITE_BEHIND:
+        return None
+    _buffer = CountBuffer(CountLog(STOCK_WB_LOG))
+    if _buffer.stats()["pending"]:
+        print(f"Replayed {_buffer.stats()['pending']} buffered stock counts from {STOCK_WB_LOG}")
+    return asyncio.create_task(_buffer.run())
+
+
+async def stop() -> None:
+    """Last flush on shutdown; whatever fails stays in the log for the next start."""
+    global _buffer
+    if _buffer is None:
+        return
+    try:
+        await _buffer.flush()
+    except Exception as e:
+        print(f"Stock count flush on shutdown failed (kept in log): {e}")
+    _buffer.log.close()
+    _buffer = None
@@ -0,0 +1,94 @@
+# app/streaming.py
+# Helpers to stream DB rows straight into a response body (JSON, NDJSON, CSV).
+# Rows are encoded column-by-column from tuple-like rows (pyodbc.Row),
+# so nothing is turned into a dict on the way out.
+
+import csv, io, json, zlib
+from datetime import date, datetime, time
+from decimal import Decimal
+from uuid import UUID
+
+
+def json_default(o):
+    # Same conversions FastAPI's jsonable_encoder applies to DB values
+    if isinstance(o, (datetime, date, time)):
+        return o.isoformat()
+    if isinstance(o, Decimal):
+        return int(o) if o.as_tuple().exponent >= 0 else float(o)
+    if isinstance(o, UUID):
+        return str(o)
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+_dumps = json.JSONEncoder(
+    default=json_default, ensure_ascii=False, allow_nan=False, separators=(",", ":")
+).encode
+
+
+def row_encoder(columns):
+    """Return encode(row) -> JSON object text for rows with the given columns."""
+    keys = [_dumps(c) + ":" for c in columns]
+
+    def encode(row) -> str:
+        return "{" + ",".join([k + _dumps(v) for k, v in zip(keys, row)]) + "}"
+
+    return encode
+
+
+async def first_json(sp, empty: str = "{}") -> str:
+    """First row of the current result set as a JSON object (or `empty`)."""
+    if sp.columns is None:
+        return empty
+    row = await sp.fetchone()
+    return row_encoder(sp.columns)(row) if row is not None else empty
+
+
+async def json_array(sp):
+    """Yield the rest of the current result set as a JSON array, batch by batch."""
+    yield "["
+    if sp.columns is not None:
+        encode = row_encoder(sp.columns)
+        sep = ""
+        async for batch in sp.batches():
+            yield sep + ",".join([encode(r) for r in batch])
+            sep = ","
+    yield "]"
+
+
+async def ndjson_lines(sp):
+    """Yield the current result set as newline-delimited JSON, one batch per chunk."""
+    if sp.columns is None:
+        return
+    encode = row_encoder(sp.columns)
+    async for batch in sp.batches():
+        yield "".join([encode(r) + "\n" for r in batch])
+
+
+def _csv_value(v):
+    if isinstance(v, (datetime, date, time)):
+        return v.isoformat()
+    return v
+
+
+async def csv_lines(sp):
+    """Yield the current result set as CSV (header first), one batch per chunk."""
+    if sp.columns is None:
+        return
+    buf = io.StringIO()
+    out = csv.writer(buf, lineterminator="\r\n")
+    out.writerow(sp.columns)
+    async for batch in sp.batches():
+        out.writerows([[_csv_value(v) for v in r] for r in batch])
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue()  # header only: the set had no rows
+
+
+async def gzipped(chunks, level: int = 6):
+    """Gzip a text stream on the fly; every chunk is flushed so the client sees it right away."""
+    z = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits 31 = gzip container
+    async for chunk in chunks:
+        yield z.compress(chunk.encode()) + z.flush(zlib.Z_SYNC_FLUSH)
+    yield z.flush()
@@ -0,0 +1,80 @@
+# app/versions.py
+#
+# Cheap per-resource versions for conditional GETs (ETag / If-None-Match).
+#
+# Every write endpoint bumps the counter of the resource it touched
+# (("packing", PackingId), ("stock", StockTakeId), ...). A GET computes its
+# ETag from that counter *before* reading, so a matching If-None-Match is
+# answered 304 without running the stored procedure.
+#
+# Counters live in this process; the ETag carries a per-process id, so a
+# restart simply invalidates every tag. Writes through another worker are not
+# seen here, so a second worker could answer 304 over a change it never saw:
+# ETags are off by default. Set ETAG_ENABLED=1 only for a single worker (or
+# sticky sessions per resource).
+
+import hashlib, os, secrets
+from typing import Dict, Optional, Tuple
+
+from fastapi import Request, Response
+
+ETAG_ENABLED = os.getenv("ETAG_ENABLED", "0") == "1"
+VERSIONS_MAX = int(os.getenv("VERSIONS_MAX", "100000"))
+
+_boot = secrets.token_hex(4)
+_epoch = 0                                   # bumped when the table is flushed
+_versions: Dict[Tuple[str, int], int] = {}
+_stats = {"not_modified": 0, "full": 0}
+
+
+def bump(kind: str, key: Optional[int]) -> None:
+    """Call after a write to (kind, key) has committed."""
+    global _epoch
+    if key is None:
+        return
+    k = (kind, int(key))
+    _versions[k] = _versions.get(k, 0) + 1
+    if len(_versions) > VERSIONS_MAX:
+        # Forgetting one counter could hand out a stale 304; forget all of them instead
+        _versions.clear()
+        _epoch += 1
+
+
+def etag(kind: str, key: int, *parts) -> str:
+    # parts: query params that change the representation (search, top, ...)
+    h = hashlib.blake2b(repr(parts).encode(), digest_size=4).hexdigest()
+    return f'W/"{_boot}.{_epoch}.{_versions.get((kind, int(key)), 0)}.{h}"'
+
+
+def _matches(if_none_match: Optional[str], tag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    weak = tag.removeprefix("W/")
+    return any(t.strip().removeprefix("W/") == weak for t in if_none_match.split(","))
+
+
+def check(request: Request, response: Response, kind: str, key: int, *parts) -> Optional[Response]:
+    """Put the ETag on `response`; returns a 304 to send instead when the client is current."""
+    if not ETAG_ENABLED:
+        return None
+    tag = etag(kind, key, *parts)
+    headers = {"ETag": tag, "Cache-Control": "private, no-cache"}
+    if _matches(request.headers.get("if-none-match"), tag):
+        _stats["not_modified"] += 1
+        return Response(status_code=304, headers=headers)
+    _stats["full"] += 1
+    response.headers.update(headers)
+    return None
+
+
+def stats() -> Dict[str, int]:
+    return {"tracked": len(_versions), "epoch": _epoch, **_stats}
+
+
+def reset() -> None:
+    global _boot, _epoch
+    _boot, _epoch = secrets.token_hex(4), 0
+    _versions.clear()
+    _stats.update(not_modified=0, full=0)
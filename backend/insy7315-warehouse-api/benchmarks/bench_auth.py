@@ -0,0 +1,95 @@
+# benchmarks/bench_auth.py
+#
+# Per-request cost of the auth dependencies: today's X-API-Key check vs the
+# bearer dependency with a cold (full HS256 verify) and warm (cached) token.
+#
+#   python benchmarks/bench_auth.py [requests]
+#
+# Part 1 times the functions alone; part 2 pushes requests through a tiny
+# FastAPI app in-process (no network) so dependency resolution is included.
+
+import asyncio, os, sys, time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+os.environ.setdefault("API_KEY", "bench-key")
+os.environ.setdefault("JWT_SECRET", "bench-secret")
+
+import httpx
+from fastapi import Depends, FastAPI
+
+from app import security
+from app.deps import API_KEY, current_user, require_key
+
+
+def _per_call_us(fn, n: int) -> float:
+    start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - start) / n * 1e6
+
+
+def bench_functions(n: int, token: str) -> None:
+    def cold():
+        security.clear_token_cache()
+        security.verify_token(token)
+
+    security.verify_token(token)
+    rows = [
+        ("api key compare", _per_call_us(lambda: require_key(API_KEY), n)),
+        ("jwt verify (cold)", _per_call_us(cold, n)),
+        ("jwt verify (cached)", _per_call_us(lambda: security.verify_token(token), n)),
+    ]
+    print("functions")
+    for name, us in rows:
+        print(f"  {name:<22} {us:8.2f} us/call")
+
+
+async def bench_requests(n: int, token: str) -> None:
+    app = FastAPI()
+
+    @app.get("/none")
+    async def none():
+        return {"ok": True}
+
+    @app.get("/key")
+    async def key(_=Depends(require_key)):
+        return {"ok": True}
+
+    @app.get("/bearer")
+    async def bearer(user=Depends(current_user)):
+        return {"ok": True}
+
+    @app.get("/both")
+    async def both(user=Depends(current_user), _=Depends(require_key)):
+        return {"ok": True}
+
+    key_h = {"X-API-Key": API_KEY}
+    bearer_h = {"Authorization": f"Bearer {token}"}
+    cases = [
+        ("no auth", "/none", {}),
+        ("api key", "/key", key_h),
+        ("bearer (cached)", "/bearer", bearer_h),
+        ("api key + bearer", "/both", {**key_h, **bearer_h}),
+    ]
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        print(f"requests (in-process ASGI, n={n})")
+        base = None
+        for name, path, headers in cases:
+            for _ in range(50):  # warm-up
+                await client.get(path, headers=headers)
+            start = time.perf_counter()
+            for _ in range(n):
+                r = await client.get(path, headers=headers)
+            us = (time.perf_counter() - start) / n * 1e6
+            assert r.status_code == 200, (path, r.status_code)
+            base = us if base is None else base
+            print(f"  {name:<22} {us:8.1f} us/req  (+{us - base:6.1f} vs no auth)")
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    token = security.create_token(user_id=1, email="bench@example.com", name="Bench")
+    bench_functions(n * 10, token)
+    asyncio.run(bench_requests(n, token))
@@ -0,0 +1,58 @@
+# benchmarks/bench_catalog.py
+#
+# Cost of the catalog refresh paths that run in the API process, on a
+# synthetic catalog written to a temp dir:
+#
+#   python benchmarks/bench_catalog.py [products]
+#
+# full build, a refresh with no changes, a refresh with a few changes, a
+# second worker catching up on the files, and lookup latency.
+
+import os, random, sys, tempfile, time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+os.environ.setdefault("API_KEY", "bench-key")
+os.environ.setdefault("JWT_SECRET", "bench-secret")
+
+from app import catalog
+
+
+def rows(n: int, seed: int = 7):
+    rnd = random.Random(seed)
+    products = [(pid, f"SKU-{pid:06d}", f"Product {pid} {rnd.randint(2, 120)}mm", f"600{pid:010d}")
+                for pid in range(1, n + 1)]
+    serials = [(f"SN-{pid:08d}", pid, True) for pid in range(1, n + 1, 10)]
+    return products, serials
+
+
+def timed(label: str, fn) -> None:
+    start = time.process_time()
+    fn()
+    print(f"  {label:<34} {(time.process_time() - start) * 1000:9.1f} ms cpu")
+
+
+def main(n: int) -> None:
+    products, serials = rows(n)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "catalog.bin")
+        cat = catalog.Catalog(path)
+        catalog.CATALOG_REFRESH_SECONDS = 0  # refresh on every call
+        print(f"catalog refresh, {n} products")
+        timed("full build", lambda: cat.refresh(fetch=lambda since: (100, products, serials)))
+        timed("incremental, no changes", lambda: cat.refresh(fetch=lambda since: (101, [], [])))
+        changed = [(pid, sku, name + " v2", barcode) for pid, sku, name, barcode in products[:10]]
+        timed("incremental, 10 products + 1 serial",
+              lambda: cat.refresh(fetch=lambda since: (102, changed, [("SN-00000001", 1, False)])))
+        other = catalog.Catalog(path)
+        timed("second worker catch-up (map + log)", lambda: other.refresh(fetch=lambda since: (103, [], [])))
+
+        codes = [p[3] for p in products[::max(n // 1000, 1)]]
+        start = time.perf_counter()
+        for c in codes:
+            cat.lookup(c, catalog.PICK_KINDS)
+        print(f"  lookup                             {(time.perf_counter() - start) / len(codes) * 1e6:9.1f} us")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 300_000)
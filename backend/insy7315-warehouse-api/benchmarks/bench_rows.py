@@ -0,0 +1,152 @@
+# benchmarks/bench_rows.py
+#
+# CPU per response for the two hottest list reads, old path vs new:
+#   /picking/{id}/recent  _val() per field + ScanItem models + response_model
+#                         validation + stdlib json   vs   rowmap Schema + raw_json
+#   /stock/{id}/items     jsonable_encoder + stdlib json   vs   raw_json
+#
+#   python benchmarks/bench_rows.py [responses]
+#
+# Part 1 times the mapping + serialization alone; part 2 pushes requests
+# through a small FastAPI app in-process (no network, no DB) so routing,
+# response_model handling and rendering are all included.
+
+import asyncio, os, sys, time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+os.environ.setdefault("API_KEY", "bench-key")
+os.environ.setdefault("JWT_SECRET", "bench-secret")
+
+import httpx
+from fastapi import FastAPI
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from app.responses import FastJSONResponse, orjson, raw_json
+from app.routers.picking import RecentScans, ScanItem, _SCAN, _to_iso
+
+
+# ---- the code as it was, for comparison ----
+
+def _val(row: dict, *names: str, default: Any = None) -> Any:
+    if row is None:
+        return default
+    lower = {k.lower(): v for k, v in row.items()}
+    for n in names:
+        v = lower.get(n.lower())
+        if v is not None:
+            return v
+    return default
+
+
+def recent_old(rows) -> List[ScanItem]:
+    return [
+        ScanItem(
+            ScanId=int(_val(r, "ScanId", "Id")),
+            BarcodeOrSerial=str(_val(r, "BarcodeOrSerial", "Barcode", "Serial", default="")),
+            Qty=int(_val(r, "Qty", "Quantity", "QuantityPicked", default=1)),
+            ScannedAt=_to_iso(_val(r, "ScannedAt", "CreatedAt", "Timestamp")),
+        )
+        for r in rows
+    ]
+
+
+# ---- sample rows, shaped like the procs return them ----
+
+def scan_rows(n: int):
+    t0 = datetime(2025, 11, 1, 10, 0, 0)
+    return [
+        {"ScanId": 1000 + i, "ScannedAt": t0 + timedelta(seconds=i), "SerialNumber": None,
+         "Qty": 1 + i % 3, "ProductId": 40 + i % 7, "Sku": f"SKU-{i % 7:04d}", "Name": f"Product {i % 7}"}
+        for i in range(n)
+    ]
+
+
+def stock_rows(n: int):
+    return [
+        {"StockTakeItemId": i, "StockTakeId": 10, "ProductId": i, "Sku": f"SKU-{i:05d}",
+         "Name": f"Product {i} - shelf {i % 40}", "ExpectedQty": 20 + i % 9, "CountedQty": 20 + i % 11}
+        for i in range(n)
+    ]
+
+
+def _per_call_us(fn, n: int) -> float:
+    for _ in range(min(n, 50)):
+        fn()
+    start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - start) / n * 1e6
+
+
+def bench_functions(n: int) -> None:
+    scans, items = scan_rows(25), stock_rows(500)
+    adapter = RecentScans.model_validate
+
+    def recent_before():
+        body = adapter({"items": recent_old(scans)}).model_dump(mode="json")
+        return JSONResponse(body).body
+
+    def recent_after():
+        return raw_json({"items": _SCAN.map_rows(scans)}).body
+
+    def items_before():
+        return JSONResponse(jsonable_encoder({"items": items})).body
+
+    def items_after():
+        return raw_json({"items": items}).body
+
+    print(f"functions (json: {'orjson' if orjson else 'stdlib fallback'})")
+    for label, before, after, k in (
+        ("recent (25 scans)", recent_before, recent_after, n),
+        ("stock items (500)", items_before, items_after, max(n // 20, 20)),
+    ):
+        b, a = _per_call_us(before, k), _per_call_us(after, k)
+        print(f"  {label:<20} before {b:9.1f} us   after {a:9.1f} us   x{b / a:4.1f}")
+
+
+async def bench_requests(n: int) -> None:
+    scans, items = scan_rows(25), stock_rows(500)
+    old = FastAPI()
+    new = FastAPI(default_response_class=FastJSONResponse)
+
+    @old.get("/recent", response_model=RecentScans)
+    async def old_recent():
+        return {"items": recent_old(scans)}
+
+    @old.get("/items")
+    async def old_items():
+        return {"items": items}
+
+    @new.get("/recent", response_model=RecentScans)
+    async def new_recent():
+        return raw_json({"items": _SCAN.map_rows(scans)})
+
+    @new.get("/items")
+    async def new_items():
+        return raw_json({"items": items})
+
+    print(f"requests (in-process ASGI, n={n})")
+    for path, k in (("/recent", n), ("/items", max(n // 10, 20))):
+        us = {}
+        for label, app in (("before", old), ("after", new)):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                for _ in range(50):  # warm-up
+                    await client.get(path)
+                start = time.perf_counter()
+                for _ in range(k):
+                    r = await client.get(path)
+                us[label] = (time.perf_counter() - start) / k * 1e6
+                assert r.status_code == 200, (path, r.status_code)
+        print(f"  {path:<20} before {us['before']:9.1f} us   after {us['after']:9.1f} us   "
+              f"x{us['before'] / us['after']:4.1f}")
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    bench_functions(n)
+    asyncio.run(bench_requests(n))
@@ -0,0 +1,77 @@
+# benchmarks/bench_search.py
+#
+# Product search on a synthetic catalog, through the same path the API runs:
+# the catalog snapshot + delta log (app/catalog.py) in a temp dir, and
+# product_search.sync() / product_search.search() on top of it.
+#
+#   python benchmarks/bench_search.py [products]
+#
+# Times the first sync, a sync with nothing new, a sync after a delta refresh
+# and after a full snapshot rebuild, then typing a few queries one key at a
+# time (3+ characters, like the handheld sends them), broad ones included.
+
+import os, random, sys, tempfile, time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+os.environ.setdefault("API_KEY", "bench-key")
+os.environ.setdefault("JWT_SECRET", "bench-secret")
+
+from app import catalog, product_search
+
+WORDS = (
+    "bolt nut washer screw bracket hinge cable tie clamp pipe valve fitting elbow tee "
+    "coupling gasket seal bearing spring pin rivet anchor hook chain rope tape glue "
+    "filter hose nozzle switch relay fuse plug socket adapter lamp bulb battery charger"
+).split()
+COLOURS = "black white red blue green yellow grey silver brass steel zinc nylon".split()
+
+
+def rows(n: int, seed: int = 7):
+    rnd = random.Random(seed)
+    return [
+        (pid, f"{rnd.choice(WORDS)[:3].upper()}-{pid:06d}",
+         f"{rnd.choice(COLOURS).title()} {rnd.choice(WORDS).title()} {rnd.choice(WORDS)} "
+         f"{rnd.randint(2, 120)}mm", f"600{pid:010d}")
+        for pid in range(1, n + 1)
+    ]
+
+
+def timed(label: str, fn) -> None:
+    start = time.perf_counter()
+    out = fn()
+    print(f"  {label:<40} {(time.perf_counter() - start) * 1000:9.1f} ms  ({out} changed)")
+
+
+def main(n: int) -> None:
+    products = rows(n)
+    with tempfile.TemporaryDirectory() as tmp:
+        cat = catalog.Catalog(os.path.join(tmp, "catalog.bin"))
+        catalog._catalog = cat
+        catalog.CATALOG_REFRESH_SECONDS = 0  # refresh on every call
+        cat.refresh(fetch=lambda since: (100, products, []))
+
+        print(f"search index sync, {n} products")
+        timed("first sync (whole snapshot)", product_search.sync)
+        timed("sync, nothing new", product_search.sync)
+        renamed = [(pid, sku, name + " v2", barcode) for pid, sku, name, barcode in products[:1000]]
+        cat.refresh(fetch=lambda since: (101, renamed, []))
+        timed("sync after delta (1000 renamed)", product_search.sync)
+        cat.refresh(fetch=lambda since: (102, products, []), force_full=True)
+        timed("sync after full snapshot rebuild", product_search.sync)
+        print(f"  index: {product_search.get_index().stats()}")
+
+        print("typing (product_search.search, as /stock/{id}/items calls it)")
+        for query in ("steel hinge", "BOL-0123", "nylon", "45mm", "washer", "widget", "steel"):
+            worst, total, typed = 0.0, 0.0, 0
+            for k in range(3, len(query) + 1):
+                t = time.perf_counter()
+                ids = product_search.search(query[:k])
+                ms = (time.perf_counter() - t) * 1000
+                worst, total, typed = max(worst, ms), total + ms, typed + 1
+            shown = "db" if ids is None else len(ids)
+            print(f"  {query!r:<14} avg {total / typed:6.2f} ms  worst {worst:6.2f} ms  final hits {shown}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 300_000)
@@ -1,6 +1,8 @@
 # tests/conftest.py
 import os
 import sys
+from collections import namedtuple
+from contextlib import asynccontextmanager
 from pathlib import Path
 
 import pytest
@@ -35,14 +37,64 @@ def client(app_instance, monkeypatch):
         raise RuntimeError("get_conn should be mocked in tests that need it.")
     monkeypatch.setattr(db, "get_conn", _boom, raising=True)
 
-    return TestClient(app_instance)
+    # Per-process caches must not leak between tests
+    from app import delivery_counts, events, metrics, package_cache, packing_state, scan_ring, singleflight, staging_queue, versions
+    packing_state.reset()
+    versions.reset()
+    scan_ring.reset()
+    package_cache.reset()
+    singleflight.reset()
+    staging_queue.reset()
+    delivery_counts.reset()
+    events.reset()
+    metrics.reset()
+
+    # Request-scoped sessions run on whatever fake_exec_sp registered last
+    _session_impl.clear()
+    _session_sets_impl.clear()
+    app_instance.dependency_overrides[db.db_session] = _fake_db_session
+    yield TestClient(app_instance)
+    app_instance.dependency_overrides.pop(db.db_session, None)
 
 # --- Helpers for specific tests to stub DB calls ---
 
+_session_impl = []
+_session_sets_impl = []
+
+
+class FakeSession:
+    """Stand-in for app.db.DBSession: calls go to the fake_exec_sp impl, transactions are recorded."""
+
+    def __init__(self):
+        self.calls = []
+        self.transactions = []
+
+    async def exec_sp(self, sp, params, **_):
+        if not _session_impl:
+            raise RuntimeError("DB session used without fake_exec_sp in this test.")
+        self.calls.append(sp)
+        return _session_impl[-1](sp, params)
+
+    async def exec_sp_sets(self, sp, params, **_):
+        if not _session_sets_impl:
+            raise RuntimeError("DB session read sets without fake_multi in this test.")
+        self.calls.append(sp)
+        return _session_sets_impl[-1](sp, params)
+
+    @asynccontextmanager
+    async def transaction(self, isolation=None):
+        self.transactions.append(isolation)
+        yield self
+
+
+async def _fake_db_session():
+    yield FakeSession()
+
+
 @pytest.fixture()
 def fake_exec_sp(monkeypatch):
     """
-    Patch a router module's `exec_sp` with a provided implementation.
+    Patch a router module's `exec_sp_async` with a provided (sync) implementation.
 
     Usage:
         def my_exec_sp(sp, params): return [...]
@@ -50,14 +102,76 @@ def fake_exec_sp(monkeypatch):
     """
     def _apply(module_path: str, impl):
         mod = __import__(module_path, fromlist=["*"])
-        monkeypatch.setattr(mod, "exec_sp", impl, raising=True)
+        async def _async_impl(sp, params, **_):
+            return impl(sp, params)
+        monkeypatch.setattr(mod, "exec_sp_async", _async_impl, raising=True)
+        _session_impl.append(impl)
         return impl
     return _apply
 
+class FakeStream:
+    """In-memory stand-in for app.db.SPStream built from lists of dict rows."""
+
+    def __init__(self, sets, batch_size=2):
+        self._sets = [s for s in sets if s]  # like pyodbc, column-less sets are skipped
+        self._i = 0
+        self._pos = 0
+        self.batch_size = batch_size
+        self.closed = False
+        self._load()
+
+    def _load(self):
+        self.fetched = 0
+        self._pos = 0
+        if self._i < len(self._sets):
+            rows = self._sets[self._i]
+            self.columns = tuple(rows[0].keys())
+            Row = namedtuple("Row", self.columns, rename=True)
+            self._rows = [Row(*r.values()) for r in rows]
+        else:
+            self.columns, self._rows = None, []
+
+    async def open(self):
+        return self
+
+    async def fetch(self, n=None):
+        chunk = self._rows[self._pos:self._pos + (n or self.batch_size)]
+        self._pos += len(chunk)
+        self.fetched += len(chunk)
+        return chunk
+
+    async def fetchone(self):
+        rows = await self.fetch(1)
+        return rows[0] if rows else None
+
+    async def batches(self):
+        while True:
+            rows = await self.fetch()
+            if not rows:
+                return
+            yield rows
+
+    async def next_set(self):
+        self._i += 1
+        self._load()
+        return self.columns is not None
+
+    async def close(self, *a):
+        self.closed = True
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *a):
+        await self.close()
+        return False
+
+
 @pytest.fixture()
 def fake_multi(monkeypatch):
     """
-    Patch a router module's `_exec_sp_multi` helper.
+    Patch a router module's `stream_sp` (and `exec_sp_sets_async`, if it uses
+    it) so the proc "returns" the given sets; session reads use them too.
 
     Usage:
         def my_multi(sp, params): return [[...], [...]]
@@ -65,6 +179,12 @@ def fake_multi(monkeypatch):
     """
     def _apply(module_path: str, impl):
         mod = __import__(module_path, fromlist=["*"])
-        monkeypatch.setattr(mod, "_exec_sp_multi", impl, raising=True)
+        if hasattr(mod, "stream_sp"):
+            monkeypatch.setattr(mod, "stream_sp", lambda sp, params, *a, **k: FakeStream(impl(sp, params)), raising=True)
+        if hasattr(mod, "exec_sp_sets_async"):
+            async def _sets(sp, params, **_):
+                return impl(sp, params)
+            monkeypatch.setattr(mod, "exec_sp_sets_async", _sets, raising=True)
+        _session_sets_impl.append(impl)
         return impl
-    return _apply
\ No newline at end of file
+    return _apply
@@ -21,7 +21,9 @@ def test_register_success(client, fake_exec_sp, monkeypatch):
 def test_login_ok(client, fake_exec_sp, monkeypatch):
     # Force verify_password to return True
     from app.routers import auth as auth_mod
-    monkeypatch.setattr(auth_mod, "verify_password", lambda p, h: True, raising=True)
+    async def _ok(p, h):
+        return True, None
+    monkeypatch.setattr(auth_mod, "verify_password", _ok, raising=True)
 
     row = {
         "UserId": 7,
@@ -44,7 +46,9 @@ def test_login_bad_password(client, fake_exec_sp, monkeypatch):
     from app.routers import auth as auth_mod
 
     # Force password verification to fail
-    monkeypatch.setattr(auth_mod, "verify_password", lambda p, h: False, raising=True)
+    async def _bad(p, h):
+        return False, None
+    monkeypatch.setattr(auth_mod, "verify_password", _bad, raising=True)
 
     # Return a fake user record for the given email
     fake_exec_sp(
@@ -66,4 +70,60 @@ def test_login_bad_password(client, fake_exec_sp, monkeypatch):
 
     # Expect unauthorized
     assert r.status_code == 401
-    assert r.json()["detail"] == "Invalid credentials"
\ No newline at end of file
+    assert r.json()["detail"] == "Invalid credentials"
+
+
+def test_login_rehashes_outdated_hash(client, fake_exec_sp, monkeypatch):
+    from app.routers import auth as auth_mod
+    async def _upgraded(p, h):
+        return True, "$argon2id$new"
+    monkeypatch.setattr(auth_mod, "verify_password", _upgraded, raising=True)
+
+    calls = []
+    def _sp(sp, params):
+        calls.append((sp, params))
+        return [{"UserId": 7, "Name": "Bryan", "Email": "b@x.com", "PasswordHash": "old"}]
+    fake_exec_sp("app.routers.auth", _sp)
+
+    r = client.post("/auth/login", json={"email": "b@x.com", "password": "pw"}, headers={"X-API-Key": "test-key"})
+    assert r.status_code == 200
+    assert calls[1] == ("dbo.usp_User_UpdatePasswordHash", [7, "$argon2id$new"])
+
+
+def test_hashing_pool_full_returns_503(client, fake_exec_sp, monkeypatch):
+    from app import hashing
+    monkeypatch.setattr(hashing, "HASH_WORKERS", 1)
+    monkeypatch.setattr(hashing, "HASH_MAX_QUEUE", 0)
+    monkeypatch.setattr(hashing, "_inflight", 1)
+    fake_exec_sp("app.routers.auth", lambda sp, params: [{"UserId": 1, "PasswordHash": "x"}])
+
+    r = client.post("/auth/login", json={"email": "b@x.com", "password": "pw"}, headers={"X-API-Key": "test-key"})
+    assert r.status_code == 503
+    assert r.headers["Retry-After"]
+    assert hashing.stats()["rejected"] >= 1
+
+
+def test_bearer_identity_overrides_user_param(client, fake_exec_sp):
+    from app.security import create_token, token_cache_stats
+    token = create_token(user_id=42, email="p@x.com", name="Packer")
+    calls = []
+    def _sp(sp, params):
+        calls.append(params)
+        return [{"SessionId": 1, "UserId": params[0], "StartedAt": "2025-11-01T10:00:00Z", "Status": "Active"}]
+    fake_exec_sp("app.routers.picking", _sp)
+
+    headers = {"X-API-Key": "test-key", "Authorization": f"Bearer {token}"}
+    before = token_cache_stats()["hits"]
+    for _ in range(2):
+        r = client.post("/picking/start?userId=5", headers=headers)
+        assert r.status_code == 200
+    assert calls == [[42], [42]]
+    assert token_cache_stats()["hits"] == before + 1  # second call skipped verification
+
+
+def test_bearer_invalid_or_expired_token_rejected(client):
+    from app.security import create_token
+    expired = create_token(user_id=42, email="p@x.com", name="Packer", expires_minutes=-1)
+    for token in ("not-a-jwt", expired):
+        r = client.get("/stock/health", headers={"X-API-Key": "test-key", "Authorization": f"Bearer {token}"})
+        assert r.status_code == 401
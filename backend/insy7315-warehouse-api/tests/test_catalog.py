@@ -0,0 +1,117 @@
+# tests/test_catalog.py
+import pytest
+
+from app import catalog
+
+
+PRODUCTS = [
+    (1, "ELEC-001", "Wireless Mouse", "6001234567890"),
+    (2, "ELEC-002", "Mechanical Keyboard", "6001234567891"),
+    (3, "OFF-001", "A4 Printing Paper", None),
+]
+SERIALS = [("SN-0001", 1, True), ("SN-0009", 2, False)]
+
+
+@pytest.fixture()
+def cat(tmp_path):
+    calls = []
+    def _fetch(since):
+        calls.append(since)
+        if since is None:
+            return 100, PRODUCTS, SERIALS
+        # delta: product 3 gets a barcode, a new product and a new serial appear
+        return 200, [(3, "OFF-001", "A4 Printing Paper", "6001234567901"),
+                     (4, "WH-001", "Barcode Scanner", "6001234567910")], [("SN-0002", 2, True)]
+    c = catalog.Catalog(str(tmp_path / "catalog.bin"))
+    c.refresh(fetch=_fetch)
+    c.calls = calls
+    c.fetch = _fetch
+    return c
+
+
+def test_lookup_by_kind_order(cat):
+    assert cat.lookup("6001234567890", catalog.PICK_KINDS).product_id == 1
+    assert cat.lookup("elec-002 ", catalog.STOCK_KINDS).product_id == 2   # SQL-style CI / trailing space
+    assert cat.lookup("ELEC-002", catalog.PICK_KINDS) is None            # picking doesn't resolve SKUs
+    hit = cat.lookup("SN-0001", catalog.PACK_KINDS)
+    assert hit == catalog.Match(1, "ELEC-001", "Wireless Mouse", "SN-0001")
+    assert cat.lookup("nope", catalog.STOCK_KINDS) is None
+    assert cat.lookup("SN-0009", catalog.PICK_KINDS) is None             # consumed serials aren't indexed
+    assert cat.is_fresh()
+
+
+def test_incremental_refresh_merges_changes(cat, monkeypatch):
+    monkeypatch.setattr(catalog, "CATALOG_REFRESH_SECONDS", 0)
+    ident = cat.snapshot.ident
+    cat.refresh(fetch=cat.fetch)
+    assert cat.calls == [None, 100]
+    assert cat.version == 200
+    assert cat.snapshot.ident == ident  # applied from the delta log, the snapshot file isn't rewritten
+    assert cat.lookup("6001234567901", catalog.STOCK_KINDS).product_id == 3
+    assert cat.lookup("WH-001", catalog.STOCK_KINDS).name == "Barcode Scanner"
+    assert cat.lookup("SN-0002", catalog.PICK_KINDS).product_id == 2
+    assert cat.lookup("SN-0001", catalog.PICK_KINDS).product_id == 1      # kept from the base snapshot
+
+
+def test_second_process_maps_the_shared_file(cat):
+    other = catalog.Catalog(cat.path)
+    other.refresh(fetch=lambda since: pytest.fail("fresh snapshot should be reused, not refetched"))
+    assert other.lookup("6001234567891", catalog.PICK_KINDS).product_id == 2
+
+
+def test_delta_masks_changed_keys_and_consumed_serials(cat, monkeypatch):
+    monkeypatch.setattr(catalog, "CATALOG_REFRESH_SECONDS", 0)
+    cat.refresh(fetch=lambda since: (300, [(1, "ELEC-001X", "Wireless Mouse 2", "6001234567999")],
+                                     [("SN-0001", 1, False)]))
+    assert cat.lookup("6001234567890", catalog.PICK_KINDS) is None       # old barcode no longer resolves
+    assert cat.lookup("ELEC-001", catalog.STOCK_KINDS) is None
+    assert cat.lookup("6001234567999", catalog.PICK_KINDS).name == "Wireless Mouse 2"
+    assert cat.lookup("SN-0001", catalog.PICK_KINDS) is None             # picked since the full build
+    assert cat.changes[-1] == (1, "ELEC-001X", "Wireless Mouse 2")
+
+    monkeypatch.setattr(catalog, "CATALOG_REFRESH_SECONDS", 30)
+    other = catalog.Catalog(cat.path)                                    # another worker replays the log
+    other.refresh(fetch=lambda since: pytest.fail("fresh snapshot should be reused, not refetched"))
+    assert other.lookup("ELEC-001X", catalog.STOCK_KINDS).product_id == 1
+    assert other.version == 300
+
+
+def test_no_change_refresh_only_stamps(cat, monkeypatch):
+    import os
+    monkeypatch.setattr(catalog, "CATALOG_REFRESH_SECONDS", 0)
+    before = os.stat(cat.delta_path)
+    os.utime(cat.delta_path, (before.st_atime - 60, before.st_mtime - 60))
+    cat.checked_at -= 60
+    ident = cat.snapshot.ident
+    cat.refresh(fetch=lambda since: (150, [], []))
+    assert cat.snapshot.ident == ident
+    assert os.stat(cat.delta_path).st_size == before.st_size
+    assert cat.version == 100 and cat.is_fresh()
+    assert cat.checked_at > before.st_mtime - 30
+
+
+def test_search_index_follows_catalog_deltas(cat, monkeypatch):
+    from app import product_search
+    monkeypatch.setattr(catalog, "_catalog", cat)
+    monkeypatch.setattr(product_search, "_index", product_search.SearchIndex())
+    index = product_search.get_index()
+
+    assert product_search.sync() == 3  # first sync: the whole snapshot
+    assert index.search("mouse") == [1]
+
+    # From here on only the catalog's delta rows are read, never the snapshot
+    monkeypatch.setattr(cat.snapshot, "products", lambda: pytest.fail("snapshot re-read"))
+    assert product_search.sync() == 0
+    monkeypatch.setattr(catalog, "CATALOG_REFRESH_SECONDS", 0)
+    cat.refresh(fetch=cat.fetch)
+    assert product_search.sync() == 1  # product 4 is new; product 3 only got a barcode
+    assert index.search("scanner") == [4]
+    assert product_search.sync() == 0
+
+
+def test_search_index_broad_query_gives_up_early():
+    from app import product_search
+    index = product_search.SearchIndex()
+    index.update({pid: (f"W-{pid}", f"Widget {pid}") for pid in range(1, 101)})
+    assert index.search("widget", limit=5) is None  # too broad: the DB filters it
+    assert index.search("widget 42") == [42]
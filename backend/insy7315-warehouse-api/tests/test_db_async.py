@@ -0,0 +1,198 @@
+# tests/test_db_async.py
+import asyncio
+import threading
+
+import pytest
+
+from app import db
+
+
+class SlowCur:
+    """Cursor whose execute() blocks until cancel() is called."""
+    def __init__(self):
+        self.cancelled = threading.Event()
+        self.description = None
+    def execute(self, *_a):
+        if not self.cancelled.wait(2):
+            raise AssertionError("statement was never cancelled")
+        raise RuntimeError("Operation canceled")
+    def cancel(self):
+        self.cancelled.set()
+    def close(self): pass
+
+
+class Conn:
+    def __init__(self, cur): self.cur = cur; self.exited = False
+    def __enter__(self): return self
+    def __exit__(self, *a): self.exited = True; return False
+    def cursor(self): return self.cur
+
+
+def test_exec_sp_async_returns_rows(monkeypatch):
+    class Cur:
+        description = [("Id",), ("Name",)]
+        def execute(self, *_a): pass
+        def fetchall(self): return [(1, "A"), (2, "B")]
+        def close(self): pass
+    monkeypatch.setattr(db, "get_conn", lambda: Conn(Cur()), raising=True)
+
+    rows = asyncio.run(db.exec_sp_async("dbo.usp_X", [1]))
+    assert rows == [{"Id": 1, "Name": "A"}, {"Id": 2, "Name": "B"}]
+
+
+def test_exec_sp_async_timeout_cancels_statement(monkeypatch):
+    cur = SlowCur()
+    monkeypatch.setattr(db, "get_conn", lambda: Conn(cur), raising=True)
+
+    with pytest.raises(db.DBTimeout):
+        asyncio.run(db.exec_sp_async("dbo.usp_Slow", [], timeout=0.05))
+    assert cur.cancelled.wait(1)
+
+
+def test_stream_sp_walks_sets_in_batches(monkeypatch):
+    class Cur:
+        # set 0 has no columns (DML count) and must be skipped
+        sets = [None, (("Id",), [(1,), (2,), (3,)]), (("Total",), [(3,)])]
+        def __init__(self): self.i = 0; self.pos = 0; self.closed = False; self.sizes = []
+        @property
+        def description(self):
+            s = self.sets[self.i]
+            return [(c,) for c in s[0]] if s else None
+        def execute(self, *_a): pass
+        def fetchmany(self, n):
+            self.sizes.append(n)
+            rows = self.sets[self.i][1][self.pos:self.pos + n]
+            self.pos += len(rows)
+            return rows
+        def nextset(self):
+            self.i += 1; self.pos = 0
+            return self.i < len(self.sets)
+        def close(self): self.closed = True
+
+    cur = Cur()
+    conn = Conn(cur)
+    monkeypatch.setattr(db, "get_conn", lambda: conn, raising=True)
+
+    async def run():
+        async with db.stream_sp("dbo.usp_Multi", [], batch_size=2) as sp:
+            assert sp.columns == ("Id",)
+            batches = [b async for b in sp.batches()]
+            assert await sp.next_set()
+            total = await sp.fetchone()
+            assert not await sp.next_set()
+            return batches, total
+
+    batches, total = asyncio.run(run())
+    assert batches == [[(1,), (2,)], [(3,)]]
+    assert total == (3,)
+    assert set(cur.sizes) <= {1, 2}
+    assert cur.closed and conn.exited
+
+
+class SessionConn:
+    """Connection that logs statements, commits and rollbacks."""
+    def __init__(self): self.log = []
+    def cursor(self):
+        conn = self
+        class Cur:
+            description = [("Ok",)]
+            def execute(self, sql, *_a): conn.log.append(sql)
+            def fetchall(self): return [(1,)]
+            def close(self): pass
+        return Cur()
+    def commit(self): self.log.append("commit")
+    def rollback(self): self.log.append("rollback")
+
+
+class OnePool:
+    def __init__(self): self.conn = SessionConn(); self.acquired = 0; self.released = []
+    def acquire(self): self.acquired += 1; return self.conn
+    def release(self, conn, broken=False): self.released.append(broken)
+
+
+def test_db_session_one_connection_and_transaction():
+    pool = OnePool()
+
+    async def run():
+        s = db.DBSession(pool)
+        async with s.transaction(isolation="SERIALIZABLE"):
+            await s.exec_sp("dbo.usp_A", [1])
+            async with s.transaction():  # nested: no commit of its own
+                await s.exec_sp("dbo.usp_B", [2])
+        await s.close()
+
+    asyncio.run(run())
+    assert pool.acquired == 1 and pool.released == [False]
+    log = pool.conn.log
+    assert log[0] == "SET TRANSACTION ISOLATION LEVEL SERIALIZABLE"
+    assert log[1:4] == ["EXEC dbo.usp_A ?", "EXEC dbo.usp_B ?", "commit"]
+    assert log[4] == "SET TRANSACTION ISOLATION LEVEL READ COMMITTED"  # reset before going back
+    assert log.count("commit") == 2 and "rollback" not in log  # close() commits the reset too
+
+
+def test_db_session_rolls_back_on_error():
+    pool = OnePool()
+
+    async def run():
+        s = db.DBSession(pool)
+        try:
+            async with s.transaction():
+                await s.exec_sp("dbo.usp_A", [1])
+                raise ValueError("nope")
+        except ValueError:
+            pass
+        await s.close(failed=True)
+
+    asyncio.run(run())
+    assert pool.conn.log == ["EXEC dbo.usp_A ?", "rollback", "rollback"]
+    assert pool.released == [False]
+
+
+def test_exec_sp_sets_reads_every_set_and_releases(monkeypatch):
+    class Cur:
+        # DML count (no columns), then two sets
+        sets = [None, ([("Id",)], [(1,)]), ([("Sku",), ("Qty",)], [("A", 2), ("B", 3)])]
+        def __init__(self): self.i = 0
+        @property
+        def description(self): return self.sets[self.i][0] if self.sets[self.i] else None
+        def execute(self, *_a): pass
+        def fetchall(self): return self.sets[self.i][1]
+        def nextset(self):
+            self.i += 1
+            return self.i < len(self.sets)
+        def close(self): pass
+    conn = Conn(Cur())
+    monkeypatch.setattr(db, "get_conn", lambda: conn, raising=True)
+
+    sets = asyncio.run(db.exec_sp_sets_async("dbo.usp_X", [1]))
+    assert sets == [[{"Id": 1}], [{"Sku": "A", "Qty": 2}, {"Sku": "B", "Qty": 3}]]
+    assert conn.exited  # committed and handed back before the caller responds
+
+
+def test_db_session_exec_sp_sets_on_the_same_connection():
+    pool = OnePool()
+    conn = pool.conn
+    plain_cursor = conn.cursor
+
+    def cursor():
+        cur = plain_cursor()
+        cur.left = 1  # a second set after the first
+        def nextset():
+            cur.left -= 1
+            return cur.left >= 0
+        cur.nextset = nextset
+        return cur
+    conn.cursor = cursor
+
+    async def run():
+        s = db.DBSession(pool)
+        rows = await s.exec_sp("dbo.usp_A", [1])
+        sets = await s.exec_sp_sets("dbo.usp_B", [2])
+        await s.close()
+        return rows, sets
+
+    rows, sets = asyncio.run(run())
+    assert rows == [{"Ok": 1}]
+    assert sets == [[{"Ok": 1}], [{"Ok": 1}]]
+    assert pool.acquired == 1 and pool.released == [False]
+    assert conn.log == ["EXEC dbo.usp_A ?", "commit", "EXEC dbo.usp_B ?", "commit", "commit"]
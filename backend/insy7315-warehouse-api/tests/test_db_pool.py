@@ -0,0 +1,92 @@
+# tests/test_db_pool.py
+import threading
+import time
+
+import pytest
+
+from app.db import ConnectionPool, PoolTimeout
+
+
+class FakeConn:
+    def __init__(self, alive=True):
+        self.alive = alive
+        self.closed = False
+
+    def cursor(self):
+        conn = self
+        class Cur:
+            def execute(self, *_a):
+                if not conn.alive:
+                    raise RuntimeError("link down")
+            def fetchone(self): return [1]
+            def close(self): pass
+        return Cur()
+
+    def close(self):
+        self.closed = True
+
+
+def _factory():
+    made = []
+    def _connect():
+        c = FakeConn()
+        made.append(c)
+        return c
+    return made, _connect
+
+
+def test_pool_reuses_connections():
+    made, connect = _factory()
+    pool = ConnectionPool(connect, max_size=2)
+    c1 = pool.acquire()
+    pool.release(c1)
+    c2 = pool.acquire()
+    assert c2 is c1
+    assert len(made) == 1
+    assert pool.stats()["in_use"] == 1
+
+
+def test_pool_acquire_times_out_when_exhausted():
+    _, connect = _factory()
+    pool = ConnectionPool(connect, max_size=1, timeout=0.05)
+    pool.acquire()
+    with pytest.raises(PoolTimeout):
+        pool.acquire()
+    s = pool.stats()
+    assert s["waits"] == 1 and s["timeouts"] == 1
+
+
+def test_pool_waiter_gets_released_connection():
+    _, connect = _factory()
+    pool = ConnectionPool(connect, max_size=1, timeout=2)
+    c1 = pool.acquire()
+    got = []
+    t = threading.Thread(target=lambda: got.append(pool.acquire()))
+    t.start()
+    time.sleep(0.05)
+    pool.release(c1)
+    t.join(1)
+    assert got == [c1]
+    assert pool.stats()["wait_time_ms"] > 0
+
+
+def test_pool_recycles_dead_and_broken_connections():
+    made, connect = _factory()
+    pool = ConnectionPool(connect, max_size=2, validate_after=0)
+    c1 = pool.acquire()
+    pool.release(c1)
+    c1.alive = False
+    c2 = pool.acquire()              # validation on checkout replaces the dead link
+    assert c2 is not c1 and c1.closed
+    pool.release(c2, broken=True)    # broken connections are never handed out again
+    assert c2.closed
+    assert pool.stats()["idle"] == 0
+
+
+def test_pool_close_shuts_idle_connections():
+    made, connect = _factory()
+    pool = ConnectionPool(connect, min_size=2, max_size=4)
+    pool.warm()
+    assert len(made) == 2 and pool.stats()["idle"] == 2
+    pool.close()
+    assert all(c.closed for c in made)
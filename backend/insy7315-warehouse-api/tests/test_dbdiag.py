@@ -16,4 +16,12 @@ def test_db_ping_ok(client, monkeypatch):
 
     r = client.get("/diag/db-ping", headers={"X-API-Key": "test-key"})
     assert r.status_code == 200
-    assert r.json() == {"ok": True, "sample_db": "master"}
\ No newline at end of file
+    assert r.json() == {"ok": True, "sample_db": "master"}
+
+def test_pool_stats(client, monkeypatch):
+    from app import db
+    monkeypatch.setattr(db, "pool_stats", lambda: {"in_use": 1, "idle": 2, "waits": 0}, raising=True)
+
+    r = client.get("/diag/pool", headers={"X-API-Key": "test-key"})
+    assert r.status_code == 200
+    assert r.json()["pool"]["idle"] == 2
@@ -1,5 +1,7 @@
 # tests/test_delivery.py
-def test_delivery_list_with_counts(client, fake_multi):
+def test_delivery_list_with_counts(client, fake_multi, fake_exec_sp):
+    # counters are served from the API cache, filled by usp_Delivery_Counts
+    fake_exec_sp("app.delivery_counts", lambda sp, params: [{"Total": 2, "ToLoad": 1, "Loaded": 1, "Delivered": 0}])
     def _multi(sp, params):
         # set 1: items
         items = [
@@ -50,4 +52,108 @@ def test_mark_delivered_ok(client, fake_exec_sp):
     fake_exec_sp("app.routers.delivery", lambda sp, params: [row])
     r = client.post("/delivery/PKG-000001/mark-delivered", headers={"X-API-Key": "test-key"})
     assert r.status_code == 200
-    assert r.json()["Status"] == "Delivered"
\ No newline at end of file
+    assert r.json()["Status"] == "Delivered"
+
+def test_delivery_list_keyset_pages(client, fake_multi, fake_exec_sp):
+    fake_exec_sp("app.delivery_counts", lambda sp, params: [{"Total": 3, "ToLoad": 3, "Loaded": 0, "Delivered": 0}])
+    sent = []
+    def _multi(sp, params):
+        sent.append(params)
+        # proc is asked for top + 1 rows; the extra one only signals "more"
+        items = [{"DeliveryPackageId": i, "PackageNumber": f"PKG-{i}", "Status": "To Load"} for i in (30, 29, 28)]
+        return [items, [{"Total": 3, "ToLoad": 3, "Loaded": 0}]]
+    fake_multi("app.routers.delivery", _multi)
+
+    r = client.get("/delivery/list?top=2&search=10023", headers={"X-API-Key": "test-key"})
+    j = r.json()
+    assert [i["DeliveryPackageId"] for i in j["items"]] == [30, 29]
+    assert sent[0] == ["10023", None, 3, None, "contains", 0]  # suffix only when asked for
+
+    client.get("/delivery/list?top=2&search=10023&match=suffix", headers={"X-API-Key": "test-key"})
+    assert sent[1][4] == "suffix"
+
+    r = client.get(f"/delivery/list?top=2&cursor={j['next']}", headers={"X-API-Key": "test-key"})
+    assert sent[2][3] == 29
+    assert client.get("/delivery/list?cursor=%%%", headers={"X-API-Key": "test-key"}).status_code == 400
+
+def test_delivery_counts_cached_and_adjusted(client, fake_exec_sp):
+    counted = []
+    def _counts(sp, params):
+        counted.append(sp)
+        return [{"Total": 5, "ToLoad": 3, "Loaded": 2, "Delivered": 0}]
+    fake_exec_sp("app.delivery_counts", _counts)
+    fake_exec_sp("app.routers.delivery", lambda sp, params: [
+        {"PackageNumber": "PKG-1", "Status": "Loaded", "PrevStatus": "To Load"}
+    ])
+
+    assert client.get("/delivery/list?counts_only=true", headers={"X-API-Key": "test-key"}).json()["counts"]["ToLoad"] == 3
+    client.post("/delivery/scan-to-load", json={"scannedNumber": "PKG-1"}, headers={"X-API-Key": "test-key"})
+    client.post("/delivery/PKG-1/mark-delivered", headers={"X-API-Key": "test-key"})
+
+    c = client.get("/delivery/list?counts_only=true", headers={"X-API-Key": "test-key"}).json()["counts"]
+    assert c == {"Total": 5, "ToLoad": 2, "Loaded": 2, "Delivered": 1}
+    assert counted == ["dbo.usp_Delivery_Counts"]  # one aggregate, then served from memory
+
+def test_bulk_transition_per_package_outcomes(client, fake_exec_sp):
+    sent = []
+    def _sp(sp, params):
+        sent.append((sp, params))
+        return [
+            {"Seq": 0, "PackageNumber": "PKG-1", "Outcome": "Updated", "PrevStatus": "To Load", "Status": "Loaded"},
+            {"Seq": 1, "PackageNumber": "PKG-2", "Outcome": "AlreadyInState", "PrevStatus": "Loaded", "Status": "Loaded"},
+            {"Seq": 2, "PackageNumber": "NOPE", "Outcome": "NotFound", "PrevStatus": None, "Status": None},
+        ]
+    fake_exec_sp("app.routers.delivery", _sp)
+
+    body = {"target": "Loaded", "packageNumbers": ["PKG-1", "PKG-2", " NOPE "]}
+    r = client.post("/delivery/bulk-transition", json=body, headers={"X-API-Key": "test-key"})
+    assert r.status_code == 200
+    j = r.json()
+    assert j["updated"] == 1
+    assert [i["Outcome"] for i in j["items"]] == ["Updated", "AlreadyInState", "NotFound"]
+    assert sent == [("dbo.usp_Delivery_BulkTransition", ["Loaded", [(0, "PKG-1"), (1, "PKG-2"), (2, "NOPE")]])]
+
+    bad = client.post("/delivery/bulk-transition", json={"target": "Lost", "packageNumbers": ["PKG-1"]},
+                      headers={"X-API-Key": "test-key"})
+    assert bad.status_code == 422
+
+def test_package_details_cached_until_transition(client, fake_exec_sp):
+    calls = []
+    def _sp(sp, params):
+        calls.append(sp)
+        if sp == "dbo.usp_Delivery_GetPackageDetails":
+            return [{"PackageNumber": "PKG-10", "Status": "Loaded" if "dbo.usp_Delivery_MarkLoaded" in calls else "To Load"}]
+        return [{"PackageNumber": "PKG-10", "Status": "Loaded", "PrevStatus": "To Load"}]
+    fake_exec_sp("app.routers.delivery", _sp)
+    h = {"X-API-Key": "test-key"}
+
+    assert client.get("/delivery/PKG-10", headers=h).json()["Status"] == "To Load"
+    assert client.get("/delivery/pkg-10", headers=h).json()["Status"] == "To Load"
+    assert calls.count("dbo.usp_Delivery_GetPackageDetails") == 1
+
+    client.post("/delivery/PKG-10/mark-loaded", headers=h)
+    assert client.get("/delivery/PKG-10", headers=h).json()["Status"] == "Loaded"
+    assert calls.count("dbo.usp_Delivery_GetPackageDetails") == 2
+
+def test_delivery_list_coalesces_identical_polls(client, fake_exec_sp, monkeypatch):
+    import asyncio
+    from app.routers import delivery
+    fake_exec_sp("app.delivery_counts", lambda sp, params: [{"Total": 1, "ToLoad": 1, "Loaded": 0, "Delivered": 0}])
+    opened = []
+    async def _page(params, top):
+        opened.append(params)
+        await asyncio.sleep(0.05)  # still in flight when the other polls arrive
+        return b'{"items":[],"next":null'
+    monkeypatch.setattr(delivery, "_list_page", _page, raising=True)
+
+    async def storm():
+        import httpx
+        transport = httpx.ASGITransport(app=client.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://t") as c:
+            return await asyncio.gather(*[
+                c.get("/delivery/list?status=To%20Load&top=100", headers={"X-API-Key": "test-key"}) for _ in range(10)
+            ])
+
+    responses = asyncio.run(storm())
+    assert all(r.status_code == 200 and r.json()["items"] == [] for r in responses)
+    assert len(opened) == 1
@@ -0,0 +1,59 @@
+# tests/test_events.py
+from app import events
+
+
+def test_resume_token_replays_only_missed_events():
+    bus = events.EventBus(size=3)
+    first = bus.publish("delivery", {"PackageNumber": "PKG-1", "Status": "Loaded"})
+    bus.publish("staging", {"StagingId": 4, "Status": "Claimed"})
+    bus.publish("delivery", {"PackageNumber": "PKG-2", "Status": "Loaded"})
+
+    missed = bus.since(bus.token(first.seq), ["delivery"])
+    assert [e.data["PackageNumber"] for e in missed] == ["PKG-2"]
+    assert bus.since(bus.last_token, ["delivery", "staging"]) == []
+
+    # fell out of the buffer, or issued by another process: client must reset
+    for _ in range(3):
+        bus.publish("delivery", {})
+    assert bus.since(bus.token(first.seq), ["delivery"]) is None
+    assert bus.since("other-1", ["delivery"]) is None
+
+
+def test_slow_subscriber_is_flagged_not_blocking(monkeypatch):
+    monkeypatch.setattr(events, "EVENTS_QUEUE", 1)
+    bus = events.EventBus()
+    sub = bus.subscribe(["delivery"])
+    bus.publish("delivery", {"n": 1})
+    bus.publish("delivery", {"n": 2})
+    assert sub.overflowed and bus.stats()["dropped"] == 1
+
+
+def test_mark_loaded_publishes_delivery_event(client, fake_exec_sp):
+    fake_exec_sp("app.routers.delivery", lambda sp, params: [
+        {"PackageNumber": "PKG-1", "Status": "Loaded", "PrevStatus": "To Load"}
+    ])
+    bus = events.get_bus()
+    start = bus.last_token
+    client.post("/delivery/PKG-1/mark-loaded", headers={"X-API-Key": "test-key"})
+    [e] = bus.since(start, ["delivery"])
+    assert e.data == {"PackageNumber": "PKG-1", "Status": "Loaded", "PrevStatus": "To Load"}
+
+
+def test_stream_unsubscribes_when_body_never_starts(client):
+    import asyncio
+    from app.routers import events as events_router
+
+    async def gone_before_first_chunk():
+        response = await events_router.stream(topics="delivery", resume=None, last_event_id=None, _=None)
+        assert events.get_bus().stats()["subscribers"] == 1
+        async def receive():
+            return {"type": "http.disconnect"}
+        async def send(message):
+            raise OSError("client went away")
+        try:
+            await response({"type": "http", "asgi": {"spec_version": "2.4"}}, receive, send)
+        except Exception:
+            pass
+
+    asyncio.run(gone_before_first_chunk())
+    assert events.get_bus().stats()["subscribers"] == 0
@@ -0,0 +1,65 @@
+# tests/test_metrics.py
+import re
+
+from app import db, metrics
+
+
+def _sample(text, name, **labels):
+    want = ",".join(f'{k}="{v}"' for k, v in labels.items())
+    want = "{" + want + "}" if want else ""
+    m = re.search(rf"^{name}{re.escape(want)} (\S+)$", text, re.M)
+    return float(m.group(1)) if m else None
+
+
+def test_metrics_route_templates_and_sp_calls(client, monkeypatch):
+    class Cur:
+        description = [("Id",)]
+        def execute(self, *_a): pass
+        def fetchall(self): return [(1,), (2,), (3,)]
+        def close(self): pass
+    class Conn:
+        def __enter__(self): return self
+        def __exit__(self, *a): return False
+        def cursor(self): return Cur()
+    monkeypatch.setattr(db, "get_conn", lambda: Conn(), raising=True)
+
+    assert client.get("/healthz").status_code == 200
+    db.exec_sp("dbo.usp_X", [1])
+
+    r = client.get("/metrics", headers={"X-API-Key": "test-key"})
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = r.text
+    assert _sample(text, "http_request_duration_seconds_count", method="GET", route="/healthz", status="200") == 1
+    assert _sample(text, "db_sp_duration_seconds_count", sp="dbo.usp_X") == 1
+    assert _sample(text, "db_sp_rows_total", sp="dbo.usp_X") == 3
+    assert 'db_sp_duration_seconds_bucket{sp="dbo.usp_X",le="+Inf"} 1' in text
+    assert _sample(text, "http_requests_in_flight") == 1  # the scrape itself
+
+
+def test_metrics_counts_sql_error_numbers(client, monkeypatch):
+    class Cur:
+        description = None
+        def execute(self, *_a):
+            raise RuntimeError("[42000] [SQL Server]Session is not active. (52012) (SQLExecDirectW)")
+        def close(self): pass
+    class Conn:
+        def __enter__(self): return self
+        def __exit__(self, *a): return False
+        def cursor(self): return Cur()
+    monkeypatch.setattr(db, "get_conn", lambda: Conn(), raising=True)
+
+    for _ in range(2):
+        try:
+            db.exec_sp("dbo.usp_Stock_Add", [1])
+        except RuntimeError:
+            pass
+
+    text = client.get("/metrics", headers={"X-API-Key": "test-key"}).text
+    assert _sample(text, "db_sp_errors_total", sp="dbo.usp_Stock_Add", number="52012") == 2
+    assert _sample(text, "db_calls_in_flight") == 0
+
+
+def test_error_number_falls_back_to_class_name():
+    assert metrics.error_number(RuntimeError("(547) then (51012)")) == "51012"
+    assert metrics.error_number(TimeoutError("slow")) == "TimeoutError"
@@ -11,4 +11,39 @@ def test_get_lines_ok(client, fake_exec_sp):
     fake_exec_sp("app.routers.pack_staging", lambda sp, params: rows)
     r = client.get("/staging/123/lines", headers={"X-API-Key": "test-key"})
     assert r.status_code == 200
-    assert r.json()[0]["Required"] == 2
\ No newline at end of file
+    assert r.json()[0]["Required"] == 2
+
+def test_claim_next_waits_for_work(client, fake_exec_sp):
+    from app import staging_queue
+    calls = []
+    def _sp(sp, params):
+        calls.append(sp)
+        if len(calls) == 1:
+            staging_queue.notify()  # work staged right after the first (empty) claim
+            return []
+        return [{"StagingId": 3, "PackingId": 22}]
+    fake_exec_sp("app.routers.pack_staging", _sp)
+
+    r = client.post("/staging/claim-next?packedBy=5&wait=5", headers={"X-API-Key": "test-key"})
+    assert r.status_code == 200
+    assert r.json()["StagingId"] == 3
+    assert calls.count("dbo.usp_Pack_ClaimNext") == 2
+
+def test_work_queue_wakes_waiters_in_order():
+    import asyncio
+    from app.staging_queue import WorkQueue
+
+    async def scenario():
+        q = WorkQueue()
+        order = []
+        async def packer(name):
+            if await q.wait(1, q.generation):
+                order.append(name)
+        tasks = [asyncio.create_task(packer(n)) for n in ("first", "second", "third")]
+        await asyncio.sleep(0)
+        q.notify()
+        q.notify()
+        await asyncio.gather(*tasks)
+        return order, q.timeouts
+
+    assert asyncio.run(scenario()) == (["first", "second"], 1)
@@ -1,4 +1,6 @@
 # tests/test_packing.py
+import pytest
+
 def test_start_or_set_package(client, fake_exec_sp):
     row = {"PackingId": 22, "PackageNumber": "PKG-000022", "Status": "Open"}
     fake_exec_sp("app.routers.packing", lambda sp, params: [row])
@@ -18,9 +20,9 @@ def test_add_item_ok(client, fake_exec_sp):
 def test_validate_blocks_seal(client, monkeypatch):
     # Make validation report issues so seal returns 409
     from app.routers import packing as p
-    monkeypatch.setattr(p, "_validate_against_staging",
-                        lambda packingId: [{"Issue": "Missing", "ProductId": 1, "Required": 2, "Packed": 0, "Delta": 2}],
-                        raising=True)
+    async def _issues(packingId, *_):
+        return [{"Issue": "Missing", "ProductId": 1, "Required": 2, "Packed": 0, "Delta": 2}]
+    monkeypatch.setattr(p, "_validate_against_staging", _issues, raising=True)
     r = client.post("/packing/seal?packingId=22", headers={"X-API-Key": "test-key"})
     assert r.status_code == 409
     assert r.json()["detail"]["message"].startswith("Staged requirements not satisfied")
@@ -28,9 +30,127 @@ def test_validate_blocks_seal(client, monkeypatch):
 def test_seal_happy_path(client, fake_exec_sp, monkeypatch):
     # No issues from validation
     from app.routers import packing as p
-    monkeypatch.setattr(p, "_validate_against_staging", lambda _: [], raising=True)
+    async def _no_issues(*_):
+        return []
+    monkeypatch.setattr(p, "_validate_against_staging", _no_issues, raising=True)
     fake_exec_sp("app.routers.packing", lambda sp, params: [{"PackingId": 22, "Status": "Sealed"}])
 
     r = client.post("/packing/seal?packingId=22", headers={"X-API-Key": "test-key"})
     assert r.status_code == 200
-    assert r.json()["Status"] == "Sealed"
\ No newline at end of file
+    assert r.json()["Status"] == "Sealed"
+
+def test_validate_and_summary_from_pack_state(client, fake_exec_sp, fake_multi, monkeypatch):
+    from app import catalog
+    monkeypatch.setattr(catalog, "lookup", lambda code, kinds: None, raising=True)
+    monkeypatch.setattr(catalog, "is_fresh", lambda: False, raising=True)
+    loads = []
+    def _state(sp, params):
+        loads.append(sp)
+        header = [{"PackingId": 22, "PackageNumber": "PKG-000022", "Status": "Open", "CreatedAt": None, "StagingId": 7}]
+        required = [{"ProductId": 9, "Sku": "ABC", "Name": "Widget", "Required": 2}]
+        items = [{"PackingItemId": 1, "ProductId": 9, "Sku": "ABC", "Name": "Widget", "Quantity": 1}]
+        return [header, required, items]
+    fake_multi("app.packing_state", _state)
+
+    r = client.get("/packing/22/validate", headers={"X-API-Key": "test-key"})
+    assert r.json()["issues"][0]["Issue"] == "Missing"
+    assert r.json()["issues"][0]["Delta"] == 1
+
+    # add-item updates the cached state in place; validate no longer needs the DB
+    fake_exec_sp("app.routers.packing", lambda sp, params: [
+        {"PackingItemId": 2, "PackingId": 22, "ProductId": 9, "Quantity": 1, "Sku": "ABC", "Name": "Widget"}
+    ])
+    client.post("/packing/add-item?packingId=22&barcodeOrSerial=ABC", headers={"X-API-Key": "test-key"})
+    assert client.get("/packing/22/validate", headers={"X-API-Key": "test-key"}).json() == {"ok": True, "issues": []}
+    s = client.get("/packing/22/summary", headers={"X-API-Key": "test-key"}).json()
+    assert (s["ItemLines"], s["TotalQty"]) == (2, 2)
+
+    # undo-last takes the line back out
+    fake_exec_sp("app.routers.packing", lambda sp, params: [{"Removed": 1, "PackingItemId": 2}])
+    client.post("/packing/22/undo-last", headers={"X-API-Key": "test-key"})
+    r = client.get("/packing/22/validate", headers={"X-API-Key": "test-key"})
+    assert r.json()["issues"][0]["Packed"] == 1
+    assert loads == ["dbo.usp_Pack_GetState"]
+
+def test_overlapping_loads_skip_caching_a_raced_read(client, monkeypatch):
+    import asyncio
+    from app import packing_state
+    header = [{"PackingId": 22, "PackageNumber": "PKG-000022", "Status": "Open", "CreatedAt": None}]
+
+    async def run():
+        release_first, release_second = gates = [asyncio.Event(), asyncio.Event()]
+        async def _read(packing_id, db):
+            await gates.pop(0).wait()
+            return header, [], []
+        monkeypatch.setattr(packing_state, "_read_sets", _read)
+
+        first = asyncio.create_task(packing_state.load(22))
+        second = asyncio.create_task(packing_state.load(22))
+        await asyncio.sleep(0)
+        release_first.set()
+        a = await first
+        assert packing_state.peek(22) is a  # add-item commits while the second read is in flight
+        release_second.set()
+        b = await second
+        return a, b
+
+    a, b = asyncio.run(run())
+    assert b is not a
+    assert packing_state._states[22] is a  # the second read may be missing that write
+    assert packing_state._loading == {}
+
+def test_add_item_include_views(client, fake_exec_sp, fake_multi, monkeypatch):
+    from app import catalog
+    monkeypatch.setattr(catalog, "lookup", lambda code, kinds: catalog.Match(9, "ABC", "Widget"), raising=True)
+    # State is read after the insert, so it already holds the new line
+    header = [{"PackingId": 22, "PackageNumber": "PKG-000022", "Status": "Open", "CreatedAt": None, "StagingId": 7}]
+    required = [{"ProductId": 9, "Sku": "ABC", "Name": "Widget", "Required": 1}]
+    items = [{"PackingItemId": 5, "ProductId": 9, "Sku": "ABC", "Name": "Widget", "Quantity": 1}]
+    fake_multi("app.packing_state", lambda sp, params: [header, required, items])
+    # ...on the write's session, not a second pooled connection
+    from app import packing_state
+    monkeypatch.setattr(packing_state, "stream_sp", lambda *a, **k: pytest.fail("state read off the session"))
+    fake_exec_sp("app.routers.packing", lambda sp, params: [
+        {"PackingItemId": 5, "PackingId": 22, "ProductId": 9, "Quantity": 1, "Sku": "ABC", "Name": "Widget"}
+    ])
+
+    r = client.post("/packing/add-item?packingId=22&barcodeOrSerial=ABC&include=items,summary,validation",
+                    headers={"X-API-Key": "test-key"})
+    assert r.status_code == 200
+    j = r.json()
+    assert j["PackingItemId"] == 5
+    assert [i["PackingItemId"] for i in j["items"]] == [5]
+    assert j["summary"]["TotalQty"] == 1
+    assert j["validation"] == {"ok": True, "issues": []}
+
+def test_include_rejects_unknown_view(client, fake_exec_sp):
+    fake_exec_sp("app.routers.packing", lambda sp, params: pytest.fail("DB should not be called"))
+    r = client.post("/packing/22/clear?include=everything", headers={"X-API-Key": "test-key"})
+    assert r.status_code == 400
+
+def test_items_conditional_get(client, fake_exec_sp, monkeypatch):
+    from app import versions
+    calls = []
+    def _sp(sp, params):
+        calls.append(sp)
+        if sp == "dbo.usp_Pack_GetItems":
+            return [{"PackingItemId": 5, "ProductId": 9, "Quantity": 1}]
+        return [{"Cleared": 1}]
+    fake_exec_sp("app.routers.packing", _sp)
+    h = {"X-API-Key": "test-key"}
+
+    # Off by default: per-process counters can't see other workers' writes
+    assert "ETag" not in client.get("/packing/22/items", headers=h).headers
+    monkeypatch.setattr(versions, "ETAG_ENABLED", True)
+    calls.clear()
+
+    r = client.get("/packing/22/items", headers=h)
+    tag = r.headers["ETag"]
+    r = client.get("/packing/22/items", headers={**h, "If-None-Match": tag})
+    assert r.status_code == 304
+    assert calls == ["dbo.usp_Pack_GetItems"]  # the 304 never ran the proc
+
+    client.post("/packing/22/clear", headers=h)
+    r = client.get("/packing/22/items", headers={**h, "If-None-Match": tag})
+    assert r.status_code == 200
+    assert r.headers["ETag"] != tag
@@ -1,4 +1,6 @@
 # tests/test_picking.py
+import pytest
+
 def test_picking_start_session(client, fake_exec_sp):
     row = {"SessionId": 12, "UserId": 5, "StartedAt": "2025-11-01T10:00:00Z", "Status": "Active"}
     fake_exec_sp("app.routers.picking", lambda sp, params: [row])
@@ -32,4 +34,145 @@ def test_picking_complete(client, fake_exec_sp):
     r = client.post("/picking/complete?sessionId=12", headers={"X-API-Key": "test-key"})
     assert r.status_code == 200
     assert r.json()["ok"] is True
-    assert r.json()["summary"][0]["Qty"] == 5
\ No newline at end of file
+    assert r.json()["summary"][0]["Qty"] == 5
+
+def test_picking_add_scan_uses_resolved_product(client, fake_exec_sp, monkeypatch):
+    from app import catalog
+    monkeypatch.setattr(catalog, "lookup", lambda code, kinds: catalog.Match(9, "ABC", "Widget"), raising=True)
+    calls = []
+    def _sp(sp, params):
+        calls.append((sp, params))
+        return [{"ScanId": 1, "BarcodeOrSerial": "ABC", "Qty": 1}]
+    fake_exec_sp("app.routers.picking", _sp)
+
+    r = client.post("/picking/add-scan?sessionId=12&barcodeOrSerial=ABC", headers={"X-API-Key": "test-key"})
+    assert r.status_code == 200
+    assert calls == [("dbo.usp_Pick_AddScanByProduct", [12, 9, None, 1])]
+
+def test_picking_add_scan_falls_back_to_db_lookup(client, fake_exec_sp, monkeypatch):
+    from app import catalog
+    calls = []
+    def _sp(sp, params):
+        calls.append(sp)
+        if sp == "dbo.usp_Pick_AddScanByProduct":
+            raise RuntimeError("[42000] No product found for barcode/serial. (51012) (SQLExecDirectW)")
+        return [{"ScanId": 1, "Qty": 1}]
+    fake_exec_sp("app.routers.picking", _sp)
+    # Both attempts run on the request's DB session (one connection)
+    from app.routers import picking
+    monkeypatch.setattr(picking, "exec_sp_async", lambda *a, **k: pytest.fail("off the request session"))
+    h = {"X-API-Key": "test-key"}
+
+    # Not in the catalog (added since the last refresh): the DB resolves it
+    monkeypatch.setattr(catalog, "lookup", lambda code, kinds: None, raising=True)
+    assert client.post("/picking/add-scan?sessionId=12&barcodeOrSerial=NEW", headers=h).status_code == 200
+    assert calls == ["dbo.usp_Pick_AddScan"]
+
+    # Resolved as a serial that was picked since: retried as a plain DB lookup
+    calls.clear()
+    monkeypatch.setattr(catalog, "lookup", lambda code, kinds: catalog.Match(9, "ABC", "Widget", code), raising=True)
+    assert client.post("/picking/add-scan?sessionId=12&barcodeOrSerial=SN1", headers=h).status_code == 200
+    assert calls == ["dbo.usp_Pick_AddScanByProduct", "dbo.usp_Pick_AddScan"]
+
+def test_picking_add_scans_batch(client, monkeypatch):
+    from app import catalog
+    from app.routers import picking
+    # "BAD" isn't in the catalog: sent without a ProductId for the proc to resolve
+    monkeypatch.setattr(catalog, "lookup",
+                        lambda code, kinds: None if code == "BAD" else catalog.Match(9, "ABC", "Widget"),
+                        raising=True)
+    sent = []
+    async def _sp(sp, params, **_):
+        sent.append(params[1])
+        return [
+            {"Seq": 0, "Ok": True, "BarcodeOrSerial": "A", "Qty": 1, "ScanId": 100, "ProductId": 9, "NewOnHand": 4},
+            {"Seq": 1, "Ok": False, "BarcodeOrSerial": "BAD", "Qty": 1, "ErrorNumber": 51012,
+             "ErrorMessage": "No product found for barcode/serial."},
+            {"Seq": 2, "Ok": False, "BarcodeOrSerial": "C", "Qty": 5, "ErrorNumber": 51013,
+             "ErrorMessage": "Insufficient stock."},
+        ]
+    monkeypatch.setattr(picking, "exec_sp_async", _sp, raising=True)
+
+    body = [{"barcodeOrSerial": "A"}, {"barcodeOrSerial": "BAD"}, {"barcodeOrSerial": "C", "qty": 5}]
+    r = client.post("/picking/12/add-scans", json=body, headers={"X-API-Key": "test-key"})
+    assert r.status_code == 200
+    j = r.json()
+    assert [i["Line"] for i in j["items"]] == [0, 1, 2]
+    assert (j["Applied"], j["Failed"]) == (1, 2)
+    assert j["items"][1]["ErrorNumber"] == 51012
+    assert j["items"][2]["ErrorNumber"] == 51013
+    assert [row[0] for row in sent[0]] == [0, 1, 2]
+    assert sent[0][1][2] is None  # unresolved: the proc looks it up
+
+def test_picking_add_scans_reports_lines_without_a_result(client, monkeypatch):
+    from app import catalog
+    from app.routers import picking
+    monkeypatch.setattr(catalog, "lookup", lambda code, kinds: None, raising=True)
+    async def _sp(sp, params, **_):
+        return [
+            {"Seq": 1, "Ok": True, "BarcodeOrSerial": "B", "Qty": 1, "ScanId": 101},
+            {"Seq": None, "Ok": True, "BarcodeOrSerial": "?", "Qty": 1, "ScanId": 102},
+        ]
+    monkeypatch.setattr(picking, "exec_sp_async", _sp, raising=True)
+
+    body = [{"barcodeOrSerial": "A"}, {"barcodeOrSerial": "B"}]
+    r = client.post("/picking/12/add-scans", json=body, headers={"X-API-Key": "test-key"})
+    assert r.status_code == 200
+    j = r.json()
+    assert [(i["Line"], i["Ok"]) for i in j["items"]] == [(0, False), (1, True)]
+    assert j["items"][0]["Error"] == "No result" and j["items"][0]["BarcodeOrSerial"] == "A"
+    assert (j["Applied"], j["Failed"]) == (1, 1)
+
+def test_picking_recent_served_from_ring(client, fake_exec_sp):
+    calls = []
+    def _sp(sp, params):
+        calls.append(sp)
+        if sp == "dbo.usp_Pick_GetRecentScans":
+            return [{"ScanId": 11, "BarcodeOrSerial": "B", "Qty": 3}, {"ScanId": 10, "BarcodeOrSerial": "A", "Qty": 1}]
+        return [{"ScanId": 12, "BarcodeOrSerial": "C", "Qty": 1}]
+    fake_exec_sp("app.routers.picking", _sp)
+    h = {"X-API-Key": "test-key"}
+
+    assert len(client.get("/picking/12/recent?top=25", headers=h).json()["items"]) == 2  # cold: seeds the ring
+    client.post("/picking/add-scan?sessionId=12&barcodeOrSerial=C", headers=h)
+    r = client.get("/picking/12/recent?top=2", headers=h)
+    assert [i["ScanId"] for i in r.json()["items"]] == [12, 11]
+    assert calls.count("dbo.usp_Pick_GetRecentScans") == 1
+
+def test_picking_recent_ring_reseeds_after_ttl(client, fake_exec_sp, monkeypatch):
+    from app import scan_ring
+    scans = [{"ScanId": 10, "BarcodeOrSerial": "A", "Qty": 1}]
+    calls = []
+    def _sp(sp, params):
+        calls.append(sp)
+        return list(reversed(scans))
+    fake_exec_sp("app.routers.picking", _sp)
+    h = {"X-API-Key": "test-key"}
+
+    client.get("/picking/12/recent", headers=h)
+    scans.append({"ScanId": 11, "BarcodeOrSerial": "B", "Qty": 1})  # scanned through another worker
+    assert [i["ScanId"] for i in client.get("/picking/12/recent", headers=h).json()["items"]] == [10]
+    # Polling doesn't keep a ring alive past the TTL: it reseeds from the proc
+    monkeypatch.setattr(scan_ring, "RECENT_SCANS_TTL", 0)
+    r = client.get("/picking/12/recent", headers=h)
+    assert [i["ScanId"] for i in r.json()["items"]] == [11, 10]
+    assert r.json()["items"][0]["BarcodeOrSerial"] == "B"
+    assert calls.count("dbo.usp_Pick_GetRecentScans") == 2
+
+def test_picking_recent_overlapping_seeds_skip_a_raced_read(client):
+    from app import scan_ring
+    # Two cold /recent reads in flight; a scan lands after the first is seeded
+    first, second = scan_ring.begin_load(12), scan_ring.begin_load(12)
+    scan_ring.seed(12, [{"ScanId": 10}], first)
+    scan_ring.add(12, [{"ScanId": 11}])
+    scan_ring.seed(12, [{"ScanId": 10}], second)  # read before scan 11 committed
+
+    assert [i["ScanId"] for i in scan_ring.get(12, 25)] == [11, 10]
+    assert scan_ring._loading == {}
+
+def test_picking_recent_maps_column_aliases(client, fake_exec_sp):
+    rows = [{"id": 7, "barcode": "X1", "quantity": 2, "createdat": "2025-11-01T11:00:00"}]
+    fake_exec_sp("app.routers.picking", lambda sp, params: rows)
+
+    r = client.get("/picking/12/recent", headers={"X-API-Key": "test-key"})
+    assert r.json()["items"] == [{"ScanId": 7, "BarcodeOrSerial": "X1", "Qty": 2, "ScannedAt": "2025-11-01T11:00:00"}]
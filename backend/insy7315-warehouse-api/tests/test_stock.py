@@ -43,4 +43,185 @@ def test_stock_finish_multi_sets(client, fake_multi):
     j = r.json()
     assert j["header"]["StockTakeId"] == 10
     assert j["totals"]["TotalCounted"] == 15
-    assert j["discrepancies"][0]["Delta"] == -2
\ No newline at end of file
+    assert j["discrepancies"][0]["Delta"] == -2
+
+def test_stock_finish_returns_all_discrepancies(client, fake_multi):
+    # Every row arrives, in order
+    discrepancies = [{"Sku": f"S{i}", "Variance": i} for i in range(7)]
+    fake_multi("app.routers.stock", lambda sp, params: [[{"StockTakeId": 10}], [{"Items": 7}], discrepancies])
+
+    r = client.post("/stock/10/finish", headers={"X-API-Key": "test-key"})
+    assert r.status_code == 200
+    assert [d["Variance"] for d in r.json()["discrepancies"]] == list(range(7))
+
+def test_stock_add_counts_bulk(client, fake_multi):
+    sent = []
+    def _multi(sp, params):
+        sent.append(params)
+        summary = [{"Received": 3, "Applied": 2, "Unknown": 1, "Invalid": 0, "Products": 1}]
+        unknown = [{"Seq": 1, "BarcodeOrSku": "NOPE", "Qty": 1, "Reason": "Unknown barcode/SKU"}]
+        items = [{"ProductId": 1, "Sku": "ABC", "CountedQty": 5}]
+        return [summary, unknown, items]
+    fake_multi("app.routers.stock", _multi)
+
+    body = [
+        {"barcodeOrSku": "ABC", "qty": 2, "scannedAt": "2025-11-01T10:00:00+02:00", "countId": "dev1-17"},
+        {"barcodeOrSku": "NOPE"},
+        {"barcodeOrSku": "ABC", "qty": 3},
+    ]
+    r = client.post("/stock/10/add-counts", json=body, headers={"X-API-Key": "test-key"})
+    assert r.status_code == 200
+    j = r.json()
+    assert j["summary"]["Applied"] == 2
+    assert j["unknown"][0]["BarcodeOrSku"] == "NOPE"
+    assert j["items"][0]["CountedQty"] == 5
+    # TVP rows are (Seq, code, ProductId, Qty, ScannedAt, CountId) with device time converted to naive UTC
+    tvp = sent[0][1]
+    assert [row[0] for row in tvp] == [0, 1, 2]
+    assert tvp[0][4].isoformat() == "2025-11-01T08:00:00"
+    assert [row[5] for row in tvp] == ["dev1-17", None, None]  # the proc skips ids it already applied
+
+def test_stock_write_behind(client, fake_exec_sp, fake_multi, monkeypatch, tmp_path):
+    from app import catalog, stock_buffer
+    log = str(tmp_path / "counts.log")
+    buf = stock_buffer.CountBuffer(stock_buffer.CountLog(log))
+    monkeypatch.setattr(stock_buffer, "_buffer", buf, raising=True)
+    monkeypatch.setattr(catalog, "lookup", lambda code, kinds: catalog.Match(1, "ABC", "Widget"), raising=True)
+    item = {"StockTakeItemId": 7, "StockTakeId": 10, "ProductId": 1, "Sku": "ABC", "Name": "Widget",
+            "ExpectedQty": 4, "CountedQty": 1}
+    calls = []
+    def _sp(sp, params):
+        calls.append((sp, params))
+        return [item]
+    def _multi(sp, params):
+        calls.append((sp, params))
+        return [[{"Received": 2, "Applied": 2}], [], [{**item, "CountedQty": 6}]]
+    fake_exec_sp("app.routers.stock", _sp)
+    fake_multi("app.stock_buffer", _multi)
+    h = {"X-API-Key": "test-key"}
+
+    # First scan of a product goes to the DB; its row lets the next ones be buffered
+    assert client.post("/stock/add?stockTakeId=10&barcodeOrSku=ABC&qty=1", headers=h).json() == item
+    assert [c[0] for c in calls] == ["dbo.usp_Stock_AddCountByProduct"]
+    for qty in (2, 3, 4):
+        r = client.post(f"/stock/add?stockTakeId=10&barcodeOrSku=ABC&qty={qty}", headers=h)
+    j = r.json()
+    assert j["PendingQty"] == 9 and len(calls) == 1  # acknowledged from the log only
+    assert (j["StockTakeItemId"], j["CountedQty"], j["Buffered"]) == (7, 10, True)
+    undo = client.post("/stock/10/undo-last", headers=h).json()
+    assert (undo["Removed"], undo["CountedQty"]) == (4, 6)
+
+    # A restart before the flush still has the two remaining counts, with their count ids
+    replayed = stock_buffer.CountLog(log).replay()
+    assert [c.qty for c in replayed] == [2, 3]
+    assert len({c.count_id for c in replayed}) == 2 and None not in {c.count_id for c in replayed}
+
+    r = client.get("/stock/10/items", headers=h)
+    assert r.status_code == 200
+    assert [c[0] for c in calls[1:]] == ["dbo.usp_Stock_AddCounts", "dbo.usp_Stock_ListItems"]
+    tvp = calls[1][1][1]
+    assert [line[3] for line in tvp] == [2, 3]
+    assert [line[5] for line in tvp] == [c.count_id for c in replayed]  # the DB dedupes on these
+    assert stock_buffer.CountLog(log).replay() == []
+    # The flushed batch's row replaces the old one; nothing counted twice
+    assert client.post("/stock/add?stockTakeId=10&barcodeOrSku=ABC&qty=1", headers=h).json()["CountedQty"] == 7
+
+def test_stock_write_behind_closed_take(client, fake_multi, monkeypatch, tmp_path):
+    from app import catalog, stock_buffer
+    buf = stock_buffer.CountBuffer(stock_buffer.CountLog(str(tmp_path / "counts.log")))
+    monkeypatch.setattr(stock_buffer, "_buffer", buf, raising=True)
+    monkeypatch.setattr(catalog, "lookup", lambda code, kinds: catalog.Match(1, "ABC", "Widget"), raising=True)
+    def _multi(sp, params):
+        raise RuntimeError("[42000] Stock take not In Progress or not found. (52011)")
+    fake_multi("app.stock_buffer", _multi)
+    buf.remember([{"StockTakeItemId": 7, "StockTakeId": 11, "ProductId": 1, "CountedQty": 0}])
+    h = {"X-API-Key": "test-key"}
+
+    assert client.post("/stock/add?stockTakeId=11&barcodeOrSku=ABC&qty=2", headers=h).json()["Buffered"]
+    import asyncio
+    asyncio.run(buf.flush())  # the stock take was finished elsewhere: the DB refuses the batch
+
+    r = client.get("/stock/11/rejected-counts", headers=h).json()
+    assert [(c["ProductId"], c["Qty"]) for c in r["items"]] == [(1, 2)]
+    # Further scans are refused, not acknowledged and lost
+    assert client.post("/stock/add?stockTakeId=11&barcodeOrSku=ABC", headers=h).status_code == 400
+    assert buf.stats()["rejected"] == 1 and buf.stats()["pending"] == 0
+
+def test_stock_export_csv_and_gzip(client, fake_multi):
+    import json
+    rows = [{"StockTakeItemId": i, "Sku": f"S{i}", "Name": "a,b", "Variance": i - 2} for i in range(5)]
+    seen = []
+    def _multi(sp, params):
+        seen.append((sp, params))
+        return [rows]
+    fake_multi("app.routers.stock", _multi)
+    h = {"X-API-Key": "test-key", "Accept-Encoding": "identity"}
+
+    r = client.get("/stock/10/export?format=csv&only=discrepancies", headers=h)
+    assert r.status_code == 200
+    lines = r.text.splitlines()
+    assert lines[0] == "StockTakeItemId,Sku,Name,Variance" and len(lines) == 6
+    assert lines[1] == '0,S0,"a,b",-2'
+    assert seen[0] == ("dbo.usp_Stock_ExportLines", [10, 1])
+
+    r = client.get("/stock/10/export", headers={**h, "Accept-Encoding": "gzip"})
+    assert r.headers["Content-Encoding"] == "gzip"
+    # the client decompresses transparently
+    assert [json.loads(l)["Sku"] for l in r.text.splitlines()] == [f"S{i}" for i in range(5)]
+
+def test_stock_export_releases_unstarted_stream_and_caps_exports(client, monkeypatch):
+    import asyncio
+    from starlette.requests import Request
+    from app.routers import stock
+    from tests.conftest import FakeStream
+    streams = []
+    def _stream(sp, params, *a, **k):
+        streams.append(FakeStream([[{"Sku": "S1"}]]))
+        return streams[-1]
+    monkeypatch.setattr(stock, "stream_sp", _stream, raising=True)
+    monkeypatch.setattr(stock, "_export_slots", asyncio.Semaphore(1), raising=True)
+    monkeypatch.setattr(stock, "stock_buffer", type("NoBuffer", (), {"get_buffer": staticmethod(lambda: None)}))
+
+    async def gone_before_first_chunk():
+        request = Request({"type": "http", "method": "GET", "path": "/", "headers": []})
+        response = await stock.export_lines(request, 10, format="ndjson", only="items")
+        assert stock._export_slots.locked()  # the open stream holds the only slot
+        async def receive():
+            return {"type": "http.disconnect"}
+        async def send(message):
+            raise OSError("client went away")
+        try:
+            await response({"type": "http", "asgi": {"spec_version": "2.4"}}, receive, send)
+        except Exception:
+            pass
+
+    asyncio.run(gone_before_first_chunk())
+    assert streams[0].closed and not stock._export_slots.locked()
+
+    # All slots busy: a 503 instead of another pooled connection held for a download
+    monkeypatch.setattr(stock, "_export_slots", asyncio.Semaphore(0), raising=True)
+    r = client.get("/stock/10/export", headers={"X-API-Key": "test-key"})
+    assert r.status_code == 503 and r.headers["Retry-After"] == "5"
+
+def test_stock_search_uses_index(client, fake_exec_sp, monkeypatch):
+    from app import catalog, product_search
+    index = product_search.SearchIndex()
+    index.update({1: ("WID-100", "Blue Widget"), 2: ("GAD-200", "Widget Gadget"), 3: ("BOL-300", "Bolt")})
+    index.snapshot_ident = ("test", 1)
+    monkeypatch.setattr(product_search, "_index", index, raising=True)
+    monkeypatch.setattr(catalog, "is_fresh", lambda: True, raising=True)
+    calls = []
+    def _sp(sp, params):
+        calls.append((sp, params))
+        return [{"ProductId": 2, "Sku": "GAD-200"}]
+    fake_exec_sp("app.routers.stock", _sp)
+    h = {"X-API-Key": "test-key"}
+
+    r = client.get("/stock/10/items?search=widg", headers=h)
+    assert r.status_code == 200
+    # name-prefix match (Widget Gadget) ranks above the word-prefix one (Blue Widget)
+    assert calls == [("dbo.usp_Stock_ListItemsByIds", [10, [(0, 2), (1, 1)]])]
+
+    assert client.get("/stock/10/items?search=zzz", headers=h).json() == {"items": []}
+    client.get("/stock/10/items?search=wi", headers=h)  # too short for trigrams: DB search
+    assert calls[-1] == ("dbo.usp_Stock_ListItems", [10, "wi"])